@@ -0,0 +1,176 @@
+import asyncio
+import hashlib
+import json
+from aiohttp import web
+from config import ApiConfig, ParkConfig
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from metrics import metrics
+from park_data_client import ParkDataResult
+from response_cache import ResponseCache
+from weather_client import ParkWeather
+
+
+class ApiResponse:
+    """
+    A serialized API response with its validators, built once per data version and served to every client.
+    """
+    __slots__ = ("body", "etag", "lastModified", "lastModifiedHeader")
+
+    def __init__(self, body: bytes, lastModified: float):
+        self.body: bytes = body
+        self.etag: str = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        # HTTP dates only have second precision
+        self.lastModified: int = int(lastModified)
+        self.lastModifiedHeader: str = format_datetime(datetime.fromtimestamp(self.lastModified, tz=timezone.utc), usegmt=True)
+
+
+class ApiServer:
+    """
+    ApiServer serves the same parsed park data and weather as the waits command as JSON over HTTP, for dashboards and
+    other internal services.
+      - GET /parks lists every park in `parks`, GET /parks/{key} returns one of them.
+      - Data comes from the client caches (kept warm by the poller when enabled), requests never go upstream on
+        their own, a cache miss joins the same coalesced fetch commands use.
+      - Responses are serialized once per data version and carry ETag and Last-Modified, clients polling with
+        If-None-Match or If-Modified-Since get a 304 until something changes.
+    The app's config and clients are read on every request so config reloads apply without restarting the server.
+    """
+    def __init__(self, api_config: ApiConfig, app):
+        self.config: ApiConfig = api_config
+        self.app = app
+        self.runner: web.AppRunner = None
+        # (park keys, data versions, weather versions) -> ApiResponse
+        self.responseCache: ResponseCache = ResponseCache(api_config.response_cache_size)
+
+    def build_app(self) -> web.Application:
+        webApp = web.Application()
+        webApp.router.add_get("/parks", self.handle_all_parks)
+        webApp.router.add_get("/parks/{park}", self.handle_park)
+        return webApp
+
+    async def start(self):
+        self.runner = web.AppRunner(self.build_app(), access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.config.host, self.config.port, backlog=self.config.backlog).start()
+        print(f"Serving the park API on http://{self.config.host}:{self.config.port}/parks")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle_park(self, request: web.Request) -> web.Response:
+        parkKey = request.match_info["park"]
+        park = self.app.config.parks.get(parkKey)
+        if park is None:
+            return web.json_response({"error": f"Unknown park {parkKey}"}, status=404)
+        with metrics.timer("api_request", endpoint="park"):
+            return self._respond(request, await self._get_response([(parkKey, park)], single=True))
+
+    async def handle_all_parks(self, request: web.Request) -> web.Response:
+        with metrics.timer("api_request", endpoint="parks"):
+            return self._respond(request, await self._get_response(list(self.app.config.parks.items()), single=False))
+
+    async def _get_response(self, parks: list[tuple[str, ParkConfig]], single: bool) -> ApiResponse:
+        results, weathers = await asyncio.gather(
+            asyncio.gather(*[self._get_park_result(park) for _, park in parks]),
+            asyncio.gather(*[self._get_park_weather(park) for _, park in parks])
+        )
+        cacheKey = (
+            single,
+            tuple(key for key, _ in parks),
+            tuple((result.dataVersion, result.servedStale) for result in results),
+            tuple(weather.version if weather else None for weather in weathers)
+        )
+        response = self.responseCache.get(cacheKey)
+        if response is not None:
+            metrics.inc("cache_requests_total", cache="api", result="hit")
+            return response
+
+        metrics.inc("cache_requests_total", cache="api", result="miss")
+        documents = [self.render_park(key, park, result, weather) for (key, park), result, weather in zip(parks, results, weathers)]
+        body = json.dumps(documents[0] if single else {"parks": documents}, separators=(",", ":")).encode()
+        response = ApiResponse(body, max((result.fetchedAt for result in results), default=0))
+        self.responseCache.put(cacheKey, response)
+        return response
+
+    async def _get_park_result(self, park: ParkConfig) -> ParkDataResult:
+        # Fresh processed results are a couple of dict lookups, only misses go through the fetch path
+        result = self.app.parkDataClient.cached_result(park)
+        if result is None:
+            result = await self.app.parkDataClient.fetch_park_data(park)
+        return result
+
+    async def _get_park_weather(self, park: ParkConfig) -> ParkWeather | None:
+        if not self.app.config.include_weather:
+            return None
+        return await self.app.weatherClient.get_park_weather(park)
+
+    def render_park(self, key: str, park: ParkConfig, result: ParkDataResult, weather: ParkWeather | None) -> dict:
+        """
+        Renders one park's result and weather into its JSON document.
+        """
+        snapshot = result.snapshot
+        lands = []
+        if snapshot is not None:
+            for landName, rideRange in snapshot.land_rides():
+                lands.append({
+                    "name": None if landName == self.app.config.park_client_config.default_land_key else landName,
+                    "rides": [
+                        {
+                            "id": snapshot.rideIds[index],
+                            "name": snapshot.rideNames[index],
+                            "isOpen": bool(snapshot.isOpen[index]),
+                            "waitMinutes": snapshot.waitTimes[index] if snapshot.isOpen[index] else None,
+                            "lastUpdated": snapshot.lastUpdated[index]
+                        }
+                        for index in rideRange
+                    ]
+                })
+        document = {
+            "park": key,
+            "name": park.name,
+            "country": park.country.name,
+            "flag": park.country.flag,
+            "hasData": result.hasData,
+            "timezone": result.parkTz,
+            "latestUpdate": result.latestUpdate,
+            "fetchedAt": int(result.fetchedAt),
+            "servedStale": result.servedStale,
+            "allClosed": result.allClosed,
+            "lands": lands,
+            "weather": None
+        }
+        if weather is not None:
+            document["weather"] = {
+                "temperature": weather.temperature,
+                "unit": self.app.weatherClient.current_temperature_unit,
+                "emoji": weather.emoji
+            }
+        return document
+
+    def _respond(self, request: web.Request, response: ApiResponse) -> web.Response:
+        headers = {
+            "ETag": response.etag,
+            "Last-Modified": response.lastModifiedHeader,
+            "Cache-Control": f"max-age={self.config.max_age_seconds}"
+        }
+        if self._not_modified(request, response):
+            metrics.inc("api_responses_total", status="304")
+            return web.Response(status=304, headers=headers)
+        metrics.inc("api_responses_total", status="200")
+        return web.Response(body=response.body, content_type="application/json", headers=headers)
+
+    def _not_modified(self, request: web.Request, response: ApiResponse) -> bool:
+        # If-None-Match wins over If-Modified-Since when a client sends both
+        ifNoneMatch = request.headers.get("If-None-Match")
+        if ifNoneMatch is not None:
+            return response.etag in [tag.strip() for tag in ifNoneMatch.split(",")] or ifNoneMatch.strip() == "*"
+        ifModifiedSince = request.headers.get("If-Modified-Since")
+        if ifModifiedSince is None or response.lastModified == 0:
+            return False
+        try:
+            return response.lastModified <= parsedate_to_datetime(ifModifiedSince).timestamp()
+        except (TypeError, ValueError):
+            return False
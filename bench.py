@@ -0,0 +1,352 @@
+"""
+Benchmarks for the hot paths: parsing/rendering park data, staleness checks, help rendering and end-to-end
+App.do_waits in console mode against a local stub of queue-times.com and Open-Meteo.
+
+Results are written as JSON so runs can be compared between commits:
+    python bench.py                                  # writes bench_output.txt
+    python bench.py --output new.json --compare bench_output.txt
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import flatbuffers
+import yaml
+from aiohttp import web
+from main import App
+from park_data_client import ParkDataClient
+
+# (name, lands, rides per land), from the single ride test park up to thousands of rides
+PAYLOAD_SIZES = [
+    ("tiny", 0, 1),
+    ("small", 5, 8),
+    ("medium", 20, 15),
+    ("large", 100, 20),
+    ("huge", 300, 15),
+]
+
+
+def make_queue_times_payload(lands: int, ridesPerLand: int, seed: int = 0) -> dict:
+    """
+    Generates a synthetic queue_times.json payload. lands=0 generates a park without lands, like data/queue_times/gideons.json.
+    """
+    rng = random.Random(seed)
+    now = int(time.time())
+    rideId = 0
+
+    def make_ride(name: str) -> dict:
+        nonlocal rideId
+        rideId += 1
+        isOpen = rng.random() < 0.8
+        updated = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(now - rng.randint(0, 600)))
+        return {"id": rideId, "name": name, "is_open": isOpen, "wait_time": rng.randint(0, 120) if isOpen else 0, "last_updated": updated}
+
+    if lands == 0:
+        return {"lands": [], "rides": [make_ride(f"Ride {index}") for index in range(ridesPerLand)]}
+    return {
+        "lands": [
+            {"id": land, "name": f"Land {land}", "rides": [make_ride(f"Land {land} Ride {index}") for index in range(ridesPerLand)]}
+            for land in range(lands)
+        ],
+        "rides": []
+    }
+
+
+def encode_weather_response(currentValues: list[float], hourlyValues: list[list[float]] = None, hourlyStart: int = 0) -> bytes:
+    """
+    Encodes a single location Open-Meteo flatbuffers response (length prefixed, as the API streams them).
+    Variables are written in the order they were requested, which is how ParkWeatherClient reads them.
+    """
+    builder = flatbuffers.Builder(1024)
+
+    def build_variables(values: list, hourly: bool) -> int:
+        variables = []
+        for value in values:
+            valuesVector = None
+            if hourly:
+                builder.StartVector(4, len(value), 4)
+                for item in reversed(value):
+                    builder.PrependFloat32(item)
+                valuesVector = builder.EndVector()
+            builder.StartObject(13)
+            if hourly:
+                builder.PrependUOffsetTRelativeSlot(3, valuesVector, 0)
+            else:
+                builder.PrependFloat32Slot(2, value, 0.0)
+            variables.append(builder.EndObject())
+        builder.StartVector(4, len(variables), 4)
+        for variable in reversed(variables):
+            builder.PrependUOffsetTRelative(variable)
+        return builder.EndVector()
+
+    def build_section(values: list, hourly: bool) -> int:
+        variablesVector = build_variables(values, hourly)
+        builder.StartObject(4)
+        builder.PrependInt64Slot(0, hourlyStart, 0)
+        if hourly:
+            builder.PrependInt64Slot(1, hourlyStart + 3600 * len(values[0]), 0)
+            builder.PrependInt32Slot(2, 3600, 0)
+        builder.PrependUOffsetTRelativeSlot(3, variablesVector, 0)
+        return builder.EndObject()
+
+    current = build_section(currentValues, hourly=False)
+    hourly = build_section(hourlyValues, hourly=True) if hourlyValues else None
+    builder.StartObject(15)
+    builder.PrependUOffsetTRelativeSlot(9, current, 0)
+    if hourly is not None:
+        builder.PrependUOffsetTRelativeSlot(11, hourly, 0)
+    builder.Finish(builder.EndObject())
+    body = bytes(builder.Output())
+    return len(body).to_bytes(4, "little") + body
+
+
+class StubUpstream:
+    """
+    Local HTTP server standing in for queue-times.com (/parks/<size>/queue_times.json and /parks/<size>.json)
+    and Open-Meteo (/v1/forecast).
+    """
+    def __init__(self, payloads: dict[str, dict], port: int = 0):
+        self.payloads: dict[str, bytes] = {name: json.dumps(payload).encode() for name, payload in payloads.items()}
+        self.port: int = port
+        self.runner: web.AppRunner = None
+        self.requestCount: int = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/parks/{name}/queue_times.json", self.handle_queue_times)
+        app.router.add_get("/parks/{name}.json", self.handle_park_info)
+        app.router.add_get("/v1/forecast", self.handle_forecast)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    async def handle_queue_times(self, request: web.Request) -> web.Response:
+        self.requestCount += 1
+        return web.Response(body=self.payloads[request.match_info["name"]], content_type="application/json")
+
+    async def handle_park_info(self, request: web.Request) -> web.Response:
+        self.requestCount += 1
+        return web.json_response({"id": 1, "name": request.match_info["name"], "timezone": "America/New_York"})
+
+    async def handle_forecast(self, request: web.Request) -> web.Response:
+        self.requestCount += 1
+        currentCount = len(request.query.getall("current", []))
+        hourlyCount = len(request.query.getall("hourly", []))
+        hours = int(request.query.get("forecast_hours", 12))
+        body = b""
+        for _ in request.query.getall("latitude"):
+            currentValues = [72.5] + [0.0] * (currentCount - 1)
+            hourlyValues = [[float(hour) for hour in range(hours)] for _ in range(hourlyCount)] or None
+            body += encode_weather_response(currentValues, hourlyValues, int(time.time()) // 3600 * 3600)
+        return web.Response(body=body, content_type="application/octet-stream")
+
+
+def summarize(name: str, size: str, timings: list[float]) -> dict:
+    timings = sorted(timings)
+    return {
+        "name": name,
+        "size": size,
+        "iterations": len(timings),
+        "mean_us": round(statistics.fmean(timings) * 1e6, 2),
+        "p50_us": round(timings[len(timings) // 2] * 1e6, 2),
+        "p99_us": round(timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1e6, 2),
+    }
+
+
+def iterations_for(rideCount: int, budget: int) -> int:
+    return max(20, min(2000, budget // max(rideCount, 1)))
+
+
+def bench_process_park_data(app: App, payloads: dict[str, dict], budget: int) -> list[dict]:
+    results = []
+    client = ParkDataClient(app.config.park_client_config)
+    park = next(iter(app.config.commands.values()))
+    parkData = {"timezone": "America/New_York"}
+    for size, payload in payloads.items():
+        rideCount = sum(len(land["rides"]) for land in payload["lands"]) + len(payload["rides"])
+        iterations = iterations_for(rideCount, budget)
+
+        cold = []
+        for _ in range(iterations):
+            # Forget the previous result so every iteration parses and renders from scratch
+            client.processedResults.clear()
+            start = time.perf_counter()
+            result = client.process_park_data(park, payload, parkData)
+            cold.append(time.perf_counter() - start)
+        results.append(summarize("process_park_data", size, cold))
+
+        cached = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            client.process_park_data(park, payload, parkData)
+            cached.append(time.perf_counter() - start)
+        results.append(summarize("process_park_data_cached", size, cached))
+
+        stale = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(iterations):
+                start = time.perf_counter()
+                client.is_data_stale(result)
+                stale.append(time.perf_counter() - start)
+        results.append(summarize("is_data_stale", size, stale))
+    return results
+
+
+async def bench_help(app: App, iterations: int) -> dict:
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(iterations):
+            start = time.perf_counter()
+            await app.do_help()
+            timings.append(time.perf_counter() - start)
+    return summarize("do_help", "config", timings)
+
+
+async def bench_do_waits(app: App, commands: dict[str, str], budget: int, rideCounts: dict[str, int]) -> list[dict]:
+    results = []
+    for size, command in commands.items():
+        iterations = iterations_for(rideCounts[size], budget // 10)
+        # uncached parses every payload from scratch, revalidated only expires the TTL caches so unchanged bodies
+        # are matched by hash and the previously parsed result is reused
+        for name, clearCaches, clearParsed in [
+            ("do_waits_uncached", True, True),
+            ("do_waits_revalidated", True, False),
+            ("do_waits_cached", False, False)
+        ]:
+            timings = []
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(iterations):
+                    if clearCaches:
+                        app.parkDataClient.queueTimesCache.entries.clear()
+                        app.parkDataClient.parkInfoCache.entries.clear()
+                        app.weatherClient.batchCache.entries.clear()
+                        app.responseCache.entries.clear()
+                    if clearParsed:
+                        app.parkDataClient.lastResponses.clear()
+                        app.parkDataClient.processedResults.clear()
+                    start = time.perf_counter()
+                    await app.do_waits(command)
+                    timings.append(time.perf_counter() - start)
+            results.append(summarize(name, size, timings))
+    return results
+
+
+def write_config(stub: StubUpstream, sizes: list[str], directory: str) -> str:
+    with open("config.yaml", "r", encoding="utf-8") as f:
+        configData = yaml.safe_load(f)
+    country = next(iter(configData["countries"].values()))
+    parks = {
+        size: {"name": f"Bench {size}", "url": f"{stub.base_url}/parks/{size}/queue_times.json", "lat": 28.0 + index, "lon": -81.0, "country": country}
+        for index, size in enumerate(sizes)
+    }
+    configData.update({
+        "use_discord": False,
+        "include_weather": True,
+        "parks": parks,
+        "commands": {f"!Bench{size}Waits": park for size, park in parks.items()},
+        "group_commands": {},
+    })
+    # Only the command path is measured, background subsystems stay off and anything on disk lives in the temp directory
+    for section in ("poller_config", "history_config", "alert_config", "metrics_config", "api_config", "reload_config", "sharding_config"):
+        configData[section] = {**configData.get(section, {}), "enabled": False}
+    configData["history_config"]["database_path"] = os.path.join(directory, "wait_history.sqlite")
+    configData["alert_config"]["database_path"] = os.path.join(directory, "ride_alerts.sqlite")
+    configData["sharding_config"]["shared_cache_path"] = os.path.join(directory, "shared_cache.sqlite")
+    configData["weather_config"].update({
+        "url": f"{stub.base_url}/v1/forecast",
+        "cache_session_name": os.path.join(directory, "bench_cache"),
+        "cache_session_expire": 0,
+        "retry_count": 0,
+    })
+    configPath = os.path.join(directory, "bench_config.yaml")
+    with open(configPath, "w", encoding="utf-8") as f:
+        yaml.safe_dump(configData, f)
+    return configPath
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+
+async def run_benchmarks(budget: int) -> dict:
+    payloads = {name: make_queue_times_payload(lands, rides, seed=index) for index, (name, lands, rides) in enumerate(PAYLOAD_SIZES)}
+    rideCounts = {name: max(lands, 1) * rides for name, lands, rides in PAYLOAD_SIZES}
+    stub = StubUpstream(payloads)
+    await stub.start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            app = App(write_config(stub, list(payloads), directory))
+            with contextlib.redirect_stdout(io.StringIO()):
+                app.startup()
+            try:
+                results = bench_process_park_data(app, payloads, budget)
+                results.append(await bench_help(app, 500))
+                results += await bench_do_waits(app, {size: f"!Bench{size}Waits" for size in payloads}, budget, rideCounts)
+            finally:
+                await app.parkDataClient.close()
+                for store in (app.historyStore, app.alertStore, app.sharedCache):
+                    if store is not None:
+                        store.close()
+    finally:
+        await stub.stop()
+
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(current: dict, baselinePath: str):
+    with open(baselinePath, "r", encoding="utf-8") as f:
+        baseline = {(result["name"], result["size"]): result for result in json.load(f)["results"]}
+    print(f"{'benchmark':<28}{'size':<8}{'base p50 us':>14}{'new p50 us':>14}{'change':>9}")
+    for result in current["results"]:
+        previous = baseline.get((result["name"], result["size"]))
+        if previous is None:
+            continue
+        change = (result["p50_us"] / previous["p50_us"] - 1) * 100 if previous["p50_us"] else 0
+        print(f"{result['name']:<28}{result['size']:<8}{previous['p50_us']:>14}{result['p50_us']:>14}{change:>+8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parsing, rendering and command handling")
+    parser.add_argument("--output", default="bench_output.txt", help="Where to write the JSON results")
+    parser.add_argument("--compare", default=None, help="Previous results to compare p50 timings against")
+    parser.add_argument("--budget", type=int, default=200000, help="Rough ride-iterations per benchmark, scales iteration counts")
+    args = parser.parse_args()
+
+    # Resolve config.yaml and friends relative to the repo regardless of where this is run from
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    output = asyncio.run(run_benchmarks(args.budget))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"Wrote {len(output['results'])} results for {output['commit']} to {args.output}")
+    if args.compare:
+        compare(output, args.compare)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
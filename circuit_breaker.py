@@ -0,0 +1,75 @@
+import time
+
+# Breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of making a request while an upstream's breaker is open.
+    """
+    def __init__(self, upstream: str, retry_in: float):
+        super().__init__(f"{upstream} circuit is open, retrying in {retry_in:.0f}s")
+        self.upstream: str = upstream
+        self.retryIn: float = retry_in
+
+
+class CircuitBreaker:
+    """
+    CircuitBreaker stops requests to an upstream that keeps failing, so a struggling API isn't hit with retries
+    from every command.
+      - Closed: requests go through. Failures, and calls slower than latency_budget_seconds, are counted, and
+        failure_threshold of them in a row open the breaker.
+      - Open: requests fail immediately with CircuitOpenError for reset_seconds.
+      - Half open: a single trial request is let through, success closes the breaker and failure opens it again.
+    """
+    __slots__ = ("name", "failureThreshold", "resetSeconds", "latencyBudgetSeconds", "state", "failures", "openedAt", "trialInFlight")
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float, latency_budget_seconds: float):
+        self.name: str = name
+        self.failureThreshold: int = failure_threshold
+        self.resetSeconds: float = reset_seconds
+        self.latencyBudgetSeconds: float = latency_budget_seconds
+        self.state: str = CLOSED
+        self.failures: int = 0
+        self.openedAt: float = 0.0
+        self.trialInFlight: bool = False
+
+    def before_request(self, now: float = None):
+        """
+        Raises CircuitOpenError if the request shouldn't be made, otherwise lets it through.
+        Every request let through must be followed by record_success or record_failure.
+        """
+        if now is None:
+            now = time.monotonic()
+        if self.state == OPEN:
+            retryIn = self.openedAt + self.resetSeconds - now
+            if retryIn > 0:
+                raise CircuitOpenError(self.name, retryIn)
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self.trialInFlight:
+                raise CircuitOpenError(self.name, 0)
+            self.trialInFlight = True
+
+    def record_success(self, elapsed: float, now: float = None):
+        """
+        Records a completed request, a response slower than the latency budget counts against the upstream.
+        """
+        if elapsed > self.latencyBudgetSeconds:
+            self.record_failure(now)
+            return
+        self.state = CLOSED
+        self.failures = 0
+        self.trialInFlight = False
+
+    def record_failure(self, now: float = None):
+        if now is None:
+            now = time.monotonic()
+        self.failures += 1
+        self.trialInFlight = False
+        if self.state == HALF_OPEN or self.failures >= self.failureThreshold:
+            self.state = OPEN
+            self.openedAt = now
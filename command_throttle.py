@@ -0,0 +1,108 @@
+import time
+from config import ThrottleConfig
+
+
+class TokenBucket:
+    """
+    Classic token bucket, holds up to capacity tokens and refills at rate_per_second.
+    """
+    __slots__ = ("capacity", "ratePerSecond", "tokens", "updatedAt")
+
+    def __init__(self, capacity: float, rate_per_second: float, now: float):
+        self.capacity: float = capacity
+        self.ratePerSecond: float = rate_per_second
+        self.tokens: float = capacity
+        self.updatedAt: float = now
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updatedAt) * self.ratePerSecond)
+        self.updatedAt = now
+
+    def seconds_until_available(self, now: float, tokens: float = 1) -> float:
+        """
+        Returns how long until the bucket holds at least tokens, 0 if it already does.
+        """
+        self.refill(now)
+        if self.tokens >= tokens:
+            return 0.0
+        return (tokens - self.tokens) / self.ratePerSecond
+
+    def try_take(self, now: float) -> bool:
+        self.refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class CommandThrottle:
+    """
+    CommandThrottle protects the bot from repeated and spammy commands.
+      - Identical commands in the same channel within debounce_seconds are duplicates, only the first one is answered.
+      - Each user and each guild has a token bucket, commands past the limit are dropped.
+    """
+    # Idle entries are only swept once the tables grow past this, keeps the common path free of housekeeping
+    PRUNE_THRESHOLD = 1024
+
+    def __init__(self, throttle_config: ThrottleConfig):
+        self.config: ThrottleConfig = throttle_config
+        # (channel id, command) -> when the answered request arrived
+        self.recentCommands: dict[tuple[int, str], float] = {}
+        self.userBuckets: dict[int, TokenBucket] = {}
+        self.guildBuckets: dict[int, TokenBucket] = {}
+
+    def allow(self, user_id: int, guild_id: int | None, now: float = None) -> bool:
+        """
+        Returns True if the user and guild both have a token left, taking one from each.
+        Direct messages have no guild and are only limited per user.
+        """
+        if now is None:
+            now = time.monotonic()
+        userBucket = self._bucket(self.userBuckets, user_id, self.config.user_burst, self.config.user_rate_per_minute, now)
+        if guild_id is None:
+            return userBucket.try_take(now)
+
+        guildBucket = self._bucket(self.guildBuckets, guild_id, self.config.guild_burst, self.config.guild_rate_per_minute, now)
+        guildBucket.refill(now)
+        userBucket.refill(now)
+        # Only charge either bucket if both can pay, so a limited guild doesn't also drain the user
+        if userBucket.tokens < 1 or guildBucket.tokens < 1:
+            return False
+        userBucket.tokens -= 1
+        guildBucket.tokens -= 1
+        return True
+
+    def is_duplicate(self, channel_id: int, command: str, now: float = None) -> bool:
+        """
+        Returns True if the same command was already answered in this channel within debounce_seconds,
+        otherwise records this request as the one that gets answered.
+        """
+        if now is None:
+            now = time.monotonic()
+        key = (channel_id, command)
+        answeredAt = self.recentCommands.get(key)
+        if answeredAt is not None and now - answeredAt < self.config.debounce_seconds:
+            return True
+
+        self.recentCommands[key] = now
+        if len(self.recentCommands) > self.PRUNE_THRESHOLD:
+            self.recentCommands = {key: at for key, at in self.recentCommands.items() if now - at < self.config.debounce_seconds}
+        return False
+
+    def _bucket(self, buckets: dict[int, TokenBucket], key: int, burst: int, rate_per_minute: float, now: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) > self.PRUNE_THRESHOLD:
+                self._prune_full_buckets(buckets, now)
+            bucket = buckets[key] = TokenBucket(burst, rate_per_minute / 60, now)
+        return bucket
+
+    def _prune_full_buckets(self, buckets: dict[int, TokenBucket], now: float):
+        # A full bucket behaves exactly like a new one, so it can be dropped
+        fullKeys = []
+        for key, bucket in buckets.items():
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity:
+                fullKeys.append(key)
+        for key in fullKeys:
+            del buckets[key]
@@ -17,6 +17,11 @@ class WeatherConfig(BaseModel):
     precipitation_unit: str
     unknown_emoji: str
     weather_states: Dict[int, WeatherState]
+    batch_refresh_seconds: int = 900
+    hourly_forecast_query_params: List[str] = ["temperature_2m", "precipitation_probability"]
+    forecast_hours: int = 12
+    forecast_model_update_seconds: int = 3600
+    rain_likely_percent: float = 50
 
 class CountryConfig(BaseModel):
     name: str
@@ -29,15 +34,97 @@ class ParkConfig(BaseModel):
     lon: float
     country: CountryConfig
 
+class GroupCommandConfig(BaseModel):
+    name: str
+    parks: List[ParkConfig]
+
 class ParkClientConfig(BaseModel):
     include_single_rider_lines: bool
     default_land_key: str
     single_rider_prefix: str
     stale_data_threshold_seconds: int
+    request_timeout_seconds: float = 10.0
+    connection_pool_size: int = 20
+    keepalive_timeout_seconds: float = 30.0
+    queue_times_cache_ttl_seconds: int = 300
+    replay_speed: float = 1.0
+    record_directory: str = ""
+    change_wait_threshold_minutes: int = 10
+    latency_budget_seconds: float = 2.5
+    breaker_failure_threshold: int = 5
+    breaker_reset_seconds: float = 30.0
+
+class PollerConfig(BaseModel):
+    enabled: bool = False
+    interval_seconds: int = 240
+    jitter_seconds: int = 30
+    closed_interval_seconds: int = 1800
+    resume_local_hour: int = 6
+    max_concurrent_fetches: int = 4
+
+class HistoryConfig(BaseModel):
+    enabled: bool = False
+    database_path: str = ".wait_history.sqlite"
+    raw_retention_days: int = 14
+    hourly_retention_days: int = 365
+    compact_interval_seconds: int = 3600
+
+class StatsConfig(BaseModel):
+    # Samples only come in when a park is refreshed, so stats are only useful with poller_config.enabled
+    enabled: bool = False
+    window_snapshots: int = 36
+    trend_seconds: int = 3600
+
+class MetricsConfig(BaseModel):
+    enabled: bool = False
+    host: str = "127.0.0.1"
+    port: int = 9108
+
+class ApiConfig(BaseModel):
+    enabled: bool = False
+    host: str = "127.0.0.1"
+    port: int = 9110
+    max_age_seconds: int = 30
+    response_cache_size: int = 64
+    backlog: int = 1024
+
+class AlertConfig(BaseModel):
+    # Alerts are only checked when a park is refreshed, so they also need poller_config.enabled
+    enabled: bool = False
+    database_path: str = ".ride_alerts.sqlite"
+    max_per_user: int = 10
+    expire_hours: int = 12
+
+class ThrottleConfig(BaseModel):
+    enabled: bool = False
+    debounce_seconds: float = 10.0
+    duplicate_reaction: str = "👆"
+    user_burst: int = 5
+    user_rate_per_minute: float = 6.0
+    guild_burst: int = 30
+    guild_rate_per_minute: float = 60.0
+
+class ReloadConfig(BaseModel):
+    enabled: bool = False
+    poll_seconds: float = 2.0
+
+class ShardingConfig(BaseModel):
+    enabled: bool = False
+    shard_count: int = 0
+    processes: int = 1
+    shared_cache_path: str = ".shared_cache.sqlite"
+    shared_cache_lease_seconds: float = 15.0
 
 class DiscordClientConfig(BaseModel):
     token_filename: str
     embed_color: str
+    max_description_chars: int = 4096
+    channel_burst: int = 5
+    channel_rate_per_second: float = 1.0
+    global_burst: int = 50
+    global_rate_per_second: float = 45.0
+    background_reserve_tokens: int = 10
+    worker_idle_seconds: float = 60.0
 
     def get_embed_color(self) -> int:
         return int(self.embed_color, 16)
@@ -47,16 +134,51 @@ class AppConfig(BaseModel):
     countries: Dict[str, CountryConfig]
     parks: Dict[str, ParkConfig]
     commands: Dict[str, ParkConfig]
+    group_commands: Dict[str, GroupCommandConfig] = {}
+    group_fetch_concurrency: int = 4
+    group_deadline_seconds: float = 8.0
+    group_partial_message: str = "Still loading, try again shortly"
+    group_stale_message: str = "Rides haven't updated in over an hour, this park might be closed"
     weather_config: WeatherConfig
     park_client_config: ParkClientConfig
+    poller_config: PollerConfig = PollerConfig()
+    history_config: HistoryConfig = HistoryConfig()
+    stats_config: StatsConfig = StatsConfig()
+    metrics_config: MetricsConfig = MetricsConfig()
+    api_config: ApiConfig = ApiConfig()
+    alert_config: AlertConfig = AlertConfig()
+    throttle_config: ThrottleConfig = ThrottleConfig()
+    reload_config: ReloadConfig = ReloadConfig()
+    sharding_config: ShardingConfig = ShardingConfig()
     discord_client_config: DiscordClientConfig
     include_weather: bool
+    response_cache_size: int = 256
     error_color: str
     wait_response_title_suffix: str
     wait_response_error_description: str
     help_response_title: str
     help_command: str
+    waits_command_suffix: str = "Waits"
+    stats_command_suffix: str = "Stats"
+    stats_response_title_suffix: str = "Wait Stats"
+    changes_command_suffix: str = "Changes"
+    changes_response_title_suffix: str = "Changes"
+    no_changes_message: str = "No rides opened, closed or had big wait changes in the last update"
+    forecast_command_suffix: str = "Forecast"
+    forecast_response_title_suffix: str = "Forecast"
+    alert_command_suffix: str = "Alert"
+    alert_list_command: str = "!MyAlerts"
+    alert_cancel_command: str = "!CancelAlert"
+    alert_response_title: str = "Ride Alerts"
+    ride_search_command: str = "!Ride"
+    ride_search_response_title: str = "Ride Search"
+    ride_search_max_results: int = 5
+    no_ride_match_message: str = "No rides found matching that name"
     stale_data_message: str
+    served_stale_message: str = "queue-times.com is slow to respond, showing rides from {age} ago"
     all_closed_message: str
     current_weather_header: str
     weather_data_unavailable_message: str
+
+    def get_error_color(self) -> int:
+        return int(self.error_color, 16)
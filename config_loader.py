@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import os
+import yaml
+import config as config_module
+from config import AppConfig, ParkConfig
+from pydantic import ValidationError
+from typing import Awaitable, Callable
+
+# libyaml's loader is several times faster, fall back to the pure Python one if PyYAML was built without it
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def share_park_configs(appConfig: AppConfig, previous: AppConfig = None) -> AppConfig:
+    """
+    Makes every equal ParkConfig in the config the same object, as YAML anchors do. Caches check parks by identity,
+    so this keeps them shared between parks, commands and group commands. If a previous config is given its parks
+    are reused for unchanged parks, so results cached against them stay valid across a reload.
+    """
+    shared: dict[str, ParkConfig] = {}
+
+    def share(park: ParkConfig) -> ParkConfig:
+        return shared.setdefault(park.model_dump_json(), park)
+
+    if previous is not None:
+        for park in _all_parks(previous):
+            share(park)
+    for key, park in appConfig.parks.items():
+        appConfig.parks[key] = share(park)
+    for key, park in appConfig.commands.items():
+        appConfig.commands[key] = share(park)
+    for group in appConfig.group_commands.values():
+        group.parks = [share(park) for park in group.parks]
+    return appConfig
+
+
+def _all_parks(appConfig: AppConfig) -> list[ParkConfig]:
+    parks = list(appConfig.parks.values()) + list(appConfig.commands.values())
+    for group in appConfig.group_commands.values():
+        parks.extend(group.parks)
+    return parks
+
+
+class ConfigLoader:
+    """
+    ConfigLoader loads the YAML config into an AppConfig.
+    The validated config is also written to a compiled cache next to the YAML file, keyed by a hash of the YAML and
+    config.py, so a restart with an unchanged config skips YAML parsing and only runs pydantic's JSON validation.
+    """
+    def __init__(self, config_path: str, cache_path: str = None):
+        self.configPath: str = config_path
+        if cache_path is None:
+            directory, fileName = os.path.split(config_path)
+            cache_path = os.path.join(directory, f".{fileName}.cache.json")
+        self.cachePath: str = cache_path
+        # Hash of the last loaded content, and the (mtime ns, size) it was read at
+        self.contentHash: str = None
+        self.fileStat: tuple[int, int] = None
+
+    def load(self) -> AppConfig:
+        """
+        Loads the config, from the compiled cache when it matches the YAML file.
+        """
+        try:
+            stat = os.stat(self.configPath)
+            with open(self.configPath, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            print("Config file not found.")
+            raise
+
+        contentHash = self._content_hash(raw)
+        appConfig = self._load_compiled(contentHash)
+        if appConfig is None:
+            appConfig = self.parse_yaml(raw)
+            self._store_compiled(contentHash, appConfig)
+        self.contentHash = contentHash
+        self.fileStat = (stat.st_mtime_ns, stat.st_size)
+        return share_park_configs(appConfig)
+
+    def load_if_changed(self) -> AppConfig | None:
+        """
+        Returns the newly loaded config if the file content changed since the last load, otherwise None.
+        Only stats the file unless its mtime or size moved.
+        """
+        stat = os.stat(self.configPath)
+        if (stat.st_mtime_ns, stat.st_size) == self.fileStat:
+            return None
+        previousHash = self.contentHash
+        # Remember the stat before loading so a broken edit is only reported once, not on every poll
+        self.fileStat = (stat.st_mtime_ns, stat.st_size)
+        appConfig = self.load()
+        if self.contentHash == previousHash:
+            # Touched or rewritten with the same content
+            return None
+        return appConfig
+
+    def parse_yaml(self, raw: bytes) -> AppConfig:
+        """
+        Parses and validates the YAML config.
+        """
+        try:
+            config_data = yaml.load(raw, Loader=YamlLoader)
+        except yaml.YAMLError as e:
+            print("Error parsing YAML:", e)
+            raise
+        if not config_data:
+            raise ValueError("Config data is empty or could not be loaded")
+        # Convert weather_emojis keys to int, this is how we want to look them up, but YAML doesn't support numeric key types
+        if "weather_config" in config_data and "weather_states" in config_data["weather_config"]:
+            config_data["weather_config"]["weather_states"] = {int(k): v for k, v in config_data["weather_config"]["weather_states"].items()}
+        return AppConfig(**config_data)
+
+    def _content_hash(self, raw: bytes) -> str:
+        # config.py is part of the key so a model change never loads a cache compiled against the old models
+        with open(config_module.__file__, "rb") as f:
+            return hashlib.sha256(raw + b"\0" + f.read()).hexdigest()
+
+    def _load_compiled(self, contentHash: str) -> AppConfig | None:
+        try:
+            with open(self.cachePath, "rb") as f:
+                cachedHash = f.readline().strip().decode("ascii")
+                if cachedHash != contentHash:
+                    return None
+                return AppConfig.model_validate_json(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, UnicodeDecodeError, ValidationError) as e:
+            print(f"Ignoring unreadable compiled config cache: {e}")
+            return None
+
+    def _store_compiled(self, contentHash: str, appConfig: AppConfig):
+        # Write then rename so a concurrently starting process never reads half a cache
+        tmpPath = f"{self.cachePath}.{os.getpid()}.tmp"
+        try:
+            with open(tmpPath, "wb") as f:
+                f.write(contentHash.encode("ascii") + b"\n")
+                f.write(appConfig.model_dump_json().encode("utf-8"))
+            os.replace(tmpPath, self.cachePath)
+        except OSError as e:
+            print(f"Error writing compiled config cache: {e}")
+
+
+class ConfigWatcher:
+    """
+    ConfigWatcher polls the config file and hands every successfully loaded change to on_reload.
+    Invalid configs are reported and skipped, so a bad edit never takes the running bot down.
+    """
+    def __init__(self, loader: ConfigLoader, poll_seconds: float, on_reload: Callable[[AppConfig], Awaitable[None]]):
+        self.loader: ConfigLoader = loader
+        self.pollSeconds: float = poll_seconds
+        self.onReload: Callable[[AppConfig], Awaitable[None]] = on_reload
+        self.task: asyncio.Task = None
+
+    def start(self):
+        """
+        Starts watching, must be called from inside the running event loop.
+        """
+        if self.task is None:
+            self.task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def check_once(self) -> bool:
+        """
+        Reloads the config if it changed, returns True if a new config was applied.
+        """
+        try:
+            appConfig = await asyncio.to_thread(self.loader.load_if_changed)
+        except (OSError, ValueError, yaml.YAMLError) as e:
+            # ValidationError is a ValueError
+            print(f"Config reload failed, keeping the current config: {e}")
+            return False
+        if appConfig is None:
+            return False
+        try:
+            await self.onReload(appConfig)
+        except Exception as e:
+            # Keep watching, the next change to the file gets another try
+            print(f"Config reload failed while applying it: {e}")
+            return False
+        return True
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.pollSeconds)
+            await self.check_once()
@@ -1,6 +1,7 @@
 import discord
 
 from config import DiscordClientConfig
+from outbound_queue import BACKGROUND, INTERACTIVE, OutboundQueue, build_embeds
 
 
 class DiscordClient:
@@ -12,17 +13,23 @@ class DiscordClient:
         self.token: str = ""
         self.client: discord.Client = None
         self.embedColor: int = self.config.get_embed_color()
+        self.outboundQueue: OutboundQueue = OutboundQueue(discord_config)
 
-    def configure(self) -> bool:
+    def configure(self, sharded: bool = False, shard_ids: list[int] = None, shard_count: int = None) -> bool:
         """
         Configures the Discord client by loading the token and setting up intents.
+        Sharded clients run the given shards (all of them if shard_ids is None) out of shard_count, which
+        discord.py asks Discord for if it is None.
         """
         if not self.load_token():
             print("Failed to load the discord token, bailing out...")
             return False
         intents = discord.Intents.default()
         intents.message_content = True
-        self.client = discord.Client(intents=intents)
+        if sharded:
+            self.client = discord.AutoShardedClient(intents=intents, shard_ids=shard_ids, shard_count=shard_count)
+        else:
+            self.client = discord.Client(intents=intents)
         return True
 
     def load_token(self) -> bool:
@@ -39,6 +46,21 @@ class DiscordClient:
         self.token = token
         return True
     
+    def add_close_hook(self, hook):
+        """
+        Awaits hook after the Discord client closes, inside its event loop, so clients tied to that loop
+        (e.g. pooled HTTP sessions) can be closed before discord.py tears the loop down.
+        """
+        clientClose = self.client.close
+
+        async def close():
+            try:
+                await clientClose()
+            finally:
+                await hook()
+
+        self.client.close = close
+
     def run(self):
         """
         Starts the Discord client.
@@ -51,13 +73,16 @@ class DiscordClient:
     
     async def send_discord_embed(self, title: str, description: str, message: discord.Message, color: int = None):
         """
-        Sends a rich embed message to a Discord channel.
+        Replies with a rich embed in the channel the command came from, ahead of any queued background posts.
+        Descriptions over max_description_chars are split across several embeds.
+        """
+        await self.post_channel_embed(message.channel, title, description, color, INTERACTIVE)
+
+    async def post_channel_embed(self, channel: discord.abc.Messageable, title: str, description: str, color: int = None, priority: int = BACKGROUND):
+        """
+        Sends a rich embed to a channel through the rate limited outbound queue, background priority by default.
         """
         if color is None:
             color = self.embedColor
-        embed = discord.Embed(
-            title=title,
-            description=description,
-            color=color
-        )
-        await message.channel.send(embed=embed)
\ No newline at end of file
+        embeds = build_embeds(title, description, color, self.config.max_description_chars)
+        await self.outboundQueue.send(channel, embeds, priority)
@@ -0,0 +1,179 @@
+import json
+import mmap
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_right
+
+
+class SnapshotArchive:
+    """
+    SnapshotArchive replays a recorded archive of park data.
+    Archives are text files with one "<recorded epoch>\t<json>" line per snapshot, where the json holds the
+    "queue_times" and "park" payloads. The file is memory-mapped and only the line being served is decoded,
+    so large recordings stay cheap. Playback runs replay_speed times faster than real time from the first read,
+    and stays on the last snapshot once the recording runs out.
+    """
+    def __init__(self, path: str, replay_speed: float = 1.0):
+        self.path: str = path
+        self.replaySpeed: float = replay_speed
+        self.timestamps: array = array("q")
+        self.offsets: array = array("q")
+        self.size: int = -1
+        self.mapped: mmap.mmap = None
+        self.replayStartedAt: float = None
+        self.currentIndex: int = -1
+        self.currentRecord: dict = None
+        self._reload_if_changed()
+
+    @staticmethod
+    def append(path: str, queueTimesData: dict, parkData: dict, recordedAt: int = None):
+        """
+        Appends a snapshot to an archive, creating it if needed.
+        """
+        if recordedAt is None:
+            recordedAt = int(time.time())
+        line = json.dumps({"queue_times": queueTimesData, "park": parkData}, separators=(",", ":"))
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(f"{recordedAt}\t{line}\n")
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def current(self) -> dict:
+        """
+        Returns the record for the current replay time, the same object is returned until playback moves on.
+        """
+        self._reload_if_changed()
+        if len(self.timestamps) == 0:
+            return {}
+        if self.replayStartedAt is None:
+            self.replayStartedAt = time.monotonic()
+
+        replayTime = self.timestamps[0] + (time.monotonic() - self.replayStartedAt) * self.replaySpeed
+        index = max(0, bisect_right(self.timestamps, replayTime) - 1)
+        if index != self.currentIndex:
+            self.currentRecord = self.record_at(index)
+            self.currentIndex = index
+        return self.currentRecord
+
+    def record_at(self, index: int) -> dict:
+        """
+        Decodes the record at index straight out of the mapped file.
+        """
+        start = self.offsets[index]
+        end = self.mapped.find(b"\n", start)
+        if end == -1:
+            end = self.size
+        payloadStart = self.mapped.find(b"\t", start, end) + 1
+        return json.loads(self.mapped[payloadStart:end])
+
+    def close(self):
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+
+    def _reload_if_changed(self):
+        size = os.stat(self.path).st_size
+        if size == self.size:
+            return
+        # Archives are append-only, so only lines past the previously indexed size need scanning
+        indexedUpTo = self.size if self.size > 0 and self.mapped is not None else 0
+        if size < indexedUpTo:
+            # The file was replaced, start over
+            indexedUpTo = 0
+            self.timestamps = array("q")
+            self.offsets = array("q")
+            self.currentIndex = -1
+        self.close()
+        self.size = size
+        if size == 0:
+            return
+        with open(self.path, "rb") as f:
+            self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        position = indexedUpTo
+        while position < size:
+            tab = self.mapped.find(b"\t", position)
+            end = self.mapped.find(b"\n", position)
+            if end == -1:
+                # Partially written last line, pick it up on the next reload
+                self.size = position
+                break
+            if tab != -1 and tab < end:
+                self.timestamps.append(int(self.mapped[position:tab]))
+                self.offsets.append(position)
+            position = end + 1
+
+
+class LocalDataSource:
+    """
+    LocalDataSource serves park data from disk for file:// park URLs, which is useful for test parks and for
+    replaying recordings for load testing without any network.
+      - file://path/queue_times/park.json: a queue times document, park info is read from path/park.json
+        (the same "/queue_times" rule used for queue-times.com URLs). Relative paths are relative to base_directory
+        (the config file's directory), file:///absolute/path works too.
+      - file://path/dir: a directory holding queue_times.json and park.json.
+      - file://path/park.jsonl: a SnapshotArchive, replayed at replay_speed.
+    JSON files are only re-parsed when their mtime or size changes, otherwise the previously parsed object is
+    returned so downstream processing can be skipped too.
+    Reads block on disk, async callers should run them in a worker thread, they are serialized by a lock.
+    """
+    def __init__(self, replay_speed: float = 1.0, base_directory: str = ""):
+        self.replaySpeed: float = replay_speed
+        self.baseDirectory: str = base_directory
+        self.lock = threading.Lock()
+        # path -> (mtime ns, size, parsed document)
+        self.files: dict[str, tuple[int, int, dict]] = {}
+        self.archives: dict[str, SnapshotArchive] = {}
+
+    @staticmethod
+    def handles(url: str) -> bool:
+        return url.startswith("file://")
+
+    def read_queue_times(self, url: str) -> dict:
+        path = self._path(url)
+        with self.lock:
+            if os.path.isdir(path):
+                return self._read_json(os.path.join(path, "queue_times.json"))
+            if path.endswith(".jsonl"):
+                return self._archive(path).current().get("queue_times", {})
+            return self._read_json(path)
+
+    def read_park_info(self, url: str) -> dict:
+        path = self._path(url)
+        with self.lock:
+            if os.path.isdir(path):
+                return self._read_json(os.path.join(path, "park.json"))
+            if path.endswith(".jsonl"):
+                return self._archive(path).current().get("park", {})
+            return self._read_json(path.replace("/queue_times", ""))
+
+    def close(self):
+        with self.lock:
+            for archive in self.archives.values():
+                archive.close()
+            self.archives = {}
+
+    def _path(self, url: str) -> str:
+        path = url[len("file://"):]
+        if not os.path.isabs(path):
+            path = os.path.join(self.baseDirectory, path)
+        return path
+
+    def _archive(self, path: str) -> SnapshotArchive:
+        archive = self.archives.get(path)
+        if archive is None:
+            archive = self.archives[path] = SnapshotArchive(path, self.replaySpeed)
+        return archive
+
+    def _read_json(self, path: str) -> dict:
+        stat = os.stat(path)
+        cached = self.files.get(path)
+        if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        with open(path, "r", encoding="utf-8") as f:
+            document = json.load(f)
+        self.files[path] = (stat.st_mtime_ns, stat.st_size, document)
+        return document
@@ -1,52 +1,172 @@
 import asyncio
 import discord
+import math
+import os
 import sys
-import yaml
+import time
 
+from api_server import ApiServer
 from pytz import timezone
-from datetime import datetime
-from config import AppConfig
+from datetime import datetime, timezone as dt_timezone
+from command_throttle import CommandThrottle
+from config import AppConfig, GroupCommandConfig, ParkConfig
+from config_loader import ConfigLoader, ConfigWatcher, share_park_configs
 from discord_client import DiscordClient
-from park_data_client import ParkDataClient
-from weather_client import ParkWeatherClient
+from park_data_client import ParkDataClient, ParkDataResult
+from park_snapshot import ParkSnapshot
+from metrics import MetricsServer, metrics
+from park_poller import ParkDataPoller
+from response_cache import ResponseCache
+from ride_alerts import RideAlert, RideAlertStore
+from ride_search import RideSearchIndex, normalize, trigrams
+from shard_launcher import ShardAssignment, run_shard_processes
+from shared_cache import SharedCacheStore
+from wait_history import WaitHistoryStore
+from wait_stats import WaitStatsTracker
+from weather_client import ParkForecast, ParkWeather, ParkWeatherClient
 
 
 class App:
 
     def __init__(self, config_path: str = "config.yaml"):
         self.configPath: str = config_path
+        self.configLoader: ConfigLoader = ConfigLoader(config_path)
+        self.configWatcher: ConfigWatcher = None
         self.config: AppConfig = None
         self.discordClient: DiscordClient = None
         self.weatherClient: ParkWeatherClient = None
         self.parkDataClient: ParkDataClient = None
+        self.parkDataPoller: ParkDataPoller = None
+        self.historyStore: WaitHistoryStore = None
+        self.statsTracker: WaitStatsTracker = None
+        self.responseCache: ResponseCache = None
+        self.metricsServer: MetricsServer = None
+        self.apiServer: ApiServer = None
+        self.commandThrottle: CommandThrottle = None
+        self.alertStore: RideAlertStore = None
+        self.rideSearch: RideSearchIndex = None
+        # Keeps fire-and-forget tasks referenced until they finish
+        self.backgroundTasks: set[asyncio.Task] = set()
+        self.sharedCache: SharedCacheStore = None
+        # Set when running as one of several shard processes
+        self.shardAssignment: ShardAssignment = None
 
-    def startup(self):
+    def startup(self, shard_assignment: ShardAssignment = None):
         """
         Starts up the application by initializing clients and loading configuration.
+        When sharding over several processes, the first call only launches the shard processes, which each call
+        this again with their shard assignment.
         """
 
         # Load configuration (park data, commands, URLs, etc.)
         # Should always be done prior to anything else, as lots of stuff depends on config
         self.config = self._load_yaml_config()
-        
-        self.weatherClient = ParkWeatherClient(self.config.weather_config)
-        self.parkDataClient = ParkDataClient(self.config.park_client_config)
+        shardingConfig = self.config.sharding_config
+        if shardingConfig.enabled and shardingConfig.processes > 1 and shard_assignment is None:
+            run_shard_processes(self.configPath, self.config)
+            return
+        self.shardAssignment = shard_assignment
+        # Work that must happen once per machine (upstream polling, history) only runs in the first shard process
+        isPrimary = shard_assignment is None or shard_assignment.isPrimary
+        if shardingConfig.enabled:
+            self.sharedCache = SharedCacheStore(shardingConfig.shared_cache_path, shardingConfig.shared_cache_lease_seconds)
+
+        self.weatherClient = ParkWeatherClient(self.config.weather_config, self.sharedCache)
+        self.weatherClient.set_batch_parks(self.config.parks.values())
+        self.parkDataClient = ParkDataClient(self.config.park_client_config, self.sharedCache, os.path.dirname(os.path.abspath(self.configPath)))
+        self.responseCache = ResponseCache(self.config.response_cache_size)
+        if self.config.history_config.enabled and isPrimary:
+            self.historyStore = WaitHistoryStore(self.config.history_config)
+            self.parkDataClient.add_snapshot_listener(self.historyStore.append_snapshot)
+        if self.config.stats_config.enabled:
+            self.statsTracker = WaitStatsTracker(self.config.stats_config)
+            self.parkDataClient.add_snapshot_listener(self.statsTracker.add_snapshot)
+        self.rideSearch = RideSearchIndex(self.config.park_client_config.default_land_key)
+        self.parkDataClient.add_snapshot_listener(self.rideSearch.add_snapshot)
+        if self.config.throttle_config.enabled:
+            self.commandThrottle = CommandThrottle(self.config.throttle_config)
+        if self.config.alert_config.enabled and not self.config.poller_config.enabled:
+            # Without the poller a quiet park is never refreshed, its alerts would never be checked
+            print("Ride alerts need poller_config.enabled, leaving them off")
+        elif self.config.alert_config.enabled:
+            self.alertStore = RideAlertStore(self.config.alert_config)
+            # Every process takes subscriptions, only the primary one checks them so alerts aren't sent twice
+            if isPrimary:
+                self.parkDataClient.add_snapshot_listener(self._check_alerts)
+        if self.config.metrics_config.enabled:
+            metricsConfig = self.config.metrics_config
+            if shard_assignment is not None:
+                metricsConfig = metricsConfig.model_copy(update={"port": metricsConfig.port + shard_assignment.processIndex})
+            self.metricsServer = MetricsServer(metricsConfig)
+        if self.config.api_config.enabled:
+            apiConfig = self.config.api_config
+            if shard_assignment is not None:
+                apiConfig = apiConfig.model_copy(update={"port": apiConfig.port + shard_assignment.processIndex})
+            self.apiServer = ApiServer(apiConfig, self)
+        if self.config.reload_config.enabled:
+            self.configWatcher = ConfigWatcher(self.configLoader, self.config.reload_config.poll_seconds, self.reload_config)
+        if self.config.poller_config.enabled:
+            self.parkDataPoller = ParkDataPoller(
+                self.config.poller_config,
+                self.parkDataClient,
+                self.config.parks,
+                follower=not isPrimary
+            )
 
         # Discord startup
         if self.config.use_discord:
             self.discordClient = DiscordClient(self.config.discord_client_config)
-            if not self.discordClient.configure():
+            if shard_assignment is not None:
+                configured = self.discordClient.configure(True, list(shard_assignment.shardIds), shard_assignment.shardCount)
+            else:
+                configured = self.discordClient.configure(shardingConfig.enabled, None, shardingConfig.shard_count or None)
+            if not configured:
                 print("Failed to configure Discord client but use_discord is enabled, bailing out...")
                 return
             
             # Binding discord events
+            self.discordClient.client.event(self.setup_hook)
             self.discordClient.client.event(self.on_ready)
             self.discordClient.client.event(self.on_message)
+            self.discordClient.add_close_hook(self.shutdown)
             self.discordClient.run()
+        elif self.apiServer:
+            asyncio.run(self.serve_without_discord())
+
+    async def serve_without_discord(self):
+        """
+        Runs background work and the API server until interrupted, for deployments that only serve the API.
+        """
+        await self.setup_hook()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.shutdown()
+
+    async def shutdown(self):
+        """
+        Stops the API server and closes the park data client's pooled session, safe to call more than once.
+        """
+        if self.apiServer:
+            await self.apiServer.stop()
+        await self.parkDataClient.close()
         
 
     ## Discord Event Handlers -- it'd be nice to not have these in the main app, but for now it's the easiest way to communicate between the client and app
 
+    async def setup_hook(self):
+        """
+        Called once by discord.py inside the event loop before connecting, starts background work.
+        """
+        if self.parkDataPoller:
+            self.parkDataPoller.start()
+        if self.metricsServer:
+            await self.metricsServer.start()
+        if self.apiServer:
+            await self.apiServer.start()
+        if self.configWatcher:
+            self.configWatcher.start()
+
     async def on_ready(self):
         """
         Called when the Discord bot is ready.
@@ -61,15 +181,64 @@ class App:
         if message.author == self.discordClient.client.user:
             return
 
-        if message.content.startswith(self.config.help_command):
-            await self.do_help()
-        else:
-            if message.content in self.config.commands:
-                await self.do_waits(message.content, message)
+        handler = self._command_handler(message.content)
+        if handler is None:
+            return
+
+        if self.commandThrottle:
+            if not self.commandThrottle.allow(message.author.id, message.guild.id if message.guild else None):
+                metrics.inc("commands_throttled_total")
+                return
+            # Alert commands answer for their author only, so they're only duplicates when the same user repeats them
+            duplicateKey = f"{message.author.id}:{message.content}" if self._is_alert_command(message.content) else message.content
+            if self.commandThrottle.is_duplicate(message.channel.id, duplicateKey):
+                metrics.inc("commands_coalesced_total")
+                await self._react_duplicate(message)
+                return
+
+        await handler(message)
+
+    def _command_handler(self, content: str):
+        """
+        Returns the handler for a command message, or None if the message isn't a command.
+        """
+        if content.startswith(self.config.help_command):
+            return self.do_help
+        if content in self.config.commands:
+            return lambda message: self.do_waits(content, message)
+        if content in self.config.group_commands:
+            return lambda message: self.do_group_waits(content, message)
+        if self.statsTracker and self._park_for_command(content, self.config.stats_command_suffix):
+            return lambda message: self.do_stats(content, message)
+        if self._park_for_command(content, self.config.forecast_command_suffix):
+            return lambda message: self.do_forecast(content, message)
+        if self._park_for_command(content, self.config.changes_command_suffix):
+            return lambda message: self.do_changes(content, message)
+        if self.alertStore and self._is_alert_command(content):
+            return lambda message: self.do_alert_command(content, message)
+        if self.rideSearch and content.split(" ", 1)[0] == self.config.ride_search_command:
+            return lambda message: self.do_ride_search(content, message)
+        return None
+
+    def _is_alert_command(self, content: str) -> bool:
+        command = content.split(" ", 1)[0]
+        return (
+            command in (self.config.alert_list_command, self.config.alert_cancel_command)
+            or self._park_for_command(command, self.config.alert_command_suffix) is not None
+        )
+
+    async def _react_duplicate(self, message: discord.Message):
+        """
+        Acknowledges a duplicate command with a reaction, pointing at the answer already posted above.
+        """
+        try:
+            await message.add_reaction(self.config.throttle_config.duplicate_reaction)
+        except discord.DiscordException as e:
+            print(f"Failed to react to duplicate command: {e}")
 
     ## Command Handlers
 
-    async def do_response(self, title: str, description: str, message: discord.Message, color: int = None):
+    async def do_response(self, title: str, description: str, message: discord.Message = None, color: int = None):
         """
         Sends a response message, either through Discord or the console.
         """
@@ -78,7 +247,7 @@ class App:
         else:
             print(f"{title}\n{description}")
 
-    async def do_help(self):
+    async def do_help(self, message: discord.Message = None):
         """
         Sends a help message listing all available park wait commands.
         """
@@ -88,10 +257,23 @@ class App:
             # "**Epcot :flag_us::** !EpcotWaits"
             lines.append(f"""**{park.name} {park.country.flag}:** {command_name}""")
 
+        for command_name, group in self.config.group_commands.items():
+            lines.append(f"""**{group.name}:** {command_name}""")
+
+        lines.append(f"\nSwap *{self.config.waits_command_suffix}* for *{self.config.changes_command_suffix}* to see only what changed in the last update")
+        lines.append(f"Swap *{self.config.waits_command_suffix}* for *{self.config.forecast_command_suffix}* to get the next {self.config.weather_config.forecast_hours} hours of weather")
+        if self.statsTracker:
+            lines.append(f"Swap *{self.config.waits_command_suffix}* for *{self.config.stats_command_suffix}* to get rolling wait stats for a park")
+        lines.append(f"Find a ride in any park with {self.config.ride_search_command} <ride name>")
+        if self.alertStore:
+            lines.append(f"Swap *{self.config.waits_command_suffix}* for *{self.config.alert_command_suffix} <minutes> <ride>* to get a DM when a ride is open with a short wait, "
+                         f"see yours with {self.config.alert_list_command}")
+
         description_text = "\n".join(lines)
         await self.do_response(
             title=self.config.help_response_title,
-            description=description_text
+            description=description_text,
+            message=message
         )
 
     async def do_waits(self, command: str, message: discord.Message = None):
@@ -99,45 +281,393 @@ class App:
         Handles a wait check command for a specific park.
         """
         park = self.config.commands[command]
-        await self.parkDataClient.fetch_park_data(park)
-        self.parkDataClient.process_park_data()
+        with metrics.timer("do_waits", park=park.name):
+            weather = None
+            if self.config.include_weather:
+                result, weather = await asyncio.gather(
+                    metrics.timed("park_data", self.parkDataClient.fetch_park_data(park), park=park.name),
+                    metrics.timed("weather", self.weatherClient.get_park_weather(park), park=park.name)
+                )
+            else:
+                result = await metrics.timed("park_data", self.parkDataClient.fetch_park_data(park), park=park.name)
+
+            # Something went wrong while getting or processing the data, all we can do is let the client know an error occurred.
+            if not result.hasData:
+                await self.do_response(
+                    title=self.config.help_response_title,
+                    description=self.config.wait_response_error_description,
+                    message=message,
+                    color=self.config.get_error_color()
+                )
+                return
+
+            # The description only changes with new park or weather data, or when the displayed local time ticks over
+            cacheKey = (command, result.dataVersion, result.servedStale, weather.version if weather else None, int(time.time() // 60))
+            descriptionText = self.responseCache.get(cacheKey)
+            if descriptionText is None:
+                metrics.inc("cache_requests_total", cache="response", result="miss")
+                with metrics.timer("render", park=park.name):
+                    descriptionText = self._render_waits_description(result, weather)
+                self.responseCache.put(cacheKey, descriptionText)
+            else:
+                metrics.inc("cache_requests_total", cache="response", result="hit")
 
-        # Something went wrong while getting or processing the data, all we can do is let the client know an error occurred.
-        if not self.parkDataClient.hasData:
+            with metrics.timer("send", park=park.name):
+                await self.do_response(
+                    title=f"Data for {park.name}",
+                    description=descriptionText,
+                    message=message
+                )
+
+    async def do_group_waits(self, command: str, message: discord.Message = None):
+        """
+        Handles a group command, fetching every park in the group concurrently and replying with one condensed line per park.
+        Parks that aren't ready by group_deadline_seconds are marked as partial, their fetches keep running in the
+        background so the cache is warm for the next request.
+        """
+        group: GroupCommandConfig = self.config.group_commands[command]
+        semaphore = asyncio.Semaphore(self.config.group_fetch_concurrency)
+
+        async def fetch(park: ParkConfig):
+            async with semaphore:
+                return await self.parkDataClient.fetch_park_data(park)
+
+        tasks = [asyncio.ensure_future(fetch(park)) for park in group.parks]
+        if tasks:
+            await asyncio.wait(tasks, timeout=self.config.group_deadline_seconds)
+        self._keep_running(tasks)
+
+        messageLines = []
+        for park, task in zip(group.parks, tasks):
+            if not task.done():
+                status = f"*{self.config.group_partial_message}*"
+            elif task.exception() is not None:
+                print(f"Error fetching {park.name} for {command}: {task.exception()}")
+                status = self.config.wait_response_error_description
+            elif not task.result().hasData:
+                status = self.config.wait_response_error_description
+            elif self.parkDataClient.is_data_stale(task.result()):
+                status = self.config.group_stale_message
+            else:
+                status = self.parkDataClient.render_condensed_line(task.result())
+            if task.done() and task.exception() is None and task.result().servedStale:
+                status += f"\n*{self._served_stale_notice(task.result())}*"
+            messageLines.append(f"**{park.name} {park.country.flag}**\n{status}\n")
+        messageLines.append("*Data from queue-times.com*")
+
+        await self.do_response(
+            title=f"{group.name} {self.config.wait_response_title_suffix}",
+            description="\n".join(messageLines),
+            message=message
+        )
+
+    async def do_stats(self, command: str, message: discord.Message = None):
+        """
+        Handles a wait stats command for a specific park, showing live waits next to rolling mean, median, p90 and
+        the trend versus trend_seconds ago.
+        """
+        park = self._park_for_command(command, self.config.stats_command_suffix)
+        result = await self.parkDataClient.fetch_park_data(park)
+        summary = self.statsTracker.get_summary(park)
+        if not result.hasData or summary is None:
             await self.do_response(
                 title=self.config.help_response_title,
                 description=self.config.wait_response_error_description,
                 message=message,
-                color=self.config.error_color
+                color=self.config.get_error_color()
             )
-        
-        messageLines = self.parkDataClient.messageLines
-        dt = datetime.now(tz=timezone(self.parkDataClient.parkTz))
+            return
+
+        messageLines = self.statsTracker.render_stats_lines(summary)
+        messageLines.append(f"\n*Stats over the last {summary.samples} updates from queue-times.com*")
+        await self.do_response(
+            title=f"{park.name} {self.config.stats_response_title_suffix}",
+            description="\n".join(messageLines),
+            message=message
+        )
+
+    async def do_changes(self, command: str, message: discord.Message = None):
+        """
+        Handles a changes command for a specific park, listing only the rides that opened, closed or whose wait moved
+        by at least change_wait_threshold_minutes in the last upstream update.
+        """
+        park = self._park_for_command(command, self.config.changes_command_suffix)
+        result = await self.parkDataClient.fetch_park_data(park)
+        if not result.hasData:
+            await self.do_response(
+                title=self.config.help_response_title,
+                description=self.config.wait_response_error_description,
+                message=message,
+                color=self.config.get_error_color()
+            )
+            return
+
+        messageLines = []
+        if result.changes is not None:
+            messageLines.extend(self.parkDataClient.render_change_lines(result.changes))
+        if len(messageLines) == 0:
+            messageLines.append(self.config.no_changes_message)
+        if result.changes is not None:
+            since = datetime.fromtimestamp(result.changes.previousUpdate, tz=timezone(result.parkTz))
+            messageLines.append(f"\n*Since {self._time_12h_no_leading_zero(since)} local time, data from queue-times.com*")
+        await self.do_response(
+            title=f"{park.name} {self.config.changes_response_title_suffix}",
+            description="\n".join(messageLines),
+            message=message
+        )
+
+    async def do_forecast(self, command: str, message: discord.Message = None):
+        """
+        Handles a forecast command for a specific park, summarizing when rain is likely and listing the hourly forecast.
+        """
+        park = self._park_for_command(command, self.config.forecast_command_suffix)
+        forecast = await self.weatherClient.get_park_forecast(park)
+        if forecast is None or len(forecast.times) == 0:
+            await self.do_response(
+                title=self.config.help_response_title,
+                description=self.config.weather_data_unavailable_message,
+                message=message,
+                color=self.config.get_error_color()
+            )
+            return
+
+        await self.do_response(
+            title=f"{park.name} {self.config.forecast_response_title_suffix}",
+            description="\n".join(self._render_forecast_lines(forecast)),
+            message=message
+        )
+
+    async def do_alert_command(self, content: str, message: discord.Message = None):
+        """
+        Handles the ride alert commands:
+          - "!<Park>Alert <minutes> <ride name>" subscribes to a ride, matching the name case-insensitively.
+          - alert_list_command lists the author's alerts, alert_cancel_command <id> removes one.
+        """
+        userId = message.author.id if message else 0
+        channelId = message.channel.id if message else 0
+        command, _, arguments = content.partition(" ")
+        arguments = arguments.strip()
+
+        if command == self.config.alert_list_command:
+            alerts = self.alertStore.alerts_for_user(userId)
+            lines = [f"**#{alert.alertId}** {alert.rideName} at {alert.parkName}, {alert.maxWait} min or less" for alert in alerts]
+            if not lines:
+                lines.append("You don't have any ride alerts")
+            else:
+                lines.append(f"\nCancel one with {self.config.alert_cancel_command} <#>")
+            await self.do_response(self.config.alert_response_title, "\n".join(lines), message)
+            return
+
+        if command == self.config.alert_cancel_command:
+            alertId = arguments.lstrip("#")
+            if alertId.isdigit() and self.alertStore.remove(int(alertId), userId):
+                await self.do_response(self.config.alert_response_title, f"Cancelled alert #{alertId}", message)
+            else:
+                await self._alert_error(f"You don't have an alert #{alertId}, see yours with {self.config.alert_list_command}", message)
+            return
+
+        park = self._park_for_command(command, self.config.alert_command_suffix)
+        maxWait, _, rideQuery = arguments.partition(" ")
+        if not maxWait.isdigit() or rideQuery.strip() == "":
+            await self._alert_error(f"Usage: {command} <minutes> <ride name>", message)
+            return
+        if len(self.alertStore.alerts_for_user(userId)) >= self.config.alert_config.max_per_user:
+            await self._alert_error(f"You already have {self.config.alert_config.max_per_user} alerts, cancel one with {self.config.alert_cancel_command} first", message)
+            return
+
+        result = await self.parkDataClient.fetch_park_data(park)
+        if not result.hasData:
+            await self._alert_error(self.config.wait_response_error_description, message)
+            return
+        matches = self._find_rides(result.snapshot, rideQuery.strip())
+        if len(matches) != 1:
+            if matches:
+                names = ", ".join(result.snapshot.rideNames[index] for index in matches[:5])
+                description = f"Which ride did you mean? {names}"
+            else:
+                description = f"No ride at {park.name} matches \"{rideQuery.strip()}\""
+            await self._alert_error(description, message)
+            return
+
+        ride = result.snapshot.ride(matches[0])
+        if ride.isOpen and ride.waitTime <= int(maxWait):
+            await self.do_response(self.config.alert_response_title, f"**{ride.name}** is open right now with a **{ride.waitTime} min** wait!", message)
+            return
+        alert = self.alertStore.add(userId, channelId, park, ride.id, ride.name, int(maxWait))
+        await self.do_response(
+            self.config.alert_response_title,
+            f"I'll DM you when **{ride.name}** at {park.name} is open with a wait of **{alert.maxWait} min** or less. "
+            f"This is alert #{alert.alertId}, it expires in {self.config.alert_config.expire_hours} hours.",
+            message
+        )
+
+    async def do_ride_search(self, content: str, message: discord.Message = None):
+        """
+        Handles a ride search command, replying with the current wait of the few rides best matching the query
+        across every park in `parks`. Parks without fresh data are fetched first, up to group_deadline_seconds.
+        """
+        query = content[len(self.config.ride_search_command):].strip()
+        if not trigrams(normalize(query)):
+            # Nothing searchable (e.g. a bare command or only punctuation), don't fetch every park for it
+            await self._ride_search_no_match(message)
+            return
+        parks = list(self.config.parks.values())
+        semaphore = asyncio.Semaphore(self.config.group_fetch_concurrency)
+
+        async def fetch(park: ParkConfig):
+            async with semaphore:
+                return await self.parkDataClient.fetch_park_data(park)
+
+        # New snapshots reach the index through its snapshot listener
+        tasks = [asyncio.ensure_future(fetch(park)) for park in parks if self.parkDataClient.cached_result(park) is None]
+        if tasks:
+            await asyncio.wait(tasks, timeout=self.config.group_deadline_seconds)
+        self._keep_running(tasks)
+
+        with metrics.timer("ride_search"):
+            matches = self.rideSearch.search(query, {park.url for park in parks}, self.config.ride_search_max_results)
+        if len(matches) == 0:
+            await self._ride_search_no_match(message)
+            return
+
+        messageLines = []
+        for match in matches:
+            wait = f"**{match.waitTime} min**" if match.isOpen else "Closed"
+            land = f" • {match.landName}" if match.landName else ""
+            messageLines.append(f"{match.rideName}: {wait}\n*{match.parkConfig.name} {match.parkConfig.country.flag}{land}*")
+        messageLines.append("\n*Data from queue-times.com*")
+        await self.do_response(
+            title=self.config.ride_search_response_title,
+            description="\n".join(messageLines),
+            message=message
+        )
+
+    ## Private helpers
+
+    async def _alert_error(self, description: str, message: discord.Message = None):
+        await self.do_response(self.config.alert_response_title, description, message, self.config.get_error_color())
+
+    async def _ride_search_no_match(self, message: discord.Message = None):
+        await self.do_response(self.config.ride_search_response_title, self.config.no_ride_match_message, message, self.config.get_error_color())
+
+    def _find_rides(self, snapshot: ParkSnapshot, query: str) -> list[int]:
+        """
+        Returns the indexes of rides matching query, an exact (case-insensitive) name match wins over partial ones.
+        """
+        query = query.lower()
+        partial = []
+        for index, name in enumerate(snapshot.rideNames):
+            if name.lower() == query:
+                return [index]
+            if query in name.lower():
+                partial.append(index)
+        return partial
+
+    def _check_alerts(self, park: ParkConfig, snapshot: ParkSnapshot):
+        """
+        Snapshot listener, sends a notification for every alert the new snapshot satisfies.
+        """
+        fired = self.alertStore.evaluate_snapshot(park, snapshot)
+        if fired:
+            metrics.inc("ride_alerts_fired_total", len(fired))
+            # Listeners are synchronous, the notifications go out in the background
+            self._keep_running([asyncio.get_running_loop().create_task(self._send_alerts(fired))])
+
+    def _keep_running(self, tasks: list[asyncio.Task]):
+        """
+        Holds a reference to every task that hasn't finished yet until it does, so it isn't garbage collected mid-run.
+        """
+        for task in tasks:
+            if not task.done():
+                self.backgroundTasks.add(task)
+                task.add_done_callback(self.backgroundTasks.discard)
+
+    async def _send_alerts(self, fired: list[tuple[RideAlert, int]]):
+        for alert, waitTime in fired:
+            description = (
+                f"**{alert.rideName}** at {alert.parkName} is open with a **{waitTime} min** wait "
+                f"(your alert #{alert.alertId} was for {alert.maxWait} min or less)"
+            )
+            if not self.config.use_discord or not self.discordClient:
+                print(f"{self.config.alert_response_title} for {alert.userId}\n{description}")
+                continue
+            client = self.discordClient.client
+            try:
+                user = client.get_user(alert.userId) or await client.fetch_user(alert.userId)
+                await self.discordClient.post_channel_embed(user, self.config.alert_response_title, description)
+            except discord.DiscordException as e:
+                # DMs can be turned off, fall back to the channel the alert was set up in
+                print(f"Failed to DM ride alert #{alert.alertId}, posting in its channel instead: {e}")
+                try:
+                    channel = client.get_channel(alert.channelId) or await client.fetch_channel(alert.channelId)
+                    await self.discordClient.post_channel_embed(channel, self.config.alert_response_title, f"<@{alert.userId}> {description}")
+                except discord.DiscordException as e:
+                    print(f"Failed to send ride alert #{alert.alertId}: {e}")
+
+    def _render_waits_description(self, result: ParkDataResult, weather: ParkWeather | None) -> str:
+        # The result is shared and immutable, build this response's lines on a copy
+        messageLines = list(result.messageLines)
+        dt = datetime.now(tz=timezone(result.parkTz))
         timeStr = self._time_12h_no_leading_zero(dt)
         messageLines.append(f"*Data from queue-times.com • Local time: {timeStr} *")
 
-        if self.parkDataClient.is_data_stale():
+        if self.parkDataClient.is_data_stale(result):
             messageLines.insert(1, f"{self.config.stale_data_message}\n")
-        elif self.parkDataClient.allClosed:
+        elif result.allClosed:
             messageLines.insert(1, f"{self.config.all_closed_message}\n")
+        if result.servedStale:
+            messageLines.insert(0, f"{self._served_stale_notice(result)}\n")
 
         # Optionally append weather data
         if self.config.include_weather:
-            await self.weatherClient.fetch_weather(park.lat, park.lon)
-            if self.weatherClient.last_fetch_successful:
-                self.weatherClient.last_fetched_data
-                messageLines.insert(0, f"{self.config.current_weather_header}\n   {self.weatherClient.current_temperature}{self.weatherClient.current_temperature_unit} {self.weatherClient.last_emoji}\n")
+            if weather is not None:
+                messageLines.insert(0, f"{self.config.current_weather_header}\n   {weather.temperature}{self.weatherClient.current_temperature_unit} {weather.emoji}\n")
             else:
                 messageLines.insert(0, f"{self.config.current_weather_header}\n   {self.config.weather_data_unavailable_message}\n")
 
-        descriptionText = "\n".join(messageLines)
-        await self.do_response(
-            title=f"Data for {park.name}",
-            description=descriptionText,
-            message=message
-        )
+        return "\n".join(messageLines)
 
-    ## Private helpers
+    def _served_stale_notice(self, result: ParkDataResult) -> str:
+        ageMinutes = max(1, round((time.time() - result.fetchedAt) / 60))
+        return self.config.served_stale_message.format(age=f"{ageMinutes} min")
+
+    def _render_forecast_lines(self, forecast: ParkForecast) -> list[str]:
+        unit = self.weatherClient.current_temperature_unit
+
+        def local_time(epoch: int) -> str:
+            return self._time_12h_no_leading_zero(datetime.fromtimestamp(epoch + forecast.utcOffsetSeconds, tz=dt_timezone.utc))
+
+        messageLines = []
+        if forecast.rainLikelyAt is not None:
+            messageLines.append(f"🌧️ Rain likely from **{local_time(forecast.rainLikelyAt)}** (up to {forecast.maxRainChance:.0f}%)")
+        else:
+            messageLines.append(f"No rain expected in the next {len(forecast.times)} hours (up to {forecast.maxRainChance:.0f}%)")
+        if not math.isnan(forecast.high):
+            messageLines.append(f"🌡️ {forecast.low:.0f}{unit} to {forecast.high:.0f}{unit}")
+        messageLines.append("")
+
+        # One bulk conversion per variable rather than indexing the arrays element by element
+        temperatures = forecast.values.get("temperature_2m")
+        temperatures = temperatures.tolist() if temperatures is not None else None
+        rainChances = forecast.values.get("precipitation_probability")
+        rainChances = rainChances.tolist() if rainChances is not None else None
+        for index, epoch in enumerate(forecast.times.tolist()):
+            parts = []
+            if temperatures is not None and index < len(temperatures):
+                parts.append(f"{temperatures[index]:.0f}{unit}")
+            if rainChances is not None and index < len(rainChances):
+                parts.append(f"{rainChances[index]:.0f}% rain")
+            messageLines.append(f"{local_time(epoch)}: {' • '.join(parts)}")
+        messageLines.append("\n*Forecast from open-meteo.com*")
+        return messageLines
+
+    def _park_for_command(self, command: str, suffix: str) -> ParkConfig | None:
+        """
+        Maps a per-park command like "!EpicStats" to its park by swapping the suffix for the waits suffix.
+        """
+        if not command.endswith(suffix):
+            return None
+        return self.config.commands.get(command[:-len(suffix)] + self.config.waits_command_suffix, None)
 
     def _time_12h_no_leading_zero(self, dt: datetime) -> str:
         # Windows uses %#I, Unix uses %-I
@@ -150,22 +680,59 @@ class App:
         """
         Loads the YAML configuration file and returns an AppConfig object.
         Config is done via pydantic, which handles config validation on load and loading .yml into the AppConfig and other models.
+        Unchanged configs are served from a compiled cache, see ConfigLoader.
         """
-        try:
-            with open(self.configPath, "r", encoding="utf-8") as f:
-                config_data = yaml.safe_load(f)
-                if not config_data:
-                    raise ValueError("Config data is empty or could not be loaded")
-                # Convert weather_emojis keys to int, this is how we want to look them up, but YAML doesn't support numeric key types
-                if "weather_config" in config_data and "weather_states" in config_data["weather_config"]:
-                    config_data["weather_config"]["weather_states"] = {int(k): v for k, v in config_data["weather_config"]["weather_states"].items()}
-            return AppConfig(**config_data)
-        except FileNotFoundError:
-            print("Config file not found.")
-            raise
-        except yaml.YAMLError as e:
-            print("Error parsing YAML:", e)
-            raise
+        return self.configLoader.load()
+
+    async def reload_config(self, newConfig: AppConfig):
+        """
+        Swaps in a reloaded config while staying connected. Clients are updated in place so cached park data and
+        weather for parks that didn't change stay warm, then the new config replaces the old one in a single assignment.
+        Nothing awaits between updating the clients and the swap, the poller is only restarted on its parks afterwards.
+        """
+        oldConfig = self.config
+        share_park_configs(newConfig, previous=oldConfig)
+        restartOnly = [
+            name for name in ("use_discord", "discord_client_config", "metrics_config", "api_config", "history_config", "stats_config", "alert_config", "sharding_config")
+            if getattr(newConfig, name) != getattr(oldConfig, name)
+        ]
+        if newConfig.poller_config.enabled != oldConfig.poller_config.enabled:
+            restartOnly.append("poller_config.enabled")
+
+        allParks = list(newConfig.parks.values()) + list(newConfig.commands.values())
+        for group in newConfig.group_commands.values():
+            allParks.extend(group.parks)
+        if newConfig.weather_config != oldConfig.weather_config:
+            # Weather states and units are baked into fetched results, so start from a fresh client
+            self.weatherClient = ParkWeatherClient(newConfig.weather_config, self.sharedCache)
+        self.weatherClient.set_batch_parks(newConfig.parks.values())
+        if newConfig.park_client_config != oldConfig.park_client_config:
+            # Every park is re-parsed with the new options, the index fills back up from those snapshots
+            self.rideSearch.reset(newConfig.park_client_config.default_land_key)
+        self.parkDataClient.apply_config(newConfig.park_client_config, allParks)
+        if newConfig.throttle_config.enabled:
+            if self.commandThrottle:
+                self.commandThrottle.config = newConfig.throttle_config
+            else:
+                self.commandThrottle = CommandThrottle(newConfig.throttle_config)
+        else:
+            self.commandThrottle = None
+        if self.configWatcher:
+            self.configWatcher.pollSeconds = newConfig.reload_config.poll_seconds
+        # Rendered responses also depend on messages and colors from the config, they are cheap to rebuild
+        self.responseCache = ResponseCache(newConfig.response_cache_size)
+        if self.apiServer:
+            self.apiServer.responseCache = ResponseCache(self.apiServer.config.response_cache_size)
+
+        self.config = newConfig
+        # Awaits, so it has to come after the swap, commands handled meanwhile must already see the new config
+        if self.parkDataPoller:
+            self.parkDataPoller.config = newConfig.poller_config
+            await self.parkDataPoller.set_parks(newConfig.parks)
+        metrics.inc("config_reloads_total")
+        print(f"Reloaded config from {self.configPath}")
+        if restartOnly:
+            print(f"Config changes that need a restart to apply: {', '.join(restartOnly)}")
 
 async def demo(config_file: str):
     """
@@ -174,8 +741,9 @@ async def demo(config_file: str):
     app = App(config_path=config_file)
     app.startup()
     await app.do_waits("!EpcotWaits")
+    await app.parkDataClient.close()
 
 if __name__ == "__main__":
     config_path = sys.argv[1] if len(sys.argv) > 1 else "config.yaml"
     #asyncio.run(demo(config_path))
-    asyncio.run(App(config_path).startup())
\ No newline at end of file
+    App(config_path).startup()
\ No newline at end of file
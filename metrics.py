@@ -0,0 +1,130 @@
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Awaitable, TypeVar
+from aiohttp import web
+from config import MetricsConfig
+
+T = TypeVar("T")
+
+# Latency buckets in seconds, from cache hits up to slow upstream responses
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MetricsRegistry:
+    """
+    MetricsRegistry records stage latency histograms and counters, and renders them in the Prometheus text format.
+    Everything is labelled with keyword arguments, e.g. metrics.observe("stage_seconds", 0.2, stage="render", park="Epcot").
+    """
+    def __init__(self, prefix: str = "themepark_", buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.prefix: str = prefix
+        self.buckets: tuple[float, ...] = buckets
+        # name -> label pairs -> [per bucket counts (non-cumulative, last is +Inf), sum, count]
+        self.histograms: dict[str, dict[tuple, list]] = {}
+        # name -> label pairs -> value
+        self.counters: dict[str, dict[tuple, float]] = {}
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        Records a value (usually seconds) in the named histogram.
+        """
+        series = self.histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        entry = series.get(key)
+        if entry is None:
+            entry = series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """
+        Increments the named counter.
+        """
+        series = self.counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        """
+        Times the wrapped block into the stage_seconds histogram, also works around awaits.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+    async def timed(self, stage: str, awaitable: Awaitable[T], **labels) -> T:
+        """
+        Awaits and times an awaitable into the stage_seconds histogram, handy inside asyncio.gather.
+        """
+        with self.timer(stage, **labels):
+            return await awaitable
+
+    def render_prometheus(self) -> str:
+        """
+        Renders every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            fullName = self.prefix + name
+            lines.append(f"# TYPE {fullName} counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{fullName}{self._format_labels(key)} {value}")
+
+        for name, series in sorted(self.histograms.items()):
+            fullName = self.prefix + name
+            lines.append(f"# TYPE {fullName} histogram")
+            for key, (bucketCounts, total, count) in sorted(series.items()):
+                cumulative = 0
+                for bound, bucketCount in zip(self.buckets, bucketCounts):
+                    cumulative += bucketCount
+                    lines.append(f"{fullName}_bucket{self._format_labels(key + (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{fullName}_bucket{self._format_labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{fullName}_sum{self._format_labels(key)} {total}")
+                lines.append(f"{fullName}_count{self._format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def _format_labels(self, key: tuple) -> str:
+        if len(key) == 0:
+            return ""
+        pairs = ",".join(f'{label}="{self._escape(str(value))}"' for label, value in key)
+        return "{" + pairs + "}"
+
+    def _escape(self, value: str) -> str:
+        return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# Shared registry, modules record into this directly rather than having it passed around
+metrics = MetricsRegistry()
+
+
+class MetricsServer:
+    """
+    MetricsServer serves the shared registry at /metrics on a local port for Prometheus to scrape.
+    """
+    def __init__(self, metrics_config: MetricsConfig, registry: MetricsRegistry = metrics):
+        self.config: MetricsConfig = metrics_config
+        self.registry: MetricsRegistry = registry
+        self.runner: web.AppRunner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.config.host, self.config.port).start()
+        print(f"Serving metrics on http://{self.config.host}:{self.config.port}/metrics")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.registry.render_prometheus(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        )
@@ -0,0 +1,156 @@
+import asyncio
+import itertools
+import time
+import discord
+from command_throttle import TokenBucket
+from config import DiscordClientConfig
+from metrics import metrics
+
+# Send priorities, lower goes first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Discord rejects embed descriptions over this many characters
+EMBED_DESCRIPTION_LIMIT = 4096
+# Sends that hit a rate limit discord.py didn't wait out itself are retried this many times in total
+MAX_SEND_ATTEMPTS = 3
+
+
+def split_description(description: str, limit: int = EMBED_DESCRIPTION_LIMIT) -> list[str]:
+    """
+    Splits a description into chunks of at most limit characters. Chunks break between lines so lands and rides
+    aren't cut in half, only a single line longer than limit is split mid-line.
+    """
+    if len(description) <= limit:
+        return [description]
+
+    chunks: list[str] = []
+    lines: list[str] = []
+    length = 0
+    for line in description.split("\n"):
+        for piece in [line[i:i + limit] for i in range(0, len(line), limit)] or [""]:
+            # Joining onto previous lines costs a newline
+            added = len(piece) + (1 if lines else 0)
+            if length + added > limit:
+                chunks.append("\n".join(lines))
+                lines = []
+                added = len(piece)
+                length = 0
+            lines.append(piece)
+            length += added
+    if lines:
+        chunks.append("\n".join(lines))
+    return chunks
+
+
+def build_embeds(title: str, description: str, color: int, limit: int = EMBED_DESCRIPTION_LIMIT) -> list[discord.Embed]:
+    """
+    Builds the embeds for a response, splitting descriptions over limit across several numbered embeds.
+    """
+    chunks = split_description(description, limit)
+    if len(chunks) == 1:
+        return [discord.Embed(title=title, description=description, color=color)]
+    return [
+        discord.Embed(title=f"{title} ({index}/{len(chunks)})", description=chunk, color=color)
+        for index, chunk in enumerate(chunks, start=1)
+    ]
+
+
+class OutboundQueue:
+    """
+    OutboundQueue paces outgoing messages to stay under Discord's rate limits, rather than running into them and stalling.
+      - Each channel has a worker with its own priority queue and token bucket, so one busy channel can't hold up others.
+      - All workers share a global token bucket, background posts leave background_reserve_tokens of it for interactive replies.
+      - Interactive replies go ahead of queued background posts in the same channel.
+    Workers exit after worker_idle_seconds without anything to send.
+    """
+    def __init__(self, discord_config: DiscordClientConfig):
+        self.config: DiscordClientConfig = discord_config
+        self.globalBucket: TokenBucket = TokenBucket(discord_config.global_burst, discord_config.global_rate_per_second, time.monotonic())
+        # channel id -> queue of (priority, sequence, channel, embeds, future, queued at)
+        self.channelQueues: dict[int, asyncio.PriorityQueue] = {}
+        self.channelBuckets: dict[int, TokenBucket] = {}
+        self.workers: dict[int, asyncio.Task] = {}
+        # Keeps FIFO order within a priority, and means queue entries never compare channels or embeds
+        self.sequence = itertools.count()
+
+    async def send(self, channel: discord.abc.Messageable, embeds: list[discord.Embed], priority: int = INTERACTIVE):
+        """
+        Queues embeds for channel and waits until all of them are sent, raising if sending failed.
+        The embeds are sent in order as separate messages, with nothing else from the same channel in between.
+        """
+        channelId = channel.id
+        queue = self.channelQueues.get(channelId)
+        if queue is None:
+            queue = self.channelQueues[channelId] = asyncio.PriorityQueue()
+            self.channelBuckets[channelId] = TokenBucket(self.config.channel_burst, self.config.channel_rate_per_second, time.monotonic())
+            self.workers[channelId] = asyncio.create_task(self._run_worker(channelId, queue))
+
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait((priority, next(self.sequence), channel, embeds, future, time.monotonic()))
+        await future
+
+    async def close(self):
+        """
+        Cancels every channel worker, anything still queued is dropped.
+        """
+        workers = list(self.workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _run_worker(self, channelId: int, queue: asyncio.PriorityQueue):
+        try:
+            while True:
+                try:
+                    entry = await asyncio.wait_for(queue.get(), self.config.worker_idle_seconds)
+                except asyncio.TimeoutError:
+                    # Nothing can be queued between this check and the cleanup below, there is no await in between
+                    if queue.empty():
+                        return
+                    continue
+
+                channelBucket = self.channelBuckets[channelId]
+                await asyncio.sleep(channelBucket.seconds_until_available(time.monotonic()))
+                # A reply may have been queued while waiting for the channel, swap it in ahead of a background post
+                queue.put_nowait(entry)
+                priority, _, channel, embeds, future, queuedAt = queue.get_nowait()
+
+                metrics.observe("stage_seconds", time.monotonic() - queuedAt, stage="outbound_queue")
+                try:
+                    for embed in embeds:
+                        await self._send_embed(channelId, channel, embed, priority)
+                    if not future.done():
+                        future.set_result(None)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+        finally:
+            self.channelQueues.pop(channelId, None)
+            self.channelBuckets.pop(channelId, None)
+            self.workers.pop(channelId, None)
+
+    async def _send_embed(self, channelId: int, channel: discord.abc.Messageable, embed: discord.Embed, priority: int):
+        for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+            await self._take_tokens(channelId, priority)
+            try:
+                with metrics.timer("discord_send"):
+                    await channel.send(embed=embed)
+                return
+            except discord.RateLimited as e:
+                metrics.inc("discord_rate_limited_total")
+                if attempt == MAX_SEND_ATTEMPTS:
+                    raise
+                await asyncio.sleep(e.retry_after)
+
+    async def _take_tokens(self, channelId: int, priority: int):
+        channelBucket = self.channelBuckets[channelId]
+        globalTokens = 1 if priority == INTERACTIVE else 1 + self.config.background_reserve_tokens
+        while True:
+            now = time.monotonic()
+            wait = max(channelBucket.seconds_until_available(now), self.globalBucket.seconds_until_available(now, globalTokens))
+            if wait == 0:
+                channelBucket.try_take(now)
+                self.globalBucket.try_take(now)
+                return
+            await asyncio.sleep(wait)
@@ -0,0 +1,116 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+from metrics import metrics
+from shared_cache import SharedCacheStore
+
+# How often a process waiting on another process's fetch checks the shared cache for the result
+SHARED_POLL_SECONDS = 0.1
+
+
+class ParkDataCache:
+    """
+    ParkDataCache is a small in-memory TTL cache for upstream payloads.
+    Concurrent misses for the same key are coalesced onto a single in-flight fetch, so a burst of identical
+    commands only costs one upstream request.
+    With a SharedCacheStore, misses are looked up in the shared store before going upstream and fetched values are
+    written to it, with fetches coalesced across processes too. The name is the namespace in the shared store.
+    """
+    def __init__(self, name: str = "default", shared: SharedCacheStore = None):
+        # Used to label cache hit/miss metrics
+        self.name: str = name
+        self.shared: SharedCacheStore = shared
+        # key -> (expiry in monotonic seconds or None to never expire, cached value)
+        self.entries: dict[str, tuple[float | None, Any]] = {}
+        self.inFlight: dict[str, asyncio.Task] = {}
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]], ttl_seconds: float | None = None) -> Any:
+        """
+        Returns the cached value for key if it hasn't expired, otherwise awaits fetch() and caches the result.
+        A ttl_seconds of None caches the value forever. Failed fetches are not cached and raise to every waiter.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            metrics.inc("cache_requests_total", cache=self.name, result="hit")
+            return cached
+        if self.shared is not None:
+            cached = await self._get_shared(key)
+            if cached is not None:
+                metrics.inc("cache_requests_total", cache=self.name, result="shared_hit")
+                return cached
+        metrics.inc("cache_requests_total", cache=self.name, result="miss")
+        return await self.refresh(key, fetch, ttl_seconds)
+
+    async def refresh(self, key: str, fetch: Callable[[], Awaitable[Any]], ttl_seconds: float | None = None) -> Any:
+        """
+        Awaits fetch() and caches the result even if the cached value is still fresh, readers keep getting the old
+        value until the new one lands. Joins the in-flight fetch for key if there already is one.
+        """
+        task = self.inFlight.get(key)
+        if task is None:
+            if self.shared is not None:
+                fetch = self._shared_fetch(key, fetch, ttl_seconds)
+            task = asyncio.ensure_future(fetch())
+            self.inFlight[key] = task
+            task.add_done_callback(lambda t: self._on_fetch_done(key, ttl_seconds, t))
+
+        # Shield so one cancelled waiter doesn't cancel the fetch everyone else is waiting on
+        return await asyncio.shield(task)
+
+    def get(self, key: str) -> Any:
+        """
+        Returns the cached value for key, or None if it is missing or expired.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expiresAt, value = entry
+        if expiresAt is not None and expiresAt <= time.monotonic():
+            return None
+        return value
+
+    def invalidate(self, key: str):
+        """
+        Drops the cached value for key, the next lookup will go upstream.
+        """
+        self.entries.pop(key, None)
+
+    async def _get_shared(self, key: str) -> Any:
+        # Every shared store call is a blocking SQLite query, they all run in a worker thread
+        entry = await asyncio.to_thread(self.shared.get, self.name, key)
+        if entry is None:
+            return None
+        value, remainingSeconds, _ = entry
+        # Keep the decoded value in memory until the shared entry expires, so it is only unpickled once per refresh
+        self.entries[key] = (None if remainingSeconds is None else time.monotonic() + remainingSeconds, value)
+        return value
+
+    def _shared_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]], ttl_seconds: float | None) -> Callable[[], Awaitable[Any]]:
+        async def fetch_once() -> Any:
+            startedAt = time.time()
+            if not await asyncio.to_thread(self.shared.try_acquire_lease, self.name, key):
+                # Another process is already fetching, wait for its result instead of going upstream as well.
+                # If its fetch fails it releases the lease without a result, so keep trying to take the lease over.
+                metrics.inc("shared_cache_waits_total", cache=self.name)
+                deadline = time.monotonic() + self.shared.leaseSeconds
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(SHARED_POLL_SECONDS)
+                    entry = await asyncio.to_thread(self.shared.get, self.name, key, startedAt)
+                    if entry is not None:
+                        return entry[0]
+                    if await asyncio.to_thread(self.shared.try_acquire_lease, self.name, key):
+                        break
+            try:
+                value = await fetch()
+                await asyncio.to_thread(self.shared.put, self.name, key, value, ttl_seconds)
+                return value
+            finally:
+                await asyncio.to_thread(self.shared.release_lease, self.name, key)
+        return fetch_once
+
+    def _on_fetch_done(self, key: str, ttl_seconds: float | None, task: asyncio.Task):
+        self.inFlight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        expiresAt = None if ttl_seconds is None else time.monotonic() + ttl_seconds
+        self.entries[key] = (expiresAt, task.result())
@@ -1,105 +1,441 @@
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from dataclasses import dataclass, replace
 from datetime import datetime
 from config import ParkClientConfig, ParkConfig
+from local_source import LocalDataSource, SnapshotArchive
+from metrics import metrics
+from park_data_cache import ParkDataCache
+from park_snapshot import ParkSnapshot
 from pytz import timezone
-import requests
+from shared_cache import SharedCacheStore
+from snapshot_diff import CLOSED, OPENED, WAIT_UP, SnapshotDiff, diff_snapshots
+from typing import Callable, Iterable
+import aiohttp
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import re
+import time
+
+
+@dataclass(frozen=True)
+class ParkDataResult:
+    """
+    The processed result of a single park data fetch. Immutable so concurrent commands can each hold their own
+    result without sharing any state on the client.
+    """
+    parkConfig: ParkConfig
+    parkTz: str = ""
+    latestUpdate: int = 0
+    allClosed: bool = True
+    messageLines: tuple[str, ...] = ()
+    snapshot: ParkSnapshot = None
+    # Increases every time new data is processed, results reused from cache keep the same version
+    dataVersion: int = 0
+    # What changed in the last upstream update before this result, None until two distinct updates have been seen
+    changes: SnapshotDiff = None
+    # Epoch seconds when the payloads behind this result were processed
+    fetchedAt: float = 0.0
+    # True when upstream missed its latency budget or failed and this is the last good result instead
+    servedStale: bool = False
+
+    @property
+    def hasData(self) -> bool:
+        """
+        Returns True if there is processed message data available, False otherwise.
+        """
+        return len(self.messageLines) > 0
 
 
 class ParkDataClient:
     """
     ParkDataClient is responsible for fetching, parsing, and processing theme park data from an external API.
+    The client only holds shared resources (HTTP session, caches), every fetch returns its own ParkDataResult.
     """
-    def __init__(self, client_config: ParkClientConfig):
+    def __init__(self, client_config: ParkClientConfig, shared_cache: SharedCacheStore = None, base_directory: str = ""):
         self.config: ParkClientConfig = client_config
         self.include_single_rider_lines: bool = client_config.include_single_rider_lines
-        self.parkConfig: ParkConfig = None
-        self.parkData: dict = {}
-        self.queueTimesData: dict = {}
-        self.parkTz: str = ""
-        self.latestUpdate: int = 0
-        self.allClosed: bool = True
-        self.messageLines: list[str] = []
+        self.session: aiohttp.ClientSession = None
+        self.requestTimeout = aiohttp.ClientTimeout(total=client_config.request_timeout_seconds)
+        # Both caches are keyed by ParkConfig.url
+        self.queueTimesCache: ParkDataCache = ParkDataCache("queue_times", shared_cache)
+        self.parkInfoCache: ParkDataCache = ParkDataCache("park_info", shared_cache)
+        # ParkConfig.url -> (queue times payload, park info payload, result), reused while the cached payloads are unchanged
+        self.processedResults: dict[str, tuple[dict, dict, ParkDataResult]] = {}
+        self.snapshotListeners: list[Callable[[ParkConfig, ParkSnapshot], None]] = []
+        self.dataVersions = itertools.count(1)
+        # Relative file:// park URLs are resolved against base_directory, the config file's directory
+        self.localSource: LocalDataSource = LocalDataSource(client_config.replay_speed, base_directory)
+        # ParkConfig.url -> last recorded queue times payload, so unchanged cache hits aren't recorded again
+        self.lastRecorded: dict[str, dict] = {}
+        # Upstream URL -> (ETag, Last-Modified, body hash, parsed document) of the last successful response
+        self.lastResponses: dict[str, tuple[str | None, str | None, bytes, dict]] = {}
+        # Slow fetches left running after a stale result was served, held until they finish
+        self.backgroundTasks: set[asyncio.Task] = set()
+        # One breaker per upstream document, named like the upstream metric label
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self._configure_breakers()
 
-    async def fetch_park_data(self, parkConfig: ParkConfig):
+    def add_snapshot_listener(self, listener: Callable[[ParkConfig, ParkSnapshot], None]):
+        """
+        Registers a callback that is called with every newly parsed snapshot (not with results reused from cache).
         """
-        Fetch queue times and general park data from the API, parse it into JSON, and store it for processing.
+        self.snapshotListeners.append(listener)
+
+    def apply_config(self, client_config: ParkClientConfig, parks: Iterable[ParkConfig]):
+        """
+        Applies a reloaded config. Cached payloads and results are kept for parks whose url is still configured,
+        everything cached for other parks is dropped.
+        """
+        if client_config != self.config:
+            # Processing options changed, so every result has to be re-rendered, the payloads are still good
+            self.processedResults = {}
+            self.lastRecorded = {}
+        self.config = client_config
+        self.include_single_rider_lines = client_config.include_single_rider_lines
+        self.requestTimeout = aiohttp.ClientTimeout(total=client_config.request_timeout_seconds)
+        self._configure_breakers()
+
+        parksByUrl: dict[str, list[ParkConfig]] = {}
+        for park in parks:
+            parksByUrl.setdefault(park.url, []).append(park)
+        for url in [url for url in self.processedResults if url not in parksByUrl]:
+            del self.processedResults[url]
+        for cache in (self.queueTimesCache, self.parkInfoCache):
+            for url in [url for url in cache.entries if url not in parksByUrl]:
+                cache.invalidate(url)
+        upstreamUrls = set(parksByUrl) | {url.replace("/queue_times", '') for url in parksByUrl}
+        for url in [url for url in self.lastResponses if url not in upstreamUrls]:
+            del self.lastResponses[url]
+
+    async def fetch_park_data(self, parkConfig: ParkConfig) -> ParkDataResult:
+        """
+        Fetch queue times and general park data from the API and process it into a ParkDataResult.
+        Responses are served from cache when fresh, queue times expire after queue_times_cache_ttl_seconds while
+        park info only carries the timezone and is kept forever.
+        Once a park has been processed, a fetch that fails or takes longer than latency_budget_seconds returns the
+        last good result marked servedStale instead, a slow fetch keeps running and is processed in the background.
+        Errors with nothing to fall back on return an empty result rather than raising.
         """
-        self.parkData = {}
-        self.queueTimesData = {}
         if parkConfig is None or parkConfig.url is None or parkConfig.url == "":
             print("Error: Park config or URL is missing, bailing out...")
+            return ParkDataResult(parkConfig=parkConfig)
+
+        fetch = asyncio.ensure_future(self._get_park_payloads(parkConfig, refresh=False))
+        lastGood = self.processedResults.get(parkConfig.url)
+        if lastGood is None:
+            # Nothing to serve instead, so the request timeout is the only limit
+            try:
+                queueTimesData, parkData = await fetch
+            except Exception as e:
+                print(f"Error fetching park data for {parkConfig.name}: {e}")
+                return ParkDataResult(parkConfig=parkConfig)
+            return self.process_park_data(parkConfig, queueTimesData, parkData)
+
+        done, _ = await asyncio.wait({fetch}, timeout=self.config.latency_budget_seconds)
+        if fetch in done and fetch.exception() is None:
+            queueTimesData, parkData = fetch.result()
+            return self.process_park_data(parkConfig, queueTimesData, parkData)
+        if fetch in done:
+            print(f"Error fetching park data for {parkConfig.name}, serving the last good data: {fetch.exception()}")
+            metrics.inc("stale_served_total", park=parkConfig.name, reason="error")
+        else:
+            self.backgroundTasks.add(fetch)
+            fetch.add_done_callback(self.backgroundTasks.discard)
+            fetch.add_done_callback(lambda task: self._process_in_background(parkConfig, task))
+            metrics.inc("stale_served_total", park=parkConfig.name, reason="slow")
+        return replace(lastGood[2], parkConfig=parkConfig, servedStale=True)
+
+    def _process_in_background(self, parkConfig: ParkConfig, task: asyncio.Task):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            print(f"Error refreshing park data for {parkConfig.name} in the background: {task.exception()}")
             return
+        queueTimesData, parkData = task.result()
+        self.process_park_data(parkConfig, queueTimesData, parkData)
+
+    def cached_result(self, parkConfig: ParkConfig) -> ParkDataResult | None:
+        """
+        Returns the processed result for a park if the payloads it was built from are still fresh in cache, or None.
+        Never awaits or goes upstream, for callers that want to skip the fetch path on the hot path.
+        """
+        cached = self.processedResults.get(parkConfig.url)
+        if cached is None:
+            return None
+        if self.queueTimesCache.get(parkConfig.url) is not cached[0] or self.parkInfoCache.get(parkConfig.url) is not cached[1]:
+            return None
+        return self._reuse_result(cached, parkConfig)
+
+    async def refresh_park_data(self, parkConfig: ParkConfig, ttl_seconds: float = None) -> ParkDataResult:
+        """
+        Re-fetch queue times for a park regardless of cache freshness and process the result.
+        Used by the background poller to keep the cache warm.
+        """
+        queueTimesData, parkData = await self._get_park_payloads(parkConfig, refresh=True, ttl_seconds=ttl_seconds)
+        return self.process_park_data(parkConfig, queueTimesData, parkData)
 
+    async def _get_park_payloads(self, parkConfig: ParkConfig, refresh: bool, ttl_seconds: float = None) -> tuple[dict, dict]:
+        if self.localSource.handles(parkConfig.url):
+            # Local sources do their own change detection and are cheap to check, so they skip the TTL caches
+            with metrics.timer("local_read", park=parkConfig.name):
+                # Reads parse JSON and rescan archives, keep that off the event loop
+                return await asyncio.to_thread(
+                    lambda: (self.localSource.read_queue_times(parkConfig.url), self.localSource.read_park_info(parkConfig.url))
+                )
+
+        queueTimesData, parkData = await self._get_upstream_payloads(parkConfig, refresh, ttl_seconds)
+        if self.config.record_directory != "":
+            self._record_payloads(parkConfig, queueTimesData, parkData)
+        return queueTimesData, parkData
+
+    def _record_payloads(self, parkConfig: ParkConfig, queueTimesData: dict, parkData: dict):
+        if self.lastRecorded.get(parkConfig.url) is queueTimesData:
+            return
+        fileName = re.sub(r"[^A-Za-z0-9]+", "_", parkConfig.url).strip("_") + ".jsonl"
+        try:
+            os.makedirs(self.config.record_directory, exist_ok=True)
+            SnapshotArchive.append(os.path.join(self.config.record_directory, fileName), queueTimesData, parkData)
+            self.lastRecorded[parkConfig.url] = queueTimesData
+        except OSError as e:
+            print(f"Error recording park data for {parkConfig.name}: {e}")
+
+    async def _get_upstream_payloads(self, parkConfig: ParkConfig, refresh: bool, ttl_seconds: float = None) -> tuple[dict, dict]:
         waitTimesUrl = parkConfig.url
-        self.parkConfig = parkConfig
-        resp = requests.get(waitTimesUrl)
-        resp.raise_for_status()
-        self.queueTimesData = resp.json()
-        
         parkInfoUrl = waitTimesUrl.replace("/queue_times", '')
-        parkResp = requests.get(parkInfoUrl)
-        parkResp.raise_for_status()
-        self.parkData = parkResp.json()
+        if ttl_seconds is None:
+            ttl_seconds = self.config.queue_times_cache_ttl_seconds
+        getQueueTimes = self.queueTimesCache.refresh if refresh else self.queueTimesCache.get_or_fetch
 
+        # The two documents don't depend on each other, so fetch them concurrently to only pay for one round trip
+        return await asyncio.gather(
+            getQueueTimes(parkConfig.url, lambda: self._fetch_upstream(waitTimesUrl, "queue_times", parkConfig), ttl_seconds),
+            self.parkInfoCache.get_or_fetch(parkConfig.url, lambda: self._fetch_upstream(parkInfoUrl, "park_info", parkConfig))
+        )
 
-    def process_park_data(self):
+    async def _fetch_upstream(self, url: str, upstream: str, parkConfig: ParkConfig) -> dict:
         """
-        Process the park data and extract relevant information for messaging.
-        Message lines are stored in self.messageLines.
-        TODO - separate parsing the API response from immediately putting the data into strings for display so we can do more complex analysis and formatting later.
+        Fetches a document with latency and error metrics recorded against the upstream and park.
+        Raises CircuitOpenError without making a request while the upstream's breaker is open.
         """
-        self.messageLines = []
+        breaker = self.breakers[upstream]
+        try:
+            breaker.before_request()
+        except CircuitOpenError:
+            metrics.inc("upstream_rejected_total", upstream=upstream, park=parkConfig.name)
+            raise
 
-        if self.parkData is None or len(self.parkData) == 0 or "timezone" not in self.parkData:
+        startedAt = time.monotonic()
+        succeeded = False
+        try:
+            with metrics.timer(f"{upstream}_fetch", park=parkConfig.name):
+                data = await self._get_json(url)
+            succeeded = True
+            return data
+        except Exception:
+            metrics.inc("upstream_errors_total", upstream=upstream, park=parkConfig.name)
+            raise
+        finally:
+            # Cancelled requests count as failures too, so a half open breaker never waits on a trial that is gone
+            if succeeded:
+                breaker.record_success(time.monotonic() - startedAt)
+            else:
+                breaker.record_failure()
+
+    def _configure_breakers(self):
+        for upstream in ("queue_times", "park_info"):
+            breaker = self.breakers.get(upstream)
+            if breaker is None:
+                breaker = self.breakers[upstream] = CircuitBreaker(
+                    upstream,
+                    self.config.breaker_failure_threshold,
+                    self.config.breaker_reset_seconds,
+                    self.config.latency_budget_seconds
+                )
+            else:
+                # Keep the state across config reloads, only the limits change
+                breaker.failureThreshold = self.config.breaker_failure_threshold
+                breaker.resetSeconds = self.config.breaker_reset_seconds
+                breaker.latencyBudgetSeconds = self.config.latency_budget_seconds
+
+    async def close(self):
+        """
+        Closes the shared HTTP session and its pooled connections, and any memory-mapped replay archives.
+        """
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+        self.localSource.close()
+
+    async def _get_json(self, url: str) -> dict:
+        """
+        GET a JSON document using the shared session, raising on HTTP errors or if the request timeout is exceeded.
+        Requests are conditional on the last response's ETag/Last-Modified and accept compressed bodies. When upstream
+        answers 304 or sends the same bytes again, the previously parsed document (the same object) is returned
+        without decoding, so the cached result built from it is reused as well.
+        """
+        lastResponse = self.lastResponses.get(url)
+        headers = {"Accept-Encoding": "gzip, deflate"}
+        if lastResponse is not None:
+            etag, lastModified, _, _ = lastResponse
+            if etag is not None:
+                headers["If-None-Match"] = etag
+            if lastModified is not None:
+                headers["If-Modified-Since"] = lastModified
+
+        session = self._get_session()
+        async with session.get(url, headers=headers, timeout=self.requestTimeout) as resp:
+            if resp.status == 304 and lastResponse is not None:
+                metrics.inc("conditional_requests_total", result="not_modified")
+                return lastResponse[3]
+            resp.raise_for_status()
+            # aiohttp decompresses the body, hash what was sent rather than the parsed document
+            body = await resp.read()
+            etag = resp.headers.get("ETag")
+            lastModified = resp.headers.get("Last-Modified")
+
+        bodyHash = hashlib.blake2b(body, digest_size=16).digest()
+        if lastResponse is not None and lastResponse[2] == bodyHash:
+            metrics.inc("conditional_requests_total", result="unchanged")
+            document = lastResponse[3]
+        else:
+            metrics.inc("conditional_requests_total", result="changed")
+            # Some sources (e.g. raw.githubusercontent.com) serve JSON as text/plain, so the content type isn't checked
+            document = json.loads(body)
+        self.lastResponses[url] = (etag, lastModified, bodyHash, document)
+        return document
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Lazily creates the shared session, this has to happen inside the running event loop.
+        Connections are kept alive and reused across commands instead of reconnecting on every request.
+        """
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.config.connection_pool_size,
+                keepalive_timeout=self.config.keepalive_timeout_seconds
+            )
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    def process_park_data(self, parkConfig: ParkConfig, queueTimesData: dict, parkData: dict) -> ParkDataResult:
+        """
+        Parse the park data into a ParkSnapshot and render it into message lines.
+        Payloads served from cache are the same objects between refreshes, so their result is reused instead of
+        being parsed and rendered again. Doesn't modify the payloads, so it is safe to call concurrently.
+        """
+        if parkData is None or len(parkData) == 0 or "timezone" not in parkData:
             print("Error: Missing park data or tz info in response, bailing out...")
+            return ParkDataResult(parkConfig=parkConfig)
+
+        cacheKey = parkConfig.url if parkConfig is not None else None
+        cached = self.processedResults.get(cacheKey)
+        if cached is not None and cached[0] is queueTimesData and cached[1] is parkData:
+            return self._reuse_result(cached, parkConfig)
+
+        with metrics.timer("process_park_data", park=parkConfig.name if parkConfig else ""):
+            snapshot = ParkSnapshot.parse(queueTimesData or {}, parkData['timezone'], self.config)
+            messageLines = self.render_message_lines(snapshot)
+            changes = self._changes_since(cached[2] if cached is not None else None, snapshot)
+        result = ParkDataResult(
+            parkConfig=parkConfig,
+            parkTz=snapshot.parkTz,
+            latestUpdate=snapshot.latestUpdate,
+            allClosed=snapshot.allClosed,
+            messageLines=messageLines,
+            snapshot=snapshot,
+            dataVersion=next(self.dataVersions),
+            changes=changes,
+            fetchedAt=time.time()
+        )
+        self.processedResults[cacheKey] = (queueTimesData, parkData, result)
+        self._notify_snapshot_listeners(parkConfig, snapshot)
+        return result
+
+    def _reuse_result(self, cached: tuple[dict, dict, ParkDataResult], parkConfig: ParkConfig) -> ParkDataResult:
+        # Results are keyed on the park's url, a reloaded config rebuilds the ParkConfig objects without changing
+        # what the payloads render to, so only the result's parkConfig is swapped for the caller's
+        result = cached[2]
+        if result.parkConfig is not parkConfig:
+            result = replace(result, parkConfig=parkConfig)
+            self.processedResults[parkConfig.url] = (cached[0], cached[1], result)
+        return result
+
+    def _changes_since(self, previous: ParkDataResult | None, snapshot: ParkSnapshot) -> SnapshotDiff | None:
+        if previous is None or previous.snapshot is None:
+            return None
+        if previous.snapshot.latestUpdate == snapshot.latestUpdate:
+            # Re-fetched but upstream hasn't updated, keep reporting the last real update's changes
+            return previous.changes
+        return diff_snapshots(previous.snapshot, snapshot, self.config.change_wait_threshold_minutes)
+
+    def _notify_snapshot_listeners(self, parkConfig: ParkConfig, snapshot: ParkSnapshot):
+        if parkConfig is None:
             return
-        self.parkTz = self.parkData['timezone']
-        self.latestUpdate = 0
-        self.allClosed = True
-
-        lands = {land['name']: land for land in self.queueTimesData.get("lands", [])}
-
-        if lands == {}:
-            lands[self.config.default_land_key] = {"name": self.config.default_land_key, "rides": self.queueTimesData.get("rides", [])}
-
-        for land_name, land in lands.items():
-            if land_name != self.config.default_land_key:
-                self.messageLines.append(f"**{land_name}**")
-            for ride in land.get("rides", []):
-                # optionally skip single rider lines
-                if self.config.single_rider_prefix in ride['name'] and not self.config.include_single_rider_lines:
-                    continue
+        for listener in self.snapshotListeners:
+            # A failing listener shouldn't stop the response from going out
+            try:
+                listener(parkConfig, snapshot)
+            except Exception as e:
+                print(f"Error in snapshot listener for {parkConfig.name}: {e}")
+
+    def render_message_lines(self, snapshot: ParkSnapshot) -> tuple[str, ...]:
+        """
+        Renders a snapshot into the Markdown lines used for a park's wait listing.
+        """
+        messageLines = []
+        for landName, rideRange in snapshot.land_rides():
+            if landName != self.config.default_land_key:
+                messageLines.append(f"**{landName}**")
+            for index in rideRange:
                 wait = "Closed"
-                if ride.get("is_open", False):
-                    wait = f"**{ride['wait_time']} min**"
-                    self.allClosed = False
-
-                self.messageLines.append(f"{ride['name']}: {wait}")
-        
-                # Update last updated timestamp, used to make a determination on if the park may or may not be closed
-                if "last_updated" in ride:
-                    dt = datetime.fromisoformat(ride["last_updated"].replace("Z", "+00:00"))
-                    epoch = int(dt.timestamp())
-                    if epoch > self.latestUpdate:
-                        self.latestUpdate = epoch
-                self.messageLines.append("")
-
-    def is_data_stale(self) -> bool:
-        """
-        Check if the park data is stale.
+                if snapshot.isOpen[index]:
+                    wait = f"**{snapshot.waitTimes[index]} min**"
+                messageLines.append(f"{snapshot.rideNames[index]}: {wait}")
+                messageLines.append("")
+        return tuple(messageLines)
+
+    def render_change_lines(self, changes: SnapshotDiff) -> tuple[str, ...]:
+        """
+        Renders a snapshot diff into one Markdown line per changed ride.
+        """
+        messageLines = []
+        for change in changes.changes:
+            if change.kind == OPENED:
+                messageLines.append(f"🟢 {change.rideName}: opened, **{change.newWait} min**")
+            elif change.kind == CLOSED:
+                messageLines.append(f"🔴 {change.rideName}: closed")
+            else:
+                arrow = "⬆️" if change.kind == WAIT_UP else "⬇️"
+                messageLines.append(f"{arrow} {change.rideName}: {change.oldWait} → **{change.newWait} min**")
+        return tuple(messageLines)
+
+    def render_condensed_line(self, result: ParkDataResult) -> str:
+        """
+        Renders a one line summary of a park for multi-park responses, e.g. "12/40 open • longest: Ride (90 min)".
+        """
+        snapshot = result.snapshot
+        if snapshot is None or len(snapshot) == 0:
+            return "No rides reported"
+        openCount = sum(snapshot.isOpen)
+        if openCount == 0:
+            return "All rides closed"
+
+        longest = max((index for index in range(len(snapshot)) if snapshot.isOpen[index]), key=lambda index: snapshot.waitTimes[index])
+        return f"{openCount}/{len(snapshot)} open • longest: {snapshot.rideNames[longest]} (**{snapshot.waitTimes[longest]} min**)"
+
+    def is_data_stale(self, result: ParkDataResult) -> bool:
+        """
+        Check if the park data in a result is stale.
         Returns True if latestUpdate is older than the stale data threshold or hasn't been set, False otherwise.
         """
-        if self.latestUpdate == 0 or self.parkTz == "":
+        if result.latestUpdate == 0 or result.parkTz == "":
             return True
 
         utcdt = datetime.now(timezone('UTC'))
         nowEpoch = int(utcdt.timestamp())
-        print(f"Latest Update Epoch {self.latestUpdate}, current epoch in UTC: {nowEpoch}")
+        print(f"Latest Update Epoch {result.latestUpdate}, current epoch in UTC: {nowEpoch}")
 
-        return (nowEpoch - self.latestUpdate) >= self.config.stale_data_threshold_seconds
-
-    @property
-    def hasData(self) -> bool:
-        """
-        Returns True if there is processed message data available, False otherwise.
-        """
-        return self.messageLines != []
\ No newline at end of file
+        return (nowEpoch - result.latestUpdate) >= self.config.stale_data_threshold_seconds
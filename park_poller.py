@@ -0,0 +1,107 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+from config import ParkConfig, PollerConfig
+from park_data_client import ParkDataClient
+from pytz import timezone
+
+
+class ParkDataPoller:
+    """
+    ParkDataPoller keeps every configured park's queue times warm in the ParkDataClient cache.
+    Each park is refreshed on its own interval with jitter, parks that look closed are polled less often,
+    and the number of concurrent upstream fetches is capped.
+    """
+    def __init__(self, poller_config: PollerConfig, park_data_client: ParkDataClient, parks: dict[str, ParkConfig], follower: bool = False):
+        self.config: PollerConfig = poller_config
+        self.parkDataClient: ParkDataClient = park_data_client
+        # Followers (secondary shard processes) read through the shared cache the primary process keeps fresh,
+        # so their snapshot listeners see every update without any extra upstream requests
+        self.follower: bool = follower
+        # Parks can share a URL (e.g. multiple keys anchored to the same park), only poll each URL once
+        self.parks: dict[str, ParkConfig] = {park.url: park for park in parks.values()}
+        self.fetchSemaphore: asyncio.Semaphore = None
+        self.tasks: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return len(self.tasks) > 0
+
+    def start(self):
+        """
+        Starts one polling task per park, must be called from inside the running event loop.
+        """
+        if self.running:
+            return
+        self.fetchSemaphore = asyncio.Semaphore(self.config.max_concurrent_fetches)
+        self.tasks = [asyncio.create_task(self._poll_park(park)) for park in self.parks.values()]
+        print(f"Started polling {len(self.tasks)} parks")
+
+    async def stop(self):
+        """
+        Cancels all polling tasks and waits for them to finish.
+        """
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def set_parks(self, parks: dict[str, ParkConfig]):
+        """
+        Switches to a new set of parks, restarting the polling tasks if the parks changed and it was running.
+        """
+        parksByUrl = {park.url: park for park in parks.values()}
+        if parksByUrl == self.parks:
+            self.parks = parksByUrl
+            return
+        wasRunning = self.running
+        await self.stop()
+        self.parks = parksByUrl
+        if wasRunning:
+            self.start()
+
+    async def _poll_park(self, park: ParkConfig):
+        # Spread the initial fetches out so startup isn't a burst of requests
+        await asyncio.sleep(random.uniform(0, self.config.jitter_seconds))
+        while True:
+            delay = await self.poll_once(park)
+            await asyncio.sleep(delay)
+
+    async def poll_once(self, park: ParkConfig) -> float:
+        """
+        Refreshes a single park and returns how long to wait before polling it again.
+        """
+        # Keep the entry valid until the next scheduled poll so command handlers never have to go upstream
+        ttlSeconds = self.config.interval_seconds + self.config.jitter_seconds + self.parkDataClient.config.request_timeout_seconds
+        try:
+            async with self.fetchSemaphore:
+                if self.follower:
+                    result = await self.parkDataClient.fetch_park_data(park)
+                else:
+                    result = await self.parkDataClient.refresh_park_data(park, ttl_seconds=ttlSeconds)
+        except Exception as e:
+            print(f"Error polling {park.name}: {e}")
+            return self._with_jitter(self.config.interval_seconds)
+
+        closed = result.allClosed or self.parkDataClient.is_data_stale(result)
+        return self.next_delay(closed, result.parkTz)
+
+    def next_delay(self, closed: bool, park_tz: str, now: datetime = None) -> float:
+        """
+        Returns the delay until the next poll. Closed parks back off to closed_interval_seconds, but never sleep
+        past resume_local_hour in the park's timezone so the opening is picked up promptly.
+        """
+        if not closed or park_tz == "":
+            return self._with_jitter(self.config.interval_seconds)
+
+        localNow = (now or datetime.now(timezone('UTC'))).astimezone(timezone(park_tz))
+        resumeAt = localNow.replace(hour=self.config.resume_local_hour, minute=0, second=0, microsecond=0)
+        if resumeAt <= localNow:
+            resumeAt += timedelta(days=1)
+        untilResume = (resumeAt - localNow).total_seconds()
+
+        delay = max(self.config.interval_seconds, min(self.config.closed_interval_seconds, untilResume))
+        return self._with_jitter(delay)
+
+    def _with_jitter(self, delay: float) -> float:
+        return delay + random.uniform(0, self.config.jitter_seconds)
@@ -0,0 +1,132 @@
+from array import array
+from datetime import datetime
+from functools import lru_cache
+from typing import Iterator
+from config import ParkClientConfig
+
+
+@lru_cache(maxsize=8192)
+def parse_epoch(timestamp: str) -> int:
+    """
+    Converts a queue-times ISO timestamp (e.g. 2024-01-01T12:00:00.000Z) to epoch seconds.
+    Most rides keep the same last_updated between polls, so each distinct string is only decoded once.
+    """
+    return int(datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp())
+
+
+class RideRecord:
+    """
+    A single ride read out of a ParkSnapshot.
+    """
+    __slots__ = ("id", "name", "landName", "isOpen", "waitTime", "lastUpdated")
+
+    def __init__(self, id: int, name: str, landName: str, isOpen: bool, waitTime: int, lastUpdated: int):
+        self.id = id
+        self.name = name
+        self.landName = landName
+        self.isOpen = isOpen
+        self.waitTime = waitTime
+        self.lastUpdated = lastUpdated
+
+
+class ParkSnapshot:
+    """
+    Parsed queue times for one park at one point in time.
+    Rides are stored column-wise in typed arrays (ordered by land) rather than as a dict per ride, so many parks'
+    snapshots can stay resident cheaply. Rides of land i are at indexes landOffsets[i] to landOffsets[i + 1].
+    """
+    __slots__ = (
+        "parkTz", "latestUpdate", "allClosed",
+        "landNames", "landOffsets",
+        "rideIds", "rideNames", "isOpen", "waitTimes", "lastUpdated"
+    )
+
+    def __init__(self, parkTz: str):
+        self.parkTz: str = parkTz
+        self.latestUpdate: int = 0
+        self.allClosed: bool = True
+        self.landNames: tuple[str, ...] = ()
+        self.landOffsets: array = array("i", [0])
+        self.rideIds: array = array("q")
+        self.rideNames: tuple[str, ...] = ()
+        self.isOpen: array = array("b")
+        self.waitTimes: array = array("i")
+        self.lastUpdated: array = array("q")
+
+    @classmethod
+    def parse(cls, queueTimesData: dict, parkTz: str, config: ParkClientConfig) -> "ParkSnapshot":
+        """
+        Parses a queue_times.json payload. Single rider lines are dropped here unless include_single_rider_lines is set.
+        Parks without lands have all of their rides put in a land named default_land_key.
+        """
+        snapshot = cls(parkTz)
+        lands = {land['name']: land for land in queueTimesData.get("lands", [])}
+        if lands == {}:
+            lands[config.default_land_key] = {"name": config.default_land_key, "rides": queueTimesData.get("rides", [])}
+
+        landNames = []
+        rideNames = []
+        for land_name, land in lands.items():
+            landNames.append(land_name)
+            for ride in land.get("rides", []):
+                # optionally skip single rider lines
+                if config.single_rider_prefix in ride['name'] and not config.include_single_rider_lines:
+                    continue
+                isOpen = bool(ride.get("is_open", False))
+                lastUpdated = parse_epoch(ride["last_updated"]) if "last_updated" in ride else 0
+
+                rideNames.append(ride['name'])
+                snapshot.rideIds.append(ride.get("id", 0))
+                snapshot.isOpen.append(isOpen)
+                snapshot.waitTimes.append(ride.get("wait_time") or 0)
+                snapshot.lastUpdated.append(lastUpdated)
+
+                # Used to make a determination on if the park may or may not be closed
+                if isOpen:
+                    snapshot.allClosed = False
+                if lastUpdated > snapshot.latestUpdate:
+                    snapshot.latestUpdate = lastUpdated
+            snapshot.landOffsets.append(len(rideNames))
+
+        snapshot.landNames = tuple(landNames)
+        snapshot.rideNames = tuple(rideNames)
+        return snapshot
+
+    def __len__(self) -> int:
+        return len(self.rideNames)
+
+    def ride(self, index: int, landName: str = None) -> RideRecord:
+        """
+        Returns the ride at index as a RideRecord.
+        """
+        if landName is None:
+            landName = self.land_name_of(index)
+        return RideRecord(
+            self.rideIds[index],
+            self.rideNames[index],
+            landName,
+            bool(self.isOpen[index]),
+            self.waitTimes[index],
+            self.lastUpdated[index]
+        )
+
+    def rides(self) -> Iterator[RideRecord]:
+        """
+        Iterates every ride in land order.
+        """
+        for landIndex, landName in enumerate(self.landNames):
+            for rideIndex in range(self.landOffsets[landIndex], self.landOffsets[landIndex + 1]):
+                yield self.ride(rideIndex, landName)
+
+    def land_rides(self) -> Iterator[tuple[str, range]]:
+        """
+        Iterates (land name, ride index range) pairs in land order.
+        """
+        for landIndex, landName in enumerate(self.landNames):
+            yield landName, range(self.landOffsets[landIndex], self.landOffsets[landIndex + 1])
+
+    def land_name_of(self, index: int) -> str:
+        for landName, rideRange in self.land_rides():
+            if index in rideRange:
+                return landName
+        raise IndexError(index)
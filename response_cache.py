@@ -0,0 +1,34 @@
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class ResponseCache:
+    """
+    ResponseCache is a small LRU cache for rendered responses.
+    Keys should include everything the rendered output depends on (e.g. data versions and the current minute),
+    so entries never need to be invalidated, old ones just fall off the end.
+    """
+    def __init__(self, max_entries: int):
+        self.maxEntries: int = max_entries
+        self.entries: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Returns the cached value for key and marks it as recently used, or None if it isn't cached.
+        """
+        value = self.entries.get(key, None)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        """
+        Caches value under key, evicting the least recently used entry if the cache is full.
+        """
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.entries)
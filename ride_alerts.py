@@ -0,0 +1,174 @@
+import bisect
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from config import AlertConfig, ParkConfig
+from park_snapshot import ParkSnapshot
+
+
+@dataclass(frozen=True)
+class RideAlert:
+    """
+    A user's request to be notified once a ride is open with a wait of maxWait minutes or less.
+    """
+    alertId: int
+    userId: int
+    channelId: int
+    parkUrl: str
+    parkName: str
+    rideId: int
+    rideName: str
+    maxWait: int
+    createdAt: int
+
+
+class RideAlertStore:
+    """
+    RideAlertStore persists ride alerts in a local SQLite database and evaluates them against new snapshots.
+    Alerts are indexed by park and ride id, each ride's alerts sorted by maxWait descending, so a snapshot only
+    looks at rides that have alerts and whose state changed, and only touches the alerts that actually fire.
+    Alerts are one-shot, they are removed once they fire or after expire_hours.
+    Several processes can share the database, changes made by the others are picked up before each evaluation.
+    """
+    # Expired alerts are swept at most this often
+    PURGE_INTERVAL_SECONDS = 300
+
+    def __init__(self, alert_config: AlertConfig):
+        self.config: AlertConfig = alert_config
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.config.database_path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                channel_id INTEGER NOT NULL,
+                park TEXT NOT NULL,
+                park_name TEXT NOT NULL,
+                ride_id INTEGER NOT NULL,
+                ride_name TEXT NOT NULL,
+                max_wait INTEGER NOT NULL,
+                created_at INTEGER NOT NULL
+            )
+        """)
+        # park url -> ride id -> alerts, sorted by maxWait descending
+        self.alertsByRide: dict[str, dict[int, list[RideAlert]]] = {}
+        # (park url, ride id) -> (is open, wait time) when its alerts were last evaluated
+        self.lastSeen: dict[tuple[str, int], tuple[bool, int]] = {}
+        self.dataVersion: int = -1
+        self.lastPurge: float = 0
+        self._sync_from_database()
+
+    def add(self, userId: int, channelId: int, parkConfig: ParkConfig, rideId: int, rideName: str, maxWait: int) -> RideAlert:
+        createdAt = int(time.time())
+        with self.lock:
+            cursor = self.connection.execute(
+                "INSERT INTO alerts (user_id, channel_id, park, park_name, ride_id, ride_name, max_wait, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (userId, channelId, parkConfig.url, parkConfig.name, rideId, rideName, maxWait, createdAt)
+            )
+            alert = RideAlert(cursor.lastrowid, userId, channelId, parkConfig.url, parkConfig.name, rideId, rideName, maxWait, createdAt)
+        self._index(alert)
+        return alert
+
+    def remove(self, alertId: int, userId: int) -> bool:
+        """
+        Removes one of a user's alerts, returns False if the user has no alert with that id.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT * FROM alerts WHERE id = ? AND user_id = ?", (alertId, userId)).fetchone()
+            if row is None:
+                return False
+            self.connection.execute("DELETE FROM alerts WHERE id = ?", (alertId,))
+        self._unindex([RideAlert(*row)])
+        return True
+
+    def alerts_for_user(self, userId: int) -> list[RideAlert]:
+        with self.lock:
+            rows = self.connection.execute("SELECT * FROM alerts WHERE user_id = ? ORDER BY id", (userId,)).fetchall()
+        return [RideAlert(*row) for row in rows]
+
+    def evaluate_snapshot(self, parkConfig: ParkConfig, snapshot: ParkSnapshot) -> list[tuple[RideAlert, int]]:
+        """
+        Returns (alert, current wait) for every alert the snapshot satisfies, and removes them.
+        Meant to be registered as a ParkDataClient snapshot listener (wrapped to deliver the result).
+        """
+        self._sync_from_database()
+        if time.time() - self.lastPurge >= self.PURGE_INTERVAL_SECONDS:
+            self.purge_expired()
+        parkAlerts = self.alertsByRide.get(parkConfig.url)
+        if not parkAlerts:
+            return []
+
+        fired: list[tuple[RideAlert, int]] = []
+        for index in range(len(snapshot)):
+            rideId = snapshot.rideIds[index]
+            rideAlerts = parkAlerts.get(rideId)
+            if rideAlerts is None:
+                continue
+            state = (bool(snapshot.isOpen[index]), snapshot.waitTimes[index])
+            if self.lastSeen.get((parkConfig.url, rideId)) == state:
+                # Nothing changed, so nothing that didn't fire last time can fire now
+                continue
+            self.lastSeen[(parkConfig.url, rideId)] = state
+            isOpen, waitTime = state
+            if not isOpen:
+                continue
+            for alert in rideAlerts:
+                if alert.maxWait < waitTime:
+                    break
+                fired.append((alert, waitTime))
+
+        if fired:
+            with self.lock:
+                self.connection.executemany("DELETE FROM alerts WHERE id = ?", [(alert.alertId,) for alert, _ in fired])
+            self._unindex([alert for alert, _ in fired])
+        return fired
+
+    def purge_expired(self, now: float = None):
+        if now is None:
+            now = time.time()
+        self.lastPurge = now
+        cutoff = int(now - self.config.expire_hours * 3600)
+        with self.lock:
+            expired = [RideAlert(*row) for row in self.connection.execute("SELECT * FROM alerts WHERE created_at < ?", (cutoff,))]
+            if expired:
+                self.connection.execute("DELETE FROM alerts WHERE created_at < ?", (cutoff,))
+        self._unindex(expired)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def _sync_from_database(self):
+        # data_version only changes when another connection commits, so this is a no-op unless another process wrote
+        with self.lock:
+            dataVersion = self.connection.execute("PRAGMA data_version").fetchone()[0]
+            if dataVersion == self.dataVersion:
+                return
+            self.dataVersion = dataVersion
+            rows = self.connection.execute("SELECT * FROM alerts").fetchall()
+        self.alertsByRide = {}
+        for row in rows:
+            self._index(RideAlert(*row))
+
+    def _index(self, alert: RideAlert):
+        rideAlerts = self.alertsByRide.setdefault(alert.parkUrl, {}).setdefault(alert.rideId, [])
+        # Keyed on -maxWait so the list stays sorted descending
+        bisect.insort(rideAlerts, alert, key=lambda indexed: -indexed.maxWait)
+        # Make sure the new alert is evaluated against the next snapshot even if the ride doesn't change
+        self.lastSeen.pop((alert.parkUrl, alert.rideId), None)
+
+    def _unindex(self, alerts: list[RideAlert]):
+        for alert in alerts:
+            parkAlerts = self.alertsByRide.get(alert.parkUrl, {})
+            rideAlerts = parkAlerts.get(alert.rideId)
+            if rideAlerts is None:
+                continue
+            rideAlerts[:] = [indexed for indexed in rideAlerts if indexed.alertId != alert.alertId]
+            if not rideAlerts:
+                del parkAlerts[alert.rideId]
+                self.lastSeen.pop((alert.parkUrl, alert.rideId), None)
+            if not parkAlerts:
+                del self.alertsByRide[alert.parkUrl]
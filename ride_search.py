@@ -0,0 +1,167 @@
+import re
+import unicodedata
+from dataclasses import dataclass
+from config import ParkConfig
+from park_snapshot import ParkSnapshot
+
+# A query trigram found in a ride's land counts for this much of one found in its name
+LAND_WEIGHT = 0.5
+# Matches covering less than this share of the query's trigrams are dropped
+MIN_SCORE = 0.5
+
+
+def normalize(text: str) -> str:
+    """
+    Lowercases text, strips accents and collapses punctuation into single spaces, e.g. "Rémy's Ratatouille" -> "remy s ratatouille".
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char)).casefold()
+    return " ".join(re.sub(r"[\W_]+", " ", text).split())
+
+
+def trigrams(normalized: str) -> set[str]:
+    """
+    Returns the trigrams of every word in a normalized string. Words are padded with spaces, so prefixes and whole
+    short words get trigrams of their own.
+    """
+    grams = set()
+    for word in normalized.split():
+        padded = f" {word} "
+        grams.update(padded[index:index + 3] for index in range(len(padded) - 2))
+    return grams
+
+
+@dataclass(frozen=True)
+class RideSearchEntry:
+    """
+    One indexed ride. index is the ride's position in its park's snapshot, which only changes with the ride set.
+    """
+    parkUrl: str
+    index: int
+    rideName: str
+    landName: str
+    normalizedName: str
+
+
+@dataclass(frozen=True)
+class RideSearchResult:
+    """
+    A ride matching a search, with its wait from the park's latest snapshot.
+    """
+    parkConfig: ParkConfig
+    rideName: str
+    landName: str
+    isOpen: bool
+    waitTime: int
+    score: float
+
+
+class RideSearchIndex:
+    """
+    RideSearchIndex finds rides by partial or misspelled name across every park it has seen, using a trigram index
+    over ride and land names. Meant to be registered as a ParkDataClient snapshot listener, so it only sees rides
+    that made it through parsing (e.g. single rider lines are already filtered out).
+    A park's rides are only re-indexed when its ride set changes, other snapshots just update the waits.
+    """
+    def __init__(self, default_land_key: str):
+        self.defaultLandKey: str = default_land_key
+        self.entries: dict[int, RideSearchEntry] = {}
+        # trigram -> ids of entries with it in their ride or land name
+        self.namePostings: dict[str, set[int]] = {}
+        self.landPostings: dict[str, set[int]] = {}
+        # ParkConfig.url -> (park, latest snapshot, ride set signature, entry ids)
+        self.parks: dict[str, tuple[ParkConfig, ParkSnapshot, tuple, list[int]]] = {}
+        self.nextEntryId: int = 0
+
+    def add_snapshot(self, parkConfig: ParkConfig, snapshot: ParkSnapshot):
+        signature = (snapshot.rideNames, snapshot.landNames, tuple(snapshot.landOffsets))
+        indexed = self.parks.get(parkConfig.url)
+        if indexed is not None and indexed[2] == signature:
+            self.parks[parkConfig.url] = (parkConfig, snapshot, signature, indexed[3])
+            return
+
+        if indexed is not None:
+            self._remove_entries(indexed[3])
+        entryIds = []
+        for landName, rideRange in snapshot.land_rides():
+            landName = "" if landName == self.defaultLandKey else landName
+            landGrams = trigrams(normalize(landName))
+            for index in rideRange:
+                rideName = snapshot.rideNames[index]
+                entry = RideSearchEntry(parkConfig.url, index, rideName, landName, normalize(rideName))
+                entryId = self.nextEntryId
+                self.nextEntryId += 1
+                self.entries[entryId] = entry
+                entryIds.append(entryId)
+                for gram in trigrams(entry.normalizedName):
+                    self.namePostings.setdefault(gram, set()).add(entryId)
+                for gram in landGrams:
+                    self.landPostings.setdefault(gram, set()).add(entryId)
+        self.parks[parkConfig.url] = (parkConfig, snapshot, signature, entryIds)
+
+    def search(self, query: str, park_urls: set[str] = None, limit: int = 5) -> list[RideSearchResult]:
+        """
+        Returns up to limit rides best matching query, optionally only from the parks in park_urls.
+        Rides whose name contains the whole query rank first, then rides by the share of query trigrams they contain.
+        """
+        normalizedQuery = normalize(query)
+        queryGrams = trigrams(normalizedQuery)
+        if not queryGrams:
+            return []
+
+        scores: dict[int, float] = {}
+        for gram in queryGrams:
+            for entryId in self.namePostings.get(gram, ()):
+                scores[entryId] = scores.get(entryId, 0) + 1
+            for entryId in self.landPostings.get(gram, ()):
+                scores[entryId] = scores.get(entryId, 0) + LAND_WEIGHT
+
+        ranked = []
+        minHits = MIN_SCORE * len(queryGrams)
+        for entryId, hits in scores.items():
+            # Cheap cutoff before touching the entry, a name containing the query only misses its words' trailing trigrams
+            if hits < minHits:
+                continue
+            entry = self.entries[entryId]
+            if park_urls is not None and entry.parkUrl not in park_urls:
+                continue
+            score = hits / len(queryGrams)
+            if normalizedQuery in entry.normalizedName:
+                score += 1
+            ranked.append((-score, entry.rideName, entryId))
+        ranked.sort()
+
+        results = []
+        for negativeScore, _, entryId in ranked[:limit]:
+            entry = self.entries[entryId]
+            parkConfig, snapshot, _, _ = self.parks[entry.parkUrl]
+            results.append(RideSearchResult(
+                parkConfig,
+                entry.rideName,
+                entry.landName,
+                bool(snapshot.isOpen[entry.index]),
+                snapshot.waitTimes[entry.index],
+                -negativeScore
+            ))
+        return results
+
+    def reset(self, default_land_key: str):
+        """
+        Drops everything indexed, parks are indexed again as their next snapshots come in.
+        """
+        self.defaultLandKey = default_land_key
+        self.entries = {}
+        self.namePostings = {}
+        self.landPostings = {}
+        self.parks = {}
+
+    def _remove_entries(self, entryIds: list[int]):
+        for entryId in entryIds:
+            entry = self.entries.pop(entryId)
+            for postings, text in ((self.namePostings, entry.normalizedName), (self.landPostings, normalize(entry.landName))):
+                for gram in trigrams(text):
+                    ids = postings.get(gram)
+                    if ids is not None:
+                        ids.discard(entryId)
+                        if not ids:
+                            del postings[gram]
@@ -0,0 +1,76 @@
+import asyncio
+import discord
+import multiprocessing
+from dataclasses import dataclass
+from config import AppConfig
+from discord_client import DiscordClient
+
+
+@dataclass(frozen=True)
+class ShardAssignment:
+    """
+    The shards one worker process runs. Process 0 is the primary, which does the work that must only happen once
+    per machine (upstream polling, history).
+    """
+    processIndex: int
+    shardIds: tuple[int, ...]
+    shardCount: int
+
+    @property
+    def isPrimary(self) -> bool:
+        return self.processIndex == 0
+
+
+def assign_shards(shardCount: int, processes: int) -> list[ShardAssignment]:
+    """
+    Spreads shard ids round-robin over the processes, never starting more processes than there are shards.
+    """
+    processes = max(1, min(processes, shardCount))
+    return [
+        ShardAssignment(processIndex=index, shardIds=tuple(range(index, shardCount, processes)), shardCount=shardCount)
+        for index in range(processes)
+    ]
+
+
+async def fetch_recommended_shard_count(token: str) -> int:
+    """
+    Asks Discord how many shards the bot should run.
+    """
+    http = discord.http.HTTPClient(asyncio.get_running_loop())
+    try:
+        await http.static_login(token)
+        shardCount, _, _ = await http.get_bot_gateway()
+        return shardCount
+    finally:
+        await http.close()
+
+
+def run_shard_processes(config_path: str, appConfig: AppConfig):
+    """
+    Starts one worker process per shard assignment and waits for all of them to exit.
+    """
+    shardCount = appConfig.sharding_config.shard_count
+    if shardCount <= 0:
+        discordClient = DiscordClient(appConfig.discord_client_config)
+        discordClient.load_token()
+        shardCount = asyncio.run(fetch_recommended_shard_count(discordClient.token))
+
+    # Spawn rather than fork, so each worker builds its own event loop, sessions and SQLite connections
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    for assignment in assign_shards(shardCount, appConfig.sharding_config.processes):
+        worker = context.Process(target=_run_shard, args=(config_path, assignment), name=f"shards-{assignment.processIndex}")
+        worker.start()
+        workers.append(worker)
+        print(f"Started process {assignment.processIndex} for shards {list(assignment.shardIds)} of {shardCount}")
+
+    for worker in workers:
+        worker.join()
+        if worker.exitcode != 0:
+            print(f"Shard process {worker.name} exited with code {worker.exitcode}")
+
+
+def _run_shard(config_path: str, assignment: ShardAssignment):
+    # Imported here, main imports this module
+    from main import App
+    App(config_path).startup(assignment)
@@ -0,0 +1,98 @@
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any
+
+
+class SharedCacheStore:
+    """
+    SharedCacheStore lets several bot processes on one machine share upstream payloads through a local SQLite
+    database (WAL mode), so running more shard processes doesn't multiply queue-times and Open-Meteo traffic.
+    Values are pickled, the file is only ever read by processes running this same code.
+    Leases make sure only one process fetches a given key at a time, the others wait for its result.
+    Every call is a blocking SQLite query (waiting up to 5s on a locked database), async callers run them in a
+    worker thread. Calls are serialized by a lock, so one store can be used from several threads.
+    """
+    def __init__(self, database_path: str, lease_seconds: float = 15.0):
+        self.leaseSeconds: float = lease_seconds
+        # Identifies this store's leases, each process opens its own store
+        self.owner: str = uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(database_path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                expires_at REAL,
+                value BLOB NOT NULL,
+                PRIMARY KEY (namespace, key)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS leases (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            ) WITHOUT ROWID;
+        """)
+
+    def get(self, namespace: str, key: str, fetched_after: float = None) -> tuple[Any, float | None, float] | None:
+        """
+        Returns (value, seconds until it expires or None if it never does, fetched at) for a fresh entry, or None.
+        With fetched_after, entries fetched at or before that time are ignored.
+        """
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT fetched_at, expires_at, value FROM entries WHERE namespace = ? AND key = ?",
+                (namespace, key)
+            ).fetchone()
+        if row is None:
+            return None
+        fetchedAt, expiresAt, value = row
+        if expiresAt is not None and expiresAt <= now:
+            return None
+        if fetched_after is not None and fetchedAt <= fetched_after:
+            return None
+        return pickle.loads(value), (None if expiresAt is None else expiresAt - now), fetchedAt
+
+    def put(self, namespace: str, key: str, value: Any, ttl_seconds: float | None):
+        now = time.time()
+        expiresAt = None if ttl_seconds is None else now + ttl_seconds
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, now, expiresAt, blob)
+            )
+
+    def try_acquire_lease(self, namespace: str, key: str) -> bool:
+        """
+        Takes the fetch lease for a key, returns False if another process holds an unexpired one.
+        Leases expire after lease_seconds so a process that died mid-fetch doesn't block the key.
+        """
+        now = time.time()
+        with self.lock:
+            cursor = self.connection.execute(
+                "INSERT INTO leases VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (namespace, key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.expires_at <= ? OR leases.owner = excluded.owner",
+                (namespace, key, self.owner, now + self.leaseSeconds, now)
+            )
+            return cursor.rowcount > 0
+
+    def release_lease(self, namespace: str, key: str):
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM leases WHERE namespace = ? AND key = ? AND owner = ?",
+                (namespace, key, self.owner)
+            )
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,61 @@
+from dataclasses import dataclass
+from park_snapshot import ParkSnapshot
+
+# RideChange kinds
+OPENED = "opened"
+CLOSED = "closed"
+WAIT_UP = "wait_up"
+WAIT_DOWN = "wait_down"
+
+
+@dataclass(frozen=True)
+class RideChange:
+    """
+    A single ride's change between two snapshots. Waits are 0 for closed rides.
+    """
+    rideId: int
+    rideName: str
+    kind: str
+    oldWait: int
+    newWait: int
+
+
+@dataclass(frozen=True)
+class SnapshotDiff:
+    """
+    What changed in a park between two snapshots, in the order of the newer snapshot.
+    """
+    previousUpdate: int
+    latestUpdate: int
+    changes: tuple[RideChange, ...] = ()
+
+    def __len__(self) -> int:
+        return len(self.changes)
+
+
+def diff_snapshots(previous: ParkSnapshot, current: ParkSnapshot, waitThreshold: int) -> SnapshotDiff:
+    """
+    Merges two snapshots by ride id, in one pass over each, into the rides that opened, closed, or whose wait
+    moved by at least waitThreshold minutes. Rides that only appear in one of the snapshots are ignored.
+    """
+    # Snapshots are ordered by land rather than ride id, so join through an id -> index map instead of sorting
+    previousIndex = {rideId: index for index, rideId in enumerate(previous.rideIds)}
+    changes = []
+    for index, rideId in enumerate(current.rideIds):
+        oldIndex = previousIndex.get(rideId)
+        if oldIndex is None:
+            continue
+        wasOpen = previous.isOpen[oldIndex]
+        isOpen = current.isOpen[index]
+        oldWait = previous.waitTimes[oldIndex] if wasOpen else 0
+        newWait = current.waitTimes[index] if isOpen else 0
+        if isOpen and not wasOpen:
+            kind = OPENED
+        elif wasOpen and not isOpen:
+            kind = CLOSED
+        elif isOpen and abs(newWait - oldWait) >= waitThreshold:
+            kind = WAIT_UP if newWait > oldWait else WAIT_DOWN
+        else:
+            continue
+        changes.append(RideChange(rideId, current.rideNames[index], kind, oldWait, newWait))
+    return SnapshotDiff(previous.latestUpdate, current.latestUpdate, tuple(changes))
@@ -1,11 +1,38 @@
 import pytest
 from unittest.mock import patch, MagicMock
-from config import AppConfig, WeatherConfig, DiscordClientConfig, ParkClientConfig, CountryConfig, ParkConfig, WeatherState
-from park_data_client import ParkDataClient
-from weather_client import ParkWeatherClient
+from main import App
+from config import AppConfig, GroupCommandConfig, WeatherConfig, DiscordClientConfig, ParkClientConfig, CountryConfig, ParkConfig, WeatherState, PollerConfig, HistoryConfig, StatsConfig, ThrottleConfig, AlertConfig, ApiConfig
+from datetime import datetime
+from pytz import timezone
+from park_data_client import ParkDataClient, ParkDataResult
+from park_data_cache import ParkDataCache
+from shared_cache import SharedCacheStore
+from shard_launcher import assign_shards
+from park_poller import ParkDataPoller
+from park_snapshot import ParkSnapshot
+from snapshot_diff import CLOSED, OPENED, WAIT_DOWN, WAIT_UP, diff_snapshots
+from wait_history import WaitHistoryStore
+from wait_stats import WaitStatsTracker
+from ride_alerts import RideAlertStore
+from ride_search import RideSearchIndex
+from response_cache import ResponseCache
+from metrics import MetricsRegistry
+from command_throttle import CommandThrottle
+from circuit_breaker import CircuitOpenError
+from config_loader import ConfigLoader, ConfigWatcher
+from local_source import LocalDataSource, SnapshotArchive
+import json
+import os
+from weather_client import ParkForecast, ParkWeatherClient, summarize_forecasts
 from discord_client import DiscordClient
+from outbound_queue import BACKGROUND, INTERACTIVE, OutboundQueue, split_description
 import time
 import asyncio
+import numpy as np
+import discord
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from api_server import ApiServer
 
 
 def make_dummy_park_config():
@@ -46,42 +73,722 @@ def make_dummy_discord_config():
         embed_color="0x3498db"
     )
 
+def make_dummy_app_config(**overrides):
+    values = dict(
+        use_discord=False,
+        countries={"US": CountryConfig(name="United States", flag=":flag_us:")},
+        parks={"Test": make_dummy_park_config()},
+        commands={"!TestWaits": make_dummy_park_config()},
+        weather_config=make_dummy_weather_config(),
+        park_client_config=make_dummy_park_client_config(),
+        discord_client_config=make_dummy_discord_config(),
+        include_weather=False,
+        error_color="0xff0000",
+        wait_response_title_suffix="Wait Times",
+        wait_response_error_description="No wait time data available.",
+        help_response_title="Help",
+        help_command="!Help",
+        stale_data_message="Stale data",
+        all_closed_message="All closed",
+        current_weather_header="Weather",
+        weather_data_unavailable_message="No weather"
+    )
+    values.update(overrides)
+    return AppConfig(**values)
+
+def make_dummy_app(**overrides):
+    app = App()
+    app.config = make_dummy_app_config(**overrides)
+    app.parkDataClient = ParkDataClient(app.config.park_client_config)
+    app.responseCache = ResponseCache(app.config.response_cache_size)
+    app.responses = []
+
+    async def fake_do_response(title, description, message=None, color=None):
+        app.responses.append((title, description))
+
+    app.do_response = fake_do_response
+    return app
+
 def test_park_data_client_process_park_data_valid():
     client = ParkDataClient(make_dummy_park_client_config())
-    client.parkData = {"timezone": "UTC"}
-    client.queueTimesData = {
+    parkData = {"timezone": "UTC"}
+    queueTimesData = {
         "lands": [
             {"name": "Land1", "rides": [
                 {"name": "Ride1", "is_open": True, "wait_time": 10, "last_updated": "2024-01-01T12:00:00Z"}
             ]}
         ]
     }
-    client.process_park_data()
-    assert client.parkTz == "UTC"
-    assert any("Ride1" in line for line in client.messageLines)
-    assert not client.allClosed
+    result = client.process_park_data(make_dummy_park_config(), queueTimesData, parkData)
+    assert result.parkTz == "UTC"
+    assert any("Ride1" in line for line in result.messageLines)
+    assert not result.allClosed
 
 def test_park_data_client_process_park_data_missing_timezone():
     client = ParkDataClient(make_dummy_park_client_config())
-    client.parkData = {}
-    client.queueTimesData = {}
-    client.process_park_data()
-    assert client.parkTz == ""
+    result = client.process_park_data(make_dummy_park_config(), {}, {})
+    assert result.parkTz == ""
 
 def test_park_data_client_is_data_stale():
     client = ParkDataClient(make_dummy_park_client_config())
-    client.parkTz = "UTC"
-    client.latestUpdate = int(time.time()) - 4000
-    assert client.is_data_stale()
-    client.latestUpdate = int(time.time())
-    assert not client.is_data_stale()
+    result = ParkDataResult(parkConfig=make_dummy_park_config(), parkTz="UTC", latestUpdate=int(time.time()) - 4000)
+    assert client.is_data_stale(result)
+    result = ParkDataResult(parkConfig=make_dummy_park_config(), parkTz="UTC", latestUpdate=int(time.time()))
+    assert not client.is_data_stale(result)
+
+def test_park_data_result_hasData():
+    result = ParkDataResult(parkConfig=make_dummy_park_config())
+    assert not result.hasData
+    result = ParkDataResult(parkConfig=make_dummy_park_config(), messageLines=("something",))
+    assert result.hasData
+
+def test_park_data_client_concurrent_fetches_get_their_own_results(monkeypatch):
+    client = ParkDataClient(make_dummy_park_client_config())
+    parkA = make_dummy_park_config().model_copy(update={"url": "http://example.com/a/queue_times.json"})
+    parkB = make_dummy_park_config().model_copy(update={"url": "http://example.com/b/queue_times.json"})
+
+    async def fake_get_json(url):
+        name = "A" if "/a" in url else "B"
+        # Make park A finish last so the two requests overlap
+        await asyncio.sleep(0.02 if name == "A" else 0.01)
+        if "queue_times" not in url:
+            return {"timezone": "UTC" if name == "A" else "Asia/Tokyo"}
+        return {"lands": [], "rides": [{"name": f"Ride{name}", "is_open": True, "wait_time": 5}]}
+
+    async def run():
+        return await asyncio.gather(client.fetch_park_data(parkA), client.fetch_park_data(parkB))
+
+    monkeypatch.setattr(client, "_get_json", fake_get_json)
+    resultA, resultB = asyncio.run(run())
+    assert resultA.messageLines[0] == "RideA: **5 min**"
+    assert resultA.parkTz == "UTC"
+    assert resultB.messageLines[0] == "RideB: **5 min**"
+    assert resultB.parkTz == "Asia/Tokyo"
+
+def test_park_snapshot_parse_stores_rides_by_land():
+    queueTimesData = {
+        "lands": [
+            {"name": "Land1", "rides": [
+                {"id": 1, "name": "Ride1", "is_open": True, "wait_time": 10, "last_updated": "2024-01-01T12:00:00Z"},
+                {"id": 2, "name": "Ride1 Single Rider", "is_open": True, "wait_time": 5, "last_updated": "2024-01-01T13:00:00Z"}
+            ]},
+            {"name": "Land2", "rides": [
+                {"id": 3, "name": "Ride2", "is_open": False, "wait_time": 0, "last_updated": "2024-01-01T11:00:00Z"}
+            ]}
+        ]
+    }
+    snapshot = ParkSnapshot.parse(queueTimesData, "UTC", make_dummy_park_client_config())
+    assert len(snapshot) == 2
+    assert [(ride.landName, ride.id, ride.isOpen) for ride in snapshot.rides()] == [("Land1", 1, True), ("Land2", 3, False)]
+    # The skipped single rider line doesn't count towards the latest update
+    assert snapshot.latestUpdate == 1704110400
+    assert not snapshot.allClosed
+
+def test_diff_snapshots_reports_opened_closed_and_big_wait_moves():
+    def snapshot(rides, lastUpdated):
+        return ParkSnapshot.parse({"rides": [
+            {"id": rideId, "name": f"Ride{rideId}", "is_open": isOpen, "wait_time": wait, "last_updated": lastUpdated}
+            for rideId, isOpen, wait in rides
+        ]}, "UTC", make_dummy_park_client_config())
+
+    previous = snapshot([(1, False, 0), (2, True, 30), (3, True, 30), (4, True, 30), (5, True, 60), (6, True, 5)], "2024-01-01T12:00:00Z")
+    current = snapshot([(6, True, 5), (5, True, 20), (4, True, 35), (3, True, 45), (2, False, 0), (1, True, 10), (7, True, 5)], "2024-01-01T12:05:00Z")
+    diff = diff_snapshots(previous, current, waitThreshold=10)
+    assert [(change.rideId, change.kind, change.oldWait, change.newWait) for change in diff.changes] == [
+        (5, WAIT_DOWN, 60, 20), (3, WAIT_UP, 30, 45), (2, CLOSED, 30, 0), (1, OPENED, 0, 10)
+    ]
+    assert diff.previousUpdate == previous.latestUpdate
+
+def test_app_changes_command_lists_only_changed_rides():
+    app = make_dummy_app()
+    park = app.config.parks["Test"]
+    parkData = {"timezone": "UTC"}
+    rides = [{"id": rideId, "name": f"Ride{rideId}", "is_open": True, "wait_time": 20, "last_updated": "2024-01-01T12:00:00Z"} for rideId in range(40)]
+    app.parkDataClient.process_park_data(park, {"rides": rides}, parkData)
+    updated = [dict(ride) for ride in rides]
+    updated[3].update(wait_time=50, last_updated="2024-01-01T12:05:00Z")
+    updated[7].update(is_open=False, last_updated="2024-01-01T12:05:00Z")
+    queueTimes = {"rides": updated}
+    app.parkDataClient.process_park_data(park, queueTimes, parkData)
+
+    async def fake_get_json(url):
+        return queueTimes if "queue_times" in url else parkData
+
+    app.parkDataClient._get_json = fake_get_json
+    asyncio.run(app.do_changes("!TestChanges"))
+    title, description = app.responses[0]
+    assert title == "Test Park Changes"
+    assert description.split("\n")[:2] == ["⬆️ Ride3: 20 → **50 min**", "🔴 Ride7: closed"]
+    assert description.endswith("*Since 12:00 PM local time, data from queue-times.com*")
+
+def test_park_data_client_process_park_data_reuses_result_for_same_payload():
+    client = ParkDataClient(make_dummy_park_client_config())
+    park = make_dummy_park_config()
+    parkData = {"timezone": "UTC"}
+    queueTimesData = {"lands": [], "rides": [{"id": 1, "name": "Ride1", "is_open": False, "wait_time": 0}]}
+    first = client.process_park_data(park, queueTimesData, parkData)
+    assert client.process_park_data(park, queueTimesData, parkData) is first
+    assert client.process_park_data(park, dict(queueTimesData), parkData) is not first
+    assert first.messageLines == ("Ride1: Closed", "")
+
+def test_wait_history_store_dedupes_and_queries_by_range(tmp_path):
+    store = WaitHistoryStore(HistoryConfig(database_path=str(tmp_path / "history.sqlite")))
+    park = make_dummy_park_config()
+    config = make_dummy_park_client_config()
+
+    def snapshot(wait, lastUpdated):
+        ride = {"id": 1, "name": "Ride1", "is_open": True, "wait_time": wait, "last_updated": lastUpdated}
+        return ParkSnapshot.parse({"rides": [ride]}, "UTC", config)
+
+    assert store.append_snapshot(park, snapshot(10, "2024-01-01T12:00:00Z")) == 1
+    # Same last_updated means the reading hasn't changed
+    assert store.append_snapshot(park, snapshot(10, "2024-01-01T12:00:00Z")) == 0
+    assert store.append_snapshot(park, snapshot(25, "2024-01-01T12:05:00Z")) == 1
+    assert store.query_ride(park, 1, 1704110400, 1704110700) == [(1704110400, True, 10), (1704110700, True, 25)]
+    assert store.query_ride(park, 1, 1704110500, 1704110700) == [(1704110700, True, 25)]
+
+    # Everything is older than the raw retention window from here, so it gets rolled up into one hourly bucket
+    store.compact(now=1704110700 + 15 * 86400)
+    assert store.query_ride(park, 1, 0, 1704110700) == []
+    assert store.query_ride_hourly(park, 1, 0, 1704110700) == [(1704110400, 17.5, 25, 2, 2)]
+    store.close()
+
+def test_ride_alert_store_fires_matching_alerts_once(tmp_path):
+    store = RideAlertStore(AlertConfig(database_path=str(tmp_path / "alerts.sqlite")))
+    park = make_dummy_park_config()
+    short = store.add(1, 10, park, 7, "Ride7", 20)
+    long = store.add(2, 10, park, 7, "Ride7", 45)
+    store.add(3, 10, park, 8, "Ride8", 60)
+
+    def snapshot(isOpen, waitTime):
+        return ParkSnapshot.parse({"rides": [
+            {"id": 7, "name": "Ride7", "is_open": isOpen, "wait_time": waitTime},
+            {"id": 8, "name": "Ride8", "is_open": False, "wait_time": 0}
+        ]}, "UTC", make_dummy_park_client_config())
+
+    assert store.evaluate_snapshot(park, snapshot(False, 0)) == []
+    assert store.evaluate_snapshot(park, snapshot(True, 30)) == [(long, 30)]
+    assert store.evaluate_snapshot(park, snapshot(True, 30)) == []
+    assert store.evaluate_snapshot(park, snapshot(True, 15)) == [(short, 15)]
+    # Fired alerts are gone, also for other processes opening the database
+    assert [alert.rideId for alert in RideAlertStore(store.config).alerts_for_user(3)] == [8]
+    assert store.alerts_for_user(1) == []
+
+def test_app_alert_command_subscribes_to_matching_ride(tmp_path):
+    app = make_dummy_app()
+    app.alertStore = RideAlertStore(AlertConfig(database_path=str(tmp_path / "alerts.sqlite")))
+    parkData = {"timezone": "UTC"}
+    queueTimes = {"rides": [
+        {"id": 1, "name": "Space Mountain", "is_open": True, "wait_time": 60},
+        {"id": 2, "name": "Splash Mountain", "is_open": True, "wait_time": 10}
+    ]}
+
+    async def fake_get_json(url):
+        return queueTimes if "queue_times" in url else parkData
+
+    app.parkDataClient._get_json = fake_get_json
+    asyncio.run(app.do_alert_command("!TestAlert 30 mountain"))
+    assert "Which ride did you mean?" in app.responses[-1][1]
+    asyncio.run(app.do_alert_command("!TestAlert 30 splash"))
+    assert "open right now" in app.responses[-1][1]
+    asyncio.run(app.do_alert_command("!TestAlert 30 space"))
+    [alert] = app.alertStore.alerts_for_user(0)
+    assert (alert.rideId, alert.maxWait) == (1, 30)
+    asyncio.run(app.do_alert_command(f"!CancelAlert {alert.alertId}"))
+    assert app.alertStore.alerts_for_user(0) == []
+
+def test_wait_stats_tracker_rolling_stats_and_trend():
+    tracker = WaitStatsTracker(StatsConfig(window_snapshots=4, trend_seconds=3600))
+    park = make_dummy_park_config()
+    config = make_dummy_park_client_config()
+
+    def add(wait, minutes, rideBOpen=True):
+        rides = [
+            {"id": 1, "name": "RideA", "is_open": True, "wait_time": wait, "last_updated": f"2024-01-01T{10 + minutes // 60:02d}:{minutes % 60:02d}:00Z"},
+            {"id": 2, "name": "RideB", "is_open": rideBOpen, "wait_time": 5}
+        ]
+        tracker.add_snapshot(park, ParkSnapshot.parse({"rides": rides}, "UTC", config))
+
+    add(10, 0)
+    add(20, 30)
+    add(20, 30)  # Unchanged data isn't counted twice
+    add(30, 60)
+    add(40, 90)
+    add(60, 120, rideBOpen=False)  # Evicts the first snapshot
+    summary = tracker.get_summary(park)
+    assert summary.samples == 4
+    assert summary.rideNames == ("RideA", "RideB")
+    assert summary.current[0] == 60
+    assert summary.mean[0] == 37.5
+    assert summary.median[0] == 35
+    assert summary.trend[0] == 30
+    assert np.isnan(summary.current[1])
+    assert summary.mean[1] == 5
+    assert tracker.render_stats_lines(summary)[1] == "RideB: Closed • avg 5 • med 5 • p90 5"
+
+def test_local_data_source_reparses_only_when_file_changes(tmp_path):
+    (tmp_path / "queue_times").mkdir()
+    queueTimesPath = tmp_path / "queue_times" / "park.json"
+    queueTimesPath.write_text(json.dumps({"rides": [{"id": 1, "name": "Ride1", "is_open": True, "wait_time": 5}]}))
+    (tmp_path / "park.json").write_text(json.dumps({"timezone": "UTC"}))
+    source = LocalDataSource()
+    url = f"file://{queueTimesPath}"
+
+    first = source.read_queue_times(url)
+    assert source.read_queue_times(url) is first
+    assert source.read_park_info(url) == {"timezone": "UTC"}
+
+    queueTimesPath.write_text(json.dumps({"rides": [{"id": 1, "name": "Ride1", "is_open": True, "wait_time": 50}]}))
+    os.utime(queueTimesPath, ns=(time.time_ns(), time.time_ns() + 10**9))
+    assert source.read_queue_times(url)["rides"][0]["wait_time"] == 50
+
+    # Relative paths resolve against the base directory, not the working directory
+    relativeSource = LocalDataSource(base_directory=str(tmp_path))
+    assert relativeSource.read_queue_times("file://queue_times/park.json")["rides"][0]["wait_time"] == 50
+    assert relativeSource.read_park_info("file://queue_times/park.json") == {"timezone": "UTC"}
+
+def test_snapshot_archive_replays_faster_than_real_time(tmp_path, monkeypatch):
+    archivePath = str(tmp_path / "park.jsonl")
+    for minute in range(3):
+        SnapshotArchive.append(archivePath, {"rides": [{"id": 1, "name": "Ride1", "wait_time": minute}]}, {"timezone": "UTC"}, recordedAt=1000 + minute * 60)
+    clock = [0.0]
+    monkeypatch.setattr(time, "monotonic", lambda: clock[0])
+    source = LocalDataSource(replay_speed=100)
+    url = f"file://{archivePath}"
+
+    assert source.read_queue_times(url)["rides"][0]["wait_time"] == 0
+    clock[0] = 0.7  # 70 seconds of recording at 100x
+    assert source.read_queue_times(url)["rides"][0]["wait_time"] == 1
+    assert source.read_park_info(url) == {"timezone": "UTC"}
+    clock[0] = 100.0
+    assert source.read_queue_times(url)["rides"][0]["wait_time"] == 2
+    # Appends are picked up without reopening the archive
+    SnapshotArchive.append(archivePath, {"rides": [{"id": 1, "name": "Ride1", "wait_time": 99}]}, {"timezone": "UTC"}, recordedAt=1000 + 3 * 60)
+    assert source.read_queue_times(url)["rides"][0]["wait_time"] == 99
+    source.close()
+
+def test_park_data_client_fetch_park_data_fetches_concurrently(monkeypatch):
+    client = ParkDataClient(make_dummy_park_client_config())
+    inFlight = []
+    maxInFlight = []
 
-def test_park_data_client_hasData():
+    async def fake_get_json(url):
+        inFlight.append(url)
+        maxInFlight.append(len(inFlight))
+        await asyncio.sleep(0.01)
+        inFlight.remove(url)
+        return {"timezone": "UTC"} if "queue_times" not in url else {"lands": []}
+
+    monkeypatch.setattr(client, "_get_json", fake_get_json)
+    result = asyncio.run(client.fetch_park_data(make_dummy_park_config()))
+    assert max(maxInFlight) == 2
+    assert result.parkTz == "UTC"
+
+def test_park_data_client_fetch_park_data_coalesces_concurrent_requests(monkeypatch):
     client = ParkDataClient(make_dummy_park_client_config())
-    client.messageLines = []
-    assert not client.hasData
-    client.messageLines = ["something"]
-    assert client.hasData
+    calls = []
+
+    async def fake_get_json(url):
+        calls.append(url)
+        await asyncio.sleep(0.01)
+        return {"timezone": "UTC"} if "queue_times" not in url else {"lands": []}
+
+    async def burst():
+        await asyncio.gather(*[client.fetch_park_data(make_dummy_park_config()) for _ in range(50)])
+        # A later request inside the TTL is served from cache too
+        await client.fetch_park_data(make_dummy_park_config())
+
+    monkeypatch.setattr(client, "_get_json", fake_get_json)
+    asyncio.run(burst())
+    assert len(calls) == 2
+
+def test_park_data_client_serves_last_good_result_when_upstream_is_slow_or_down(monkeypatch):
+    client = ParkDataClient(make_dummy_park_client_config().model_copy(update={
+        "latency_budget_seconds": 0.05, "breaker_failure_threshold": 2, "queue_times_cache_ttl_seconds": 0
+    }))
+    park = make_dummy_park_config()
+    upstream = {"delay": 0.0, "fail": False, "wait": 10}
+    calls = []
+
+    async def fake_get_json(url):
+        if "queue_times" not in url:
+            return {"timezone": "UTC"}
+        calls.append(url)
+        await asyncio.sleep(upstream["delay"])
+        if upstream["fail"]:
+            raise RuntimeError("upstream down")
+        return {"rides": [{"id": 1, "name": "Ride1", "is_open": True, "wait_time": upstream["wait"], "last_updated": "2024-01-01T00:00:00Z"}]}
+
+    async def run():
+        first = await client.fetch_park_data(park)
+        assert not first.servedStale
+
+        # Too slow: answered within the budget from the last good result, the fetch finishes in the background
+        upstream.update(delay=0.2, wait=20)
+        slow = await asyncio.wait_for(client.fetch_park_data(park), 0.15)
+        assert slow.servedStale and slow.snapshot.waitTimes[0] == 10
+        assert len(client.backgroundTasks) == 1
+        await asyncio.sleep(0.25)
+        assert len(client.backgroundTasks) == 0
+        assert client.processedResults[park.url][2].snapshot.waitTimes[0] == 20
+
+        # Failing: the slow call and one error open the breaker, after which upstream isn't called at all
+        upstream.update(delay=0.0, fail=True)
+        failed = await client.fetch_park_data(park)
+        assert failed.servedStale and failed.snapshot.waitTimes[0] == 20
+        callsBefore = len(calls)
+        assert (await client.fetch_park_data(park)).servedStale
+        assert len(calls) == callsBefore
+        with pytest.raises(CircuitOpenError):
+            await client.refresh_park_data(park)
+
+    monkeypatch.setattr(client, "_get_json", fake_get_json)
+    asyncio.run(run())
+
+    # With nothing to fall back on, errors come back as an empty result instead of raising into the command
+    emptyClient = ParkDataClient(make_dummy_park_client_config())
+    upstream.update(fail=True)
+    monkeypatch.setattr(emptyClient, "_get_json", fake_get_json)
+    assert not asyncio.run(emptyClient.fetch_park_data(park)).hasData
+
+def test_park_data_client_skips_reprocessing_unchanged_upstream_responses():
+    queueTimes = {"rides": [{"id": 1, "name": "Ride1", "is_open": True, "wait_time": 10, "last_updated": "2024-01-01T00:00:00Z"}]}
+    requests = {"queue_times": [], "park_info": []}
+
+    async def handle_queue_times(request):
+        requests["queue_times"].append(dict(request.headers))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.json_response(queueTimes, headers={"ETag": '"v1"'})
+
+    async def handle_park_info(request):
+        # No validators, the same body comes back every time
+        requests["park_info"].append(dict(request.headers))
+        return web.json_response({"timezone": "UTC"})
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/parks/1/queue_times.json", handle_queue_times)
+        app.router.add_get("/parks/1.json", handle_park_info)
+        server = TestServer(app)
+        await server.start_server()
+        client = ParkDataClient(make_dummy_park_client_config())
+        park = make_dummy_park_config().model_copy(update={"url": str(server.make_url("/parks/1/queue_times.json"))})
+        try:
+            first = await client.refresh_park_data(park)
+            client.parkInfoCache.invalidate(park.url)
+            second = await client.refresh_park_data(park)
+        finally:
+            await client.close()
+            await server.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert len(requests["queue_times"]) == 2 and len(requests["park_info"]) == 2
+    assert "gzip" in requests["queue_times"][0]["Accept-Encoding"]
+    assert requests["queue_times"][1]["If-None-Match"] == '"v1"'
+    # Both documents were unchanged, so the first result is reused as is
+    assert second is first
+    assert first.snapshot.waitTimes[0] == 10
+
+def test_park_data_cache_expires_and_skips_failures():
+    cache = ParkDataCache()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return len(calls)
+
+    async def failing_fetch():
+        raise RuntimeError("upstream down")
+
+    async def run():
+        assert await cache.get_or_fetch("a", fetch, ttl_seconds=0) == 1
+        assert await cache.get_or_fetch("a", fetch, ttl_seconds=0) == 2
+        assert await cache.get_or_fetch("b", fetch) == 3
+        assert await cache.get_or_fetch("b", fetch) == 3
+        with pytest.raises(RuntimeError):
+            await cache.get_or_fetch("c", failing_fetch)
+        assert cache.get("c") is None
+
+    asyncio.run(run())
+
+def test_park_data_cache_shares_fetches_across_processes(tmp_path):
+    # Two stores on one file stand in for two shard processes
+    databasePath = str(tmp_path / "shared.sqlite")
+    first = ParkDataCache("queue_times", SharedCacheStore(databasePath))
+    second = ParkDataCache("queue_times", SharedCacheStore(databasePath))
+    fetches = []
+
+    async def fetch():
+        fetches.append(1)
+        await asyncio.sleep(0.2)
+        return {"rides": [1]}
+
+    async def run():
+        # The second process finds the first one's fetch in flight and waits for its result
+        results = await asyncio.gather(first.refresh("park", fetch, 60), second.refresh("park", fetch, 60))
+        return results, await ParkDataCache("queue_times", SharedCacheStore(databasePath)).get_or_fetch("park", fetch, 60)
+
+    (firstResult, secondResult), thirdResult = asyncio.run(run())
+    assert len(fetches) == 1
+    assert firstResult == secondResult == thirdResult == {"rides": [1]}
+
+    # When the lease holder's fetch fails, a waiting process takes the lease over right away
+    failing = ParkDataCache("queue_times", SharedCacheStore(databasePath))
+    waiting = ParkDataCache("queue_times", SharedCacheStore(databasePath))
+
+    async def failing_fetch():
+        await asyncio.sleep(0.05)
+        raise RuntimeError("upstream down")
+
+    async def run_failure():
+        failed = asyncio.ensure_future(failing.refresh("other", failing_fetch, 60))
+        await asyncio.sleep(0.01)
+        start = time.monotonic()
+        value = await waiting.refresh("other", fetch, 60)
+        with pytest.raises(RuntimeError):
+            await failed
+        return value, time.monotonic() - start
+
+    value, elapsed = asyncio.run(run_failure())
+    assert value == {"rides": [1]}
+    assert elapsed < 1
+
+def test_assign_shards_round_robin():
+    assignments = assign_shards(shardCount=5, processes=2)
+    assert [assignment.shardIds for assignment in assignments] == [(0, 2, 4), (1, 3)]
+    assert assignments[0].isPrimary and not assignments[1].isPrimary
+    assert len(assign_shards(shardCount=2, processes=4)) == 2
+
+def test_park_data_poller_backs_off_for_closed_parks():
+    config = PollerConfig(interval_seconds=60, jitter_seconds=0, closed_interval_seconds=1800, resume_local_hour=6)
+    poller = ParkDataPoller(config, ParkDataClient(make_dummy_park_client_config()), {})
+    midnight = timezone("UTC").localize(datetime(2024, 1, 1, 0, 0))
+    assert poller.next_delay(False, "UTC", midnight) == 60
+    assert poller.next_delay(True, "UTC", midnight) == 1800
+    # Don't sleep past the local resume hour
+    assert poller.next_delay(True, "UTC", midnight.replace(hour=5, minute=50)) == 600
+
+def test_park_data_poller_caps_concurrent_fetches():
+    parkClient = ParkDataClient(make_dummy_park_client_config())
+    parks = {f"P{i}": make_dummy_park_config().model_copy(update={"url": f"http://example.com/{i}/queue_times.json"}) for i in range(6)}
+    poller = ParkDataPoller(PollerConfig(max_concurrent_fetches=2), parkClient, parks)
+    inFlight = []
+    maxInFlight = []
+
+    async def fake_refresh(park, ttl_seconds=None):
+        inFlight.append(park.url)
+        maxInFlight.append(len(inFlight))
+        await asyncio.sleep(0.01)
+        inFlight.remove(park.url)
+        return ParkDataResult(parkConfig=park, parkTz="UTC")
+
+    async def run():
+        poller.fetchSemaphore = asyncio.Semaphore(poller.config.max_concurrent_fetches)
+        return await asyncio.gather(*[poller.poll_once(park) for park in poller.parks.values()])
+
+    parkClient.refresh_park_data = fake_refresh
+    delays = asyncio.run(run())
+    assert max(maxInFlight) == 2
+    assert len(delays) == 6
+
+def test_response_cache_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"
+    cache.put("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+    assert len(cache) == 2
+
+def test_app_group_waits_marks_slow_parks_as_partial():
+    fastPark = make_dummy_park_config().model_copy(update={"name": "Fast Park", "url": "http://example.com/fast/queue_times.json"})
+    slowPark = make_dummy_park_config().model_copy(update={"name": "Slow Park", "url": "http://example.com/slow/queue_times.json"})
+    app = make_dummy_app(
+        group_commands={"!GroupWaits": GroupCommandConfig(name="Group", parks=[fastPark, slowPark])},
+        group_deadline_seconds=0.05
+    )
+    now = datetime.now(timezone("UTC")).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    async def fake_get_json(url):
+        if "slow" in url:
+            await asyncio.sleep(1)
+        if "queue_times" not in url:
+            return {"timezone": "UTC"}
+        return {"rides": [
+            {"id": 1, "name": "Ride1", "is_open": True, "wait_time": 15, "last_updated": now},
+            {"id": 2, "name": "Ride2", "is_open": True, "wait_time": 45, "last_updated": now},
+            {"id": 3, "name": "Ride3", "is_open": False, "wait_time": 0, "last_updated": now}
+        ]}
+
+    app.parkDataClient._get_json = fake_get_json
+
+    async def run():
+        await app.do_group_waits("!GroupWaits")
+        # The slow park's fetch keeps running, held by the app
+        return len(app.backgroundTasks)
+
+    start = time.monotonic()
+    assert asyncio.run(run()) == 1
+    assert time.monotonic() - start < 0.5
+    title, description = app.responses[0]
+    assert title == "Group Wait Times"
+    assert "**Fast Park :flag_test:**\n2/3 open • longest: Ride2 (**45 min**)" in description
+    assert f"**Slow Park :flag_test:**\n*{app.config.group_partial_message}*" in description
+
+    emptyApp = make_dummy_app(group_commands={"!EmptyWaits": GroupCommandConfig(name="Empty", parks=[])})
+    asyncio.run(emptyApp.do_group_waits("!EmptyWaits"))
+    assert emptyApp.responses[0][0] == "Empty Wait Times"
+
+def test_command_throttle_limits_users_and_refills():
+    throttle = CommandThrottle(ThrottleConfig(user_burst=2, user_rate_per_minute=60, guild_burst=3, guild_rate_per_minute=60))
+    assert throttle.allow(1, 100, now=0)
+    assert throttle.allow(1, 100, now=0)
+    assert not throttle.allow(1, 100, now=0)
+    # Another user in the same guild still has tokens, then the guild runs out
+    assert throttle.allow(2, 100, now=0)
+    assert not throttle.allow(3, 100, now=0)
+    # Direct messages are only limited per user
+    assert throttle.allow(3, None, now=0)
+    # One token per second comes back
+    assert throttle.allow(1, 100, now=1)
+    assert not throttle.allow(1, 100, now=1)
+
+def test_app_on_message_answers_duplicate_commands_once():
+    app = make_dummy_app()
+    app.commandThrottle = CommandThrottle(ThrottleConfig())
+    app.discordClient = MagicMock()
+    handled = []
+
+    async def fake_do_help(message=None):
+        handled.append(message)
+
+    app.do_help = fake_do_help
+
+    def make_message(user_id):
+        message = MagicMock()
+        message.content = app.config.help_command
+        message.author.id = user_id
+        message.guild.id = 100
+        message.channel.id = 200
+        message.add_reaction = MagicMock(side_effect=lambda emoji: asyncio.sleep(0))
+        return message
+
+    first = make_message(1)
+    second = make_message(2)
+    asyncio.run(app.on_message(first))
+    asyncio.run(app.on_message(second))
+    assert handled == [first]
+    second.add_reaction.assert_called_once_with(app.config.throttle_config.duplicate_reaction)
+
+def test_config_loader_uses_compiled_cache_for_unchanged_yaml(tmp_path, monkeypatch):
+    configPath = tmp_path / "config.yaml"
+    with open("config.yaml", "r", encoding="utf-8") as f:
+        configPath.write_text(f.read(), encoding="utf-8")
+    parsed = ConfigLoader(str(configPath)).load()
+    assert os.path.exists(tmp_path / ".config.yaml.cache.json")
+
+    loader = ConfigLoader(str(configPath))
+    monkeypatch.setattr(loader, "parse_yaml", MagicMock(side_effect=AssertionError("YAML should not be parsed")))
+    compiled = loader.load()
+    assert compiled == parsed
+    assert compiled.weather_config.weather_states[0] == parsed.weather_config.weather_states[0]
+    # Parks shared through YAML anchors are still shared objects
+    assert compiled.commands["!EpcotWaits"] is compiled.parks["Epcot"]
+    assert loader.load_if_changed() is None
+
+def test_config_watcher_keeps_watching_after_a_failed_reload(tmp_path):
+    configPath = tmp_path / "config.yaml"
+    with open("config.yaml", "r", encoding="utf-8") as f:
+        original = f.read()
+    configPath.write_text(original, encoding="utf-8")
+    loader = ConfigLoader(str(configPath))
+    loader.load()
+    applied = []
+
+    async def on_reload(appConfig):
+        if not applied:
+            applied.append(None)
+            raise RuntimeError("bad cache_session_name")
+        applied.append(appConfig)
+
+    watcher = ConfigWatcher(loader, 0.01, on_reload)
+
+    async def run():
+        watcher.start()
+        configPath.write_text(original.replace("waits_command_suffix", "# edited\nwaits_command_suffix", 1) + "\n", encoding="utf-8")
+        await asyncio.sleep(0.1)
+        configPath.write_text(original + "\n\n", encoding="utf-8")
+        await asyncio.sleep(0.1)
+        alive = not watcher.task.done()
+        await watcher.stop()
+        return alive
+
+    assert asyncio.run(run())
+    assert len(applied) == 2 and applied[1] is not None
+
+def test_app_reload_config_keeps_results_for_unchanged_parks():
+    removedPark = make_dummy_park_config().model_copy(update={"name": "Removed Park", "url": "http://example.com/removed/queue_times.json"})
+    app = make_dummy_app(parks={"Test": make_dummy_park_config(), "Removed": removedPark})
+    app.weatherClient = ParkWeatherClient(make_dummy_weather_config())
+    park = app.config.parks["Test"]
+    parkData = {"timezone": "UTC"}
+    kept = app.parkDataClient.process_park_data(park, {"rides": []}, parkData)
+    app.parkDataClient.process_park_data(removedPark, {"rides": []}, parkData)
+
+    asyncio.run(app.reload_config(make_dummy_app_config(all_closed_message="Everything is closed")))
+    assert app.config.all_closed_message == "Everything is closed"
+    assert app.config.parks["Test"] is park
+    assert app.parkDataClient.process_park_data(app.config.parks["Test"], app.parkDataClient.processedResults[park.url][0], parkData) is kept
+    assert removedPark.url not in app.parkDataClient.processedResults
+
+def test_process_park_data_reuses_results_for_rebuilt_park_configs():
+    client = ParkDataClient(make_dummy_park_client_config())
+    park = make_dummy_park_config()
+    queueTimesData, parkData = {"rides": []}, {"timezone": "UTC"}
+    result = client.process_park_data(park, queueTimesData, parkData)
+
+    rebuilt = park.model_copy()
+    reused = client.process_park_data(rebuilt, queueTimesData, parkData)
+    assert reused.dataVersion == result.dataVersion
+    assert reused.parkConfig is rebuilt
+
+def test_discord_close_closes_the_park_data_session():
+    app = make_dummy_app()
+    closed = []
+
+    async def client_close():
+        closed.append("discord")
+
+    app.discordClient = DiscordClient(make_dummy_discord_config())
+    app.discordClient.client = MagicMock(close=client_close)
+    app.discordClient.add_close_hook(app.shutdown)
+
+    async def run():
+        app.parkDataClient._get_session()
+        session = app.parkDataClient.session
+        await app.discordClient.client.close()
+        return session
+
+    session = asyncio.run(run())
+    assert closed == ["discord"]
+    assert session.closed and app.parkDataClient.session is None
+
+def test_metrics_registry_renders_prometheus_text():
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    registry.observe("stage_seconds", 0.05, stage="render", park="Epcot")
+    registry.observe("stage_seconds", 0.5, stage="render", park="Epcot")
+    registry.inc("cache_requests_total", cache="queue_times", result="hit")
+    registry.inc("cache_requests_total", cache="queue_times", result="hit")
+    text = registry.render_prometheus()
+    assert 'themepark_cache_requests_total{cache="queue_times",result="hit"} 2' in text
+    assert 'themepark_stage_seconds_bucket{park="Epcot",stage="render",le="0.1"} 1' in text
+    assert 'themepark_stage_seconds_bucket{park="Epcot",stage="render",le="1.0"} 2' in text
+    assert 'themepark_stage_seconds_bucket{park="Epcot",stage="render",le="+Inf"} 2' in text
+    assert 'themepark_stage_seconds_count{park="Epcot",stage="render"} 2' in text
 
 def test_weather_client_current_temperature_and_unit():
     config = make_dummy_weather_config()
@@ -102,10 +809,130 @@ def test_weather_client_fetch_weather_sets_emoji_and_success(monkeypatch):
     assert client.last_fetch_successful
     assert client.last_emoji == "☀️"
 
+def test_weather_client_batch_dedupes_coordinates_into_one_request(monkeypatch):
+    client = ParkWeatherClient(make_dummy_weather_config())
+    parks = [make_dummy_park_config().model_copy(update={"lat": lat, "lon": lon}) for lat, lon in [(1.0, 2.0), (1.0, 2.0), (3.0, 4.0)]]
+    client.set_batch_parks(parks)
+    calls = []
+
+    def fake_weather_api(url, params):
+        calls.append(params)
+        responses = []
+        for lat in params["latitude"]:
+            response = MagicMock()
+            response.Current().Variables.side_effect = lambda idx, lat=lat: MagicMock(Value=lambda: [lat * 10, 0][idx])
+            responses.append(response)
+        return responses
+
+    async def run():
+        return await asyncio.gather(*[client.get_park_weather(park) for park in parks])
+
+    monkeypatch.setattr(client.openmeteo_client, "weather_api", fake_weather_api)
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert sorted(calls[0]["latitude"]) == [1.0, 3.0]
+    assert [weather.temperature for weather in results] == [10.0, 10.0, 30.0]
+    assert results[2].emoji == "☀️"
+
+def test_bench_weather_stub_round_trips_through_weather_client():
+    from bench import encode_weather_response
+    from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
+    data = encode_weather_response([72.5, 0.0])
+    response = WeatherApiResponse.GetRootAs(data, 4)
+    weather = ParkWeatherClient(make_dummy_weather_config())._parse_response(response)
+    assert weather.temperature == 72.5
+    assert weather.emoji == "☀️"
+
+def test_weather_client_forecast_batch_summarizes_rain_per_park(monkeypatch):
+    from bench import encode_weather_response
+    from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
+    client = ParkWeatherClient(make_dummy_weather_config())
+    start = 1704110400
+    hourly = {
+        (1.0, 2.0): [[70.0, 75.0, 80.0, 72.0], [10.0, 20.0, 60.0, 90.0]],
+        (3.0, 4.0): [[60.0, 61.0, 62.0, 63.0], [0.0, 5.0, 10.0, 0.0]]
+    }
+    parks = [make_dummy_park_config().model_copy(update={"lat": lat, "lon": lon}) for lat, lon in hourly]
+    client.set_batch_parks(parks)
+    calls = []
+
+    def fake_weather_api(url, params):
+        calls.append(params)
+        responses = []
+        for lat, lon in zip(params["latitude"], params["longitude"]):
+            data = encode_weather_response([0.0], hourly[(lat, lon)], start)
+            responses.append(WeatherApiResponse.GetRootAs(data, 4))
+        return responses
+
+    async def run():
+        return await asyncio.gather(*[client.get_park_forecast(park) for park in parks])
+
+    monkeypatch.setattr(client.openmeteo_client, "weather_api", fake_weather_api)
+    rainy, dry = asyncio.run(run())
+    assert len(calls) == 1
+    assert rainy.times.tolist() == [start, start + 3600, start + 7200, start + 10800]
+    assert rainy.rainLikelyAt == start + 7200
+    assert (rainy.low, rainy.high, rainy.maxRainChance) == (70.0, 80.0, 90.0)
+    assert dry.rainLikelyAt is None
+    assert dry.maxRainChance == 10.0
+    # An empty hourly block summarizes to nothing instead of raising
+    empty = ParkForecast(times=np.array([], dtype=np.int64), values={"temperature_2m": np.array([]), "precipitation_probability": np.array([])})
+    assert summarize_forecasts([empty, rainy], 50)[0].rainLikelyAt is None
+
+    app = make_dummy_app(commands={"!TestWaits": parks[1]})
+    app.weatherClient = client
+    asyncio.run(app.do_forecast("!TestForecast"))
+    assert app.responses == [(
+        "Test Park Forecast",
+        "\n".join([
+            "No rain expected in the next 4 hours (up to 10%)",
+            "🌡️ 60F to 63F",
+            "",
+            "12:00 PM: 60F • 0% rain",
+            "1:00 PM: 61F • 5% rain",
+            "2:00 PM: 62F • 10% rain",
+            "3:00 PM: 63F • 0% rain",
+            "\n*Forecast from open-meteo.com*"
+        ])
+    )]
+
 def test_discord_client_get_embed_color():
     config = make_dummy_discord_config()
     assert config.get_embed_color() == int("0x3498db", 16)
 
+def test_split_description_breaks_between_lines():
+    description = "\n".join(f"Ride {i}: {i} min" for i in range(400))
+    chunks = split_description(description, limit=500)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 500 for chunk in chunks)
+    assert "\n".join(chunks) == description
+    assert split_description("x" * 1200, limit=500) == ["x" * 500, "x" * 500, "x" * 200]
+
+def test_outbound_queue_sends_interactive_before_queued_background():
+    queue = OutboundQueue(make_dummy_discord_config().model_copy(update={"channel_burst": 1, "channel_rate_per_second": 50.0}))
+    sent = []
+    channel = MagicMock()
+    channel.id = 1
+
+    async def fake_send(embed):
+        sent.append(embed.title)
+
+    channel.send = fake_send
+
+    async def run():
+        background = [asyncio.ensure_future(queue.send(channel, [discord.Embed(title=f"bg{i}")], BACKGROUND)) for i in range(3)]
+        await asyncio.sleep(0.005)
+        await queue.send(channel, [discord.Embed(title="reply")], INTERACTIVE)
+        await asyncio.gather(*background)
+        await queue.close()
+
+    asyncio.run(run())
+    # bg0 was already sent when the reply was queued, the reply then jumps the rest
+    assert sent == ["bg0", "reply", "bg1", "bg2"]
+
+def test_app_config_error_color():
+    assert make_dummy_app_config().get_error_color() == 0xff0000
+
 def test_app_config_parsing():
     # Minimal config for parsing
     app_config = AppConfig(
@@ -128,4 +955,97 @@ def test_app_config_parsing():
         weather_data_unavailable_message="No weather"
     )
     assert app_config.use_discord is False
-    assert app_config.weather_config.url.startswith("http")
\ No newline at end of file
+    assert app_config.weather_config.url.startswith("http")
+
+def test_api_server_serves_cached_park_json_with_validators(monkeypatch):
+    app = make_dummy_app()
+    upstreamCalls = []
+
+    async def fake_get_json(url):
+        upstreamCalls.append(url)
+        if "queue_times" not in url:
+            return {"timezone": "UTC"}
+        return {"lands": [{"name": "Land1", "rides": [{"id": 1, "name": "Ride1", "is_open": True, "wait_time": 25, "last_updated": "2024-01-01T00:00:00Z"}]}]}
+
+    monkeypatch.setattr(app.parkDataClient, "_get_json", fake_get_json)
+    server = ApiServer(ApiConfig(enabled=True), app)
+
+    async def run():
+        async with TestClient(TestServer(server.build_app())) as client:
+            first = await client.get("/parks/Test")
+            document = await first.json()
+            etag = first.headers["ETag"]
+            for _ in range(20):
+                assert (await client.get("/parks/Test")).headers["ETag"] == etag
+            notModified = await client.get("/parks/Test", headers={"If-None-Match": etag})
+            sinceModified = await client.get("/parks/Test", headers={"If-Modified-Since": first.headers["Last-Modified"]})
+            allParks = await (await client.get("/parks")).json()
+            missing = await client.get("/parks/Nope")
+            return first.status, document, notModified.status, sinceModified.status, allParks, missing.status
+
+    status, document, notModifiedStatus, sinceModifiedStatus, allParks, missingStatus = asyncio.run(run())
+    assert status == 200
+    assert document["park"] == "Test" and document["timezone"] == "UTC"
+    assert document["lands"][0]["rides"][0] == {"id": 1, "name": "Ride1", "isOpen": True, "waitMinutes": 25, "lastUpdated": 1704067200}
+    assert notModifiedStatus == 304 and sinceModifiedStatus == 304
+    assert [park["park"] for park in allParks["parks"]] == ["Test"]
+    assert missingStatus == 404
+    # Every request after the first was answered from memory
+    assert len(upstreamCalls) == 2
+
+def test_ride_search_finds_rides_across_parks_and_reindexes_only_on_ride_set_changes(monkeypatch):
+    epcot = make_dummy_park_config().model_copy(update={"name": "Epcot", "url": "https://queue-times.com/parks/5/queue_times.json"})
+    tokyo = make_dummy_park_config().model_copy(update={"name": "Tokyo DisneySea", "url": "https://queue-times.com/parks/275/queue_times.json"})
+    app = make_dummy_app(parks={"Epcot": epcot, "TokyoDisneySea": tokyo})
+    app.rideSearch = RideSearchIndex(app.config.park_client_config.default_land_key)
+    app.parkDataClient.add_snapshot_listener(app.rideSearch.add_snapshot)
+    waits = {"Test Track": 45}
+
+    def make_ride(rideId, name, wait):
+        return {"id": rideId, "name": name, "is_open": wait is not None, "wait_time": wait or 0, "last_updated": "2024-01-01T00:00:00Z"}
+
+    async def fake_get_json(url):
+        if "queue_times" not in url:
+            return {"timezone": "UTC"}
+        if "/5/" in url:
+            return {"lands": [{"name": "World Discovery", "rides": [
+                make_ride(1, "Test Track", waits["Test Track"]),
+                make_ride(2, "Test Track Single Rider", 5),
+                make_ride(3, "Guardians of the Galaxy: Cosmic Rewind", 90)
+            ]}, {"name": "World Nature", "rides": [make_ride(4, "Remy's Ratatouille Adventure", None)]}]}
+        return {"rides": [make_ride(5, "Rémy's Ratatouille Adventure", 30)]}
+
+    monkeypatch.setattr(app.parkDataClient, "_get_json", fake_get_json)
+    asyncio.run(app.do_ride_search("!Ride test trak"))
+    title, description = app.responses[-1]
+    # Misspelled query still finds the ride, the single rider line was filtered out by parsing
+    assert description.startswith("Test Track: **45 min**\n*Epcot :flag_test: • World Discovery*")
+    assert "Single Rider" not in description
+
+    asyncio.run(app.do_ride_search("!Ride remy"))
+    description = app.responses[-1][1]
+    assert "Rémy's Ratatouille Adventure: **30 min**\n*Tokyo DisneySea :flag_test:*" in description
+    assert "Remy's Ratatouille Adventure: Closed" in description
+
+    # A wait change doesn't re-index, the index just serves the newer snapshot
+    entryIds = dict(app.rideSearch.entries)
+    waits["Test Track"] = 20
+    app.parkDataClient.queueTimesCache.invalidate(epcot.url)
+    asyncio.run(app.do_ride_search("!Ride test track"))
+    assert app.responses[-1][1].startswith("Test Track: **20 min**")
+    assert app.rideSearch.entries == entryIds
+
+    asyncio.run(app.do_ride_search("!Ride xyzzy"))
+    assert app.responses[-1][1] == app.config.no_ride_match_message
+
+    # Nothing searchable answers straight away, without fetching any park
+    searchApp = make_dummy_app()
+    searchApp.rideSearch = RideSearchIndex(searchApp.config.park_client_config.default_land_key)
+
+    async def unexpected_fetch(park):
+        raise AssertionError("fetched a park for an empty query")
+
+    monkeypatch.setattr(searchApp.parkDataClient, "fetch_park_data", unexpected_fetch)
+    for content in ("!Ride", "!Ride ?"):
+        asyncio.run(searchApp.do_ride_search(content))
+        assert searchApp.responses[-1][1] == searchApp.config.no_ride_match_message
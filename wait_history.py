@@ -0,0 +1,149 @@
+import sqlite3
+import threading
+import time
+from config import HistoryConfig, ParkConfig
+from park_snapshot import ParkSnapshot
+
+
+class WaitHistoryStore:
+    """
+    WaitHistoryStore appends parsed queue times snapshots to a local SQLite database (WAL mode).
+    Readings are keyed by (park url, ride id, last_updated), so a ride that hasn't been updated since the last
+    snapshot isn't stored again. Old readings are downsampled into hourly buckets and eventually dropped.
+    """
+    def __init__(self, history_config: HistoryConfig):
+        self.config: HistoryConfig = history_config
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.config.database_path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+        # (park, ride id) -> last_updated of the last stored reading, lets unchanged rides skip the database entirely
+        self.lastStored: dict[tuple[str, int], int] = {}
+        self.lastCompaction: float = time.time()
+
+    def _create_schema(self):
+        # WITHOUT ROWID tables are clustered on the primary key, so range queries for one ride are a single index scan
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS readings (
+                park TEXT NOT NULL,
+                ride_id INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                is_open INTEGER NOT NULL,
+                wait_time INTEGER NOT NULL,
+                PRIMARY KEY (park, ride_id, ts)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS readings_hourly (
+                park TEXT NOT NULL,
+                ride_id INTEGER NOT NULL,
+                hour_ts INTEGER NOT NULL,
+                avg_wait REAL NOT NULL,
+                max_wait INTEGER NOT NULL,
+                open_samples INTEGER NOT NULL,
+                samples INTEGER NOT NULL,
+                PRIMARY KEY (park, ride_id, hour_ts)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS rides (
+                park TEXT NOT NULL,
+                ride_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                PRIMARY KEY (park, ride_id)
+            ) WITHOUT ROWID;
+        """)
+
+    def append_snapshot(self, parkConfig: ParkConfig, snapshot: ParkSnapshot) -> int:
+        """
+        Stores every ride reading in the snapshot that changed since the last one stored, returns how many were written.
+        Rides without a last_updated timestamp can't be deduplicated and are skipped.
+        """
+        park = parkConfig.url
+        readings = []
+        names = []
+        for index in range(len(snapshot)):
+            rideId = snapshot.rideIds[index]
+            lastUpdated = snapshot.lastUpdated[index]
+            if lastUpdated == 0 or self.lastStored.get((park, rideId)) == lastUpdated:
+                continue
+            if (park, rideId) not in self.lastStored:
+                names.append((park, rideId, snapshot.rideNames[index]))
+            readings.append((park, rideId, lastUpdated, snapshot.isOpen[index], snapshot.waitTimes[index]))
+
+        if len(readings) > 0:
+            with self.lock:
+                self.connection.execute("BEGIN")
+                try:
+                    self.connection.executemany("INSERT OR REPLACE INTO rides VALUES (?, ?, ?)", names)
+                    self.connection.executemany("INSERT OR IGNORE INTO readings VALUES (?, ?, ?, ?, ?)", readings)
+                    self.connection.execute("COMMIT")
+                except Exception:
+                    self.connection.execute("ROLLBACK")
+                    raise
+            for reading in readings:
+                self.lastStored[(reading[0], reading[1])] = reading[2]
+
+        if time.time() - self.lastCompaction >= self.config.compact_interval_seconds:
+            self.compact()
+        return len(readings)
+
+    def query_ride(self, parkConfig: ParkConfig, rideId: int, startTs: int, endTs: int = None) -> list[tuple[int, bool, int]]:
+        """
+        Returns the raw (timestamp, is open, wait time) readings for a ride between startTs and endTs (epoch seconds, inclusive).
+        """
+        if endTs is None:
+            endTs = int(time.time())
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT ts, is_open, wait_time FROM readings WHERE park = ? AND ride_id = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+                (parkConfig.url, rideId, startTs, endTs)
+            ).fetchall()
+        return [(ts, bool(isOpen), waitTime) for ts, isOpen, waitTime in rows]
+
+    def query_ride_hourly(self, parkConfig: ParkConfig, rideId: int, startTs: int, endTs: int = None) -> list[tuple[int, float, int, int, int]]:
+        """
+        Returns downsampled (hour timestamp, average wait, max wait, open samples, samples) rows for a ride.
+        Only readings older than raw_retention_days are in here.
+        """
+        if endTs is None:
+            endTs = int(time.time())
+        with self.lock:
+            return self.connection.execute(
+                "SELECT hour_ts, avg_wait, max_wait, open_samples, samples FROM readings_hourly "
+                "WHERE park = ? AND ride_id = ? AND hour_ts BETWEEN ? AND ? ORDER BY hour_ts",
+                (parkConfig.url, rideId, startTs, endTs)
+            ).fetchall()
+
+    def compact(self, now: int = None):
+        """
+        Rolls raw readings older than raw_retention_days up into hourly buckets, and drops hourly buckets older
+        than hourly_retention_days.
+        """
+        if now is None:
+            now = int(time.time())
+        # Align to the hour so a bucket is always rolled up in one go
+        rawCutoff = ((now - self.config.raw_retention_days * 86400) // 3600) * 3600
+        hourlyCutoff = now - self.config.hourly_retention_days * 86400
+        with self.lock:
+            self.connection.execute("BEGIN")
+            try:
+                # Wait averages only count open readings, closed rides report a wait of 0
+                self.connection.execute("""
+                    INSERT OR REPLACE INTO readings_hourly
+                    SELECT park, ride_id, (ts / 3600) * 3600 AS hour_ts,
+                        COALESCE(AVG(CASE WHEN is_open THEN wait_time END), 0),
+                        MAX(CASE WHEN is_open THEN wait_time ELSE 0 END),
+                        SUM(is_open),
+                        COUNT(*)
+                    FROM readings WHERE ts < ?
+                    GROUP BY park, ride_id, hour_ts
+                """, (rawCutoff,))
+                self.connection.execute("DELETE FROM readings WHERE ts < ?", (rawCutoff,))
+                self.connection.execute("DELETE FROM readings_hourly WHERE hour_ts < ?", (hourlyCutoff,))
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+        self.lastCompaction = time.time()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,170 @@
+import warnings
+from dataclasses import dataclass
+import numpy as np
+from config import ParkConfig, StatsConfig
+from park_snapshot import ParkSnapshot
+
+
+@dataclass(frozen=True)
+class ParkStatsSummary:
+    """
+    Per ride wait statistics for a park, arrays are in the same order as the latest snapshot's rides.
+    Waits of closed rides, and stats with no open readings, are NaN.
+    """
+    rideNames: tuple[str, ...]
+    current: np.ndarray
+    mean: np.ndarray
+    median: np.ndarray
+    p90: np.ndarray
+    trend: np.ndarray
+    samples: int
+
+
+class ParkWaitHistory:
+    """
+    Ring buffer of the last window_snapshots snapshots of a park, one row per snapshot and one column per ride.
+    Running sums keep the rolling mean incremental, the rest of the stats are computed vectorized on the first read
+    after a snapshot and reused until the next one, so snapshots nobody asks about cost no percentile pass.
+    """
+    def __init__(self, config: StatsConfig):
+        self.config: StatsConfig = config
+        self.waits: np.ndarray = np.full((config.window_snapshots, 0), np.nan, dtype=np.float32)
+        self.timestamps: np.ndarray = np.zeros(config.window_snapshots, dtype=np.int64)
+        self.head: int = 0
+        self.count: int = 0
+        self.waitSums: np.ndarray = np.zeros(0, dtype=np.float64)
+        self.waitCounts: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.columns: dict[int, int] = {}
+        self.lastRideIds: bytes = b""
+        self.lastColumns: np.ndarray = np.zeros(0, dtype=np.intp)
+        self.summary: ParkStatsSummary = None
+        # (snapshot, columns, row, timestamp) of the latest snapshot, summarized on the next read
+        self.latest: tuple[ParkSnapshot, np.ndarray, np.ndarray, int] = None
+
+    def add_snapshot(self, snapshot: ParkSnapshot):
+        """
+        Pushes a snapshot into the buffer, evicting the oldest one when full. Snapshots that aren't newer than the
+        last one pushed (e.g. a re-fetch of unchanged data) are ignored.
+        """
+        timestamp = snapshot.latestUpdate
+        if self.count > 0 and timestamp <= self.timestamps[(self.head - 1) % len(self.timestamps)]:
+            return
+
+        columns = self._columns_for(snapshot)
+        row = np.full(self.waits.shape[1], np.nan, dtype=np.float32)
+        isOpen = np.frombuffer(snapshot.isOpen, dtype=np.int8).astype(bool)
+        waitTimes = np.frombuffer(snapshot.waitTimes, dtype=np.int32)
+        row[columns[isOpen]] = waitTimes[isOpen]
+
+        if self.count == len(self.timestamps):
+            self._remove_row(self.waits[self.head])
+        else:
+            self.count += 1
+        self.waits[self.head] = row
+        self.timestamps[self.head] = timestamp
+        self._add_row(row)
+        self.head = (self.head + 1) % len(self.timestamps)
+
+        self.latest = (snapshot, columns, row, timestamp)
+        self.summary = None
+
+    def get_summary(self) -> ParkStatsSummary | None:
+        if self.summary is None and self.latest is not None:
+            self.summary = self._summarize(*self.latest)
+        return self.summary
+
+    def _columns_for(self, snapshot: ParkSnapshot) -> np.ndarray:
+        # The ride set rarely changes, so reuse the id -> column mapping when the ride ids are identical
+        rideIds = snapshot.rideIds.tobytes()
+        if rideIds == self.lastRideIds:
+            return self.lastColumns
+
+        newRides = [rideId for rideId in dict.fromkeys(snapshot.rideIds) if rideId not in self.columns]
+        if len(newRides) > 0:
+            for rideId in newRides:
+                self.columns[rideId] = len(self.columns)
+            self.waits = np.pad(self.waits, ((0, 0), (0, len(newRides))), constant_values=np.nan)
+            self.waitSums = np.pad(self.waitSums, (0, len(newRides)))
+            self.waitCounts = np.pad(self.waitCounts, (0, len(newRides)))
+
+        self.lastRideIds = rideIds
+        self.lastColumns = np.fromiter((self.columns[rideId] for rideId in snapshot.rideIds), dtype=np.intp, count=len(snapshot))
+        return self.lastColumns
+
+    def _add_row(self, row: np.ndarray):
+        valid = ~np.isnan(row)
+        self.waitSums[valid] += row[valid]
+        self.waitCounts += valid
+
+    def _remove_row(self, row: np.ndarray):
+        valid = ~np.isnan(row)
+        self.waitSums[valid] -= row[valid]
+        self.waitCounts -= valid
+
+    def _summarize(self, snapshot: ParkSnapshot, columns: np.ndarray, row: np.ndarray, timestamp: int) -> ParkStatsSummary:
+        validRows = self.waits if self.count == len(self.timestamps) else self.waits[:self.count]
+        validTimestamps = self.timestamps[:len(validRows)]
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self.waitSums / self.waitCounts
+        with warnings.catch_warnings():
+            # Rides that were closed for the whole window are all-NaN columns
+            warnings.simplefilter("ignore", RuntimeWarning)
+            median, p90 = np.nanpercentile(validRows[:, columns], [50, 90], axis=0)
+
+        # Compare against the newest snapshot that is at least trend_seconds old
+        trend = np.full(len(columns), np.nan, dtype=np.float32)
+        older = validTimestamps <= timestamp - self.config.trend_seconds
+        if older.any():
+            previousRow = validRows[np.argmax(np.where(older, validTimestamps, -1))]
+            trend = row[columns] - previousRow[columns]
+
+        return ParkStatsSummary(
+            rideNames=snapshot.rideNames,
+            current=row[columns],
+            mean=mean[columns],
+            median=median,
+            p90=p90,
+            trend=trend,
+            samples=self.count
+        )
+
+
+class WaitStatsTracker:
+    """
+    WaitStatsTracker keeps a ParkWaitHistory per park, fed by ParkDataClient's snapshot listener.
+    """
+    def __init__(self, stats_config: StatsConfig):
+        self.config: StatsConfig = stats_config
+        self.parks: dict[str, ParkWaitHistory] = {}
+
+    def add_snapshot(self, parkConfig: ParkConfig, snapshot: ParkSnapshot):
+        history = self.parks.get(parkConfig.url)
+        if history is None:
+            history = self.parks[parkConfig.url] = ParkWaitHistory(self.config)
+        history.add_snapshot(snapshot)
+
+    def get_summary(self, parkConfig: ParkConfig) -> ParkStatsSummary | None:
+        """
+        Returns the latest stats summary for a park, or None if no snapshots have been seen for it yet.
+        """
+        history = self.parks.get(parkConfig.url)
+        return history.get_summary() if history is not None else None
+
+    def render_stats_lines(self, summary: ParkStatsSummary) -> list[str]:
+        """
+        Renders a summary into one line per ride, e.g. "Ride: **25 min** • avg 22 • med 20 • p90 35 • ▲5".
+        """
+        messageLines = []
+        for index, rideName in enumerate(summary.rideNames):
+            if np.isnan(summary.current[index]):
+                line = f"{rideName}: Closed"
+            else:
+                line = f"{rideName}: **{summary.current[index]:.0f} min**"
+            if not np.isnan(summary.mean[index]):
+                line += f" • avg {summary.mean[index]:.0f} • med {summary.median[index]:.0f} • p90 {summary.p90[index]:.0f}"
+            trend = summary.trend[index]
+            if not np.isnan(trend):
+                line += f" • {'▲' if trend > 0 else '▼' if trend < 0 else '='}{abs(trend):.0f}"
+            messageLines.append(line)
+        return messageLines
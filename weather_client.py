@@ -1,9 +1,81 @@
-from config import WeatherConfig
+from dataclasses import dataclass, replace
+from typing import Iterable
+from config import ParkConfig, WeatherConfig
+from metrics import metrics
+from park_data_cache import ParkDataCache
+from shared_cache import SharedCacheStore
+import asyncio
+import itertools
+import time
+import numpy as np
 import openmeteo_requests
 import requests_cache
 from retry_requests import retry
 
 
+@dataclass(frozen=True)
+class ParkWeather:
+    """
+    Current weather at a single coordinate, as returned by the batch weather API.
+    """
+    data: dict[str, float]
+    emoji: str
+    # Shared by every park from the same batch fetch, increases with each fetch
+    version: int = 0
+
+    @property
+    def temperature(self) -> float:
+        """Returns the current temperature in the configured unit."""
+        return round(self.data.get("temperature_2m", 0), 1)
+
+
+@dataclass(frozen=True)
+class ParkForecast:
+    """
+    Hourly forecast at a single coordinate. times are the UTC epoch seconds each hour starts at, values are the
+    requested hourly variables (NumPy arrays over the response buffer, not copies).
+    """
+    times: np.ndarray
+    values: dict[str, np.ndarray]
+    utcOffsetSeconds: int = 0
+    # Start of the first hour with a precipitation probability of at least rain_likely_percent, or None
+    rainLikelyAt: int | None = None
+    maxRainChance: float = 0.0
+    high: float = float("nan")
+    low: float = float("nan")
+
+
+def summarize_forecasts(forecasts: list[ParkForecast], rain_likely_percent: float) -> list[ParkForecast]:
+    """
+    Fills in the rain and temperature summaries for many forecasts at once, every park's hours are stacked into one
+    matrix so the summaries are a handful of vectorized operations no matter how many parks there are.
+    """
+    if len(forecasts) == 0:
+        return []
+    hours = min(len(forecast.times) for forecast in forecasts)
+    summarized = [dict() for _ in forecasts]
+
+    if all("precipitation_probability" in forecast.values for forecast in forecasts) and hours > 0:
+        rainChance = np.stack([forecast.values["precipitation_probability"][:hours] for forecast in forecasts])
+        likely = rainChance >= rain_likely_percent
+        firstLikely = likely.argmax(axis=1)
+        anyLikely = likely.any(axis=1)
+        maxRainChance = rainChance.max(axis=1, initial=0)
+        for index, forecast in enumerate(forecasts):
+            summarized[index]["maxRainChance"] = float(maxRainChance[index])
+            if anyLikely[index]:
+                summarized[index]["rainLikelyAt"] = int(forecast.times[firstLikely[index]])
+
+    if all("temperature_2m" in forecast.values for forecast in forecasts) and hours > 0:
+        temperatures = np.stack([forecast.values["temperature_2m"][:hours] for forecast in forecasts])
+        highs = temperatures.max(axis=1)
+        lows = temperatures.min(axis=1)
+        for index in range(len(forecasts)):
+            summarized[index]["high"] = float(highs[index])
+            summarized[index]["low"] = float(lows[index])
+
+    return [replace(forecast, **summary) for forecast, summary in zip(forecasts, summarized)]
+
 
 class ParkWeatherClient:
     """
@@ -11,7 +83,7 @@ class ParkWeatherClient:
     Exactly what is fetched is configurable in weather_config section of the config.
     """
 
-    def __init__(self, weather_config: WeatherConfig):
+    def __init__(self, weather_config: WeatherConfig, shared_cache: SharedCacheStore = None):
         self.config: WeatherConfig = weather_config
         self.last_fetch_successful: bool = False
         self.last_fetched_data: dict = {}
@@ -19,22 +91,140 @@ class ParkWeatherClient:
         cache_session = requests_cache.CachedSession(self.config.cache_session_name, expire_after=self.config.cache_session_expire)
         retry_session = retry(cache_session, retries=self.config.retry_count, backoff_factor=self.config.retry_backoff_factor)
         self.openmeteo_client = openmeteo_requests.Client(session=retry_session)
+        # Coordinates fetched by the batch API, usually every configured park
+        self.batchCoordinates: set[tuple[float, float]] = set()
+        # Names the coordinate set, so processes sharing a cache with different parks never mix up batches
+        self.batchKey: str = self._batch_key(self.batchCoordinates)
+        self.sharedCache: SharedCacheStore = shared_cache
+        self.batchCache: ParkDataCache = ParkDataCache("weather", shared_cache)
+        self.forecastCache: ParkDataCache = ParkDataCache("forecast", shared_cache)
+        self.batchVersions = itertools.count(1)
 
-    async def fetch_weather(self, latitude: float, longitude: float):
+    def set_batch_parks(self, parks: Iterable[ParkConfig]):
         """
-        Fetch weather data for the given latitude and longitude.
-        Also parses the weather code from the response and updates the last_emoji.
+        Sets the parks the batch weather API fetches for. Parks that share coordinates only cost one lookup.
+        """
+        coordinates = {(park.lat, park.lon) for park in parks}
+        if coordinates != self.batchCoordinates:
+            # Keep the cached batch when the parks are unchanged, e.g. on a config reload
+            self.batchCoordinates = coordinates
+            self.batchKey = self._batch_key(coordinates)
+            self.batchCache = ParkDataCache("weather", self.sharedCache)
+            self.forecastCache = ParkDataCache("forecast", self.sharedCache)
+
+    async def get_park_weather(self, park: ParkConfig) -> ParkWeather | None:
+        """
+        Returns the current weather for a park from the shared batch result, fetching weather for every batch park
+        in a single request when the result is older than batch_refresh_seconds. Returns None if the fetch failed.
+        """
+        coordinate = (park.lat, park.lon)
+        if coordinate not in self.batchCoordinates:
+            self.batchCoordinates.add(coordinate)
+            self.batchKey = self._batch_key(self.batchCoordinates)
+        try:
+            weatherByCoordinate = await self.batchCache.get_or_fetch(
+                self.batchKey,
+                lambda: self.fetch_weather_batch(self.batchCoordinates),
+                self.config.batch_refresh_seconds
+            )
+        except Exception as e:
+            print(f"Error getting batch weather data: {e}")
+            metrics.inc("upstream_errors_total", upstream="open_meteo", park=park.name)
+            return None
+        return weatherByCoordinate.get(coordinate, None)
+
+    async def get_park_forecast(self, park: ParkConfig) -> ParkForecast | None:
+        """
+        Returns the hourly forecast for a park. Forecasts for every batch park are fetched in a single request and
+        kept until the next model run (every forecast_model_update_seconds), they can't change before then.
+        Returns None if the fetch failed.
+        """
+        coordinate = (park.lat, park.lon)
+        if coordinate not in self.batchCoordinates:
+            self.batchCoordinates.add(coordinate)
+            self.batchKey = self._batch_key(self.batchCoordinates)
+        now = time.time()
+        untilNextRun = self.config.forecast_model_update_seconds - now % self.config.forecast_model_update_seconds
+        try:
+            forecastByCoordinate = await self.forecastCache.get_or_fetch(
+                self.batchKey,
+                lambda: self.fetch_forecast_batch(self.batchCoordinates),
+                untilNextRun
+            )
+        except Exception as e:
+            print(f"Error getting forecast data: {e}")
+            metrics.inc("upstream_errors_total", upstream="open_meteo_forecast", park=park.name)
+            return None
+        return forecastByCoordinate.get(coordinate, None)
+
+    async def fetch_forecast_batch(self, coordinates: Iterable[tuple[float, float]]) -> dict[tuple[float, float], ParkForecast]:
+        """
+        Fetch the hourly forecast for the next forecast_hours for all of the given coordinates in one Open-Meteo request.
         """
+        uniqueCoordinates = list(dict.fromkeys(coordinates))
+        if len(uniqueCoordinates) == 0:
+            return {}
+
         params = {
-            "latitude": latitude,
-            "longitude": longitude,
-            "current": self.config.current_weather_query_params,
-            "wind_speed_unit": self.config.wind_speed_unit,
+            "latitude": [lat for lat, _ in uniqueCoordinates],
+            "longitude": [lon for _, lon in uniqueCoordinates],
+            "hourly": self.config.hourly_forecast_query_params,
+            "forecast_hours": self.config.forecast_hours,
+            "timezone": "auto",
             "temperature_unit": self.config.temperature_unit,
             "precipitation_unit": self.config.precipitation_unit,
         }
+        with metrics.timer("open_meteo_fetch", park="forecast"):
+            responses = await asyncio.to_thread(self.openmeteo_client.weather_api, self.config.url, params=params)
+        if responses is None or len(responses) != len(uniqueCoordinates):
+            raise ValueError("Error getting forecast data, response is malformed")
+
+        forecasts = summarize_forecasts([self._parse_forecast(response) for response in responses], self.config.rain_likely_percent)
+        return dict(zip(uniqueCoordinates, forecasts))
 
-        responses = self.openmeteo_client.weather_api(self.config.url, params=params)
+    def _parse_forecast(self, response) -> ParkForecast:
+        hourly = response.Hourly()
+        times = np.arange(hourly.Time(), hourly.TimeEnd(), hourly.Interval(), dtype=np.int64)
+        # ValuesAsNumpy wraps the flatbuffer's float32 vector in place, nothing is converted element by element
+        values = {
+            variableName: hourly.Variables(idx).ValuesAsNumpy()
+            for idx, variableName in enumerate(self.config.hourly_forecast_query_params)
+        }
+        return ParkForecast(times=times, values=values, utcOffsetSeconds=response.UtcOffsetSeconds())
+
+    def _batch_key(self, coordinates: Iterable[tuple[float, float]]) -> str:
+        return "batch:" + ";".join(f"{lat},{lon}" for lat, lon in sorted(coordinates))
+
+    async def fetch_weather_batch(self, coordinates: Iterable[tuple[float, float]]) -> dict[tuple[float, float], ParkWeather]:
+        """
+        Fetch current weather for all of the given (latitude, longitude) coordinates in one Open-Meteo request.
+        Duplicate coordinates are only requested once. The blocking SDK call runs in a worker thread.
+        """
+        uniqueCoordinates = list(dict.fromkeys(coordinates))
+        if len(uniqueCoordinates) == 0:
+            return {}
+
+        params = self._build_params(
+            [lat for lat, _ in uniqueCoordinates],
+            [lon for _, lon in uniqueCoordinates]
+        )
+        with metrics.timer("open_meteo_fetch", park="batch"):
+            responses = await asyncio.to_thread(self.openmeteo_client.weather_api, self.config.url, params=params)
+        if responses is None or len(responses) != len(uniqueCoordinates):
+            raise ValueError("Error getting batch weather data, response is malformed")
+
+        # Responses come back in the same order as the requested coordinates
+        version = next(self.batchVersions)
+        return {coordinate: self._parse_response(response, version) for coordinate, response in zip(uniqueCoordinates, responses)}
+
+    async def fetch_weather(self, latitude: float, longitude: float):
+        """
+        Fetch weather data for the given latitude and longitude.
+        Also parses the weather code from the response and updates the last_emoji.
+        The blocking SDK call runs in a worker thread, like the batch fetch.
+        """
+        params = self._build_params(latitude, longitude)
+        responses = await asyncio.to_thread(self.openmeteo_client.weather_api, self.config.url, params=params)
         if responses is None or len(responses) == 0:
             print("Error getting weather data, response is malformed")
             self.last_fetch_successful = False
@@ -45,16 +235,9 @@ class ParkWeatherClient:
         #print(f"Elevation: {response.Elevation()} m asl")
         #print(f"Timezone difference to GMT+0: {response.UtcOffsetSeconds()}s")
 
-        for idx, variableName in enumerate(self.config.current_weather_query_params):
-            self.last_fetched_data[variableName] = response.Current().Variables(idx).Value()
-
-        # Parse the weather code and get its corresponding emoji
-        weatherCode = self.last_fetched_data.get("weather_code", None)
-        if weatherCode is not None and weatherCode in self.config.weather_states:
-            self.last_emoji = self.config.weather_states[weatherCode].emoji
-        else:
-            self.last_emoji = self.config.unknown_emoji
-
+        weather = self._parse_response(response)
+        self.last_fetched_data.update(weather.data)
+        self.last_emoji = weather.emoji
         self.last_fetch_successful = True
 
     @property
@@ -66,3 +249,29 @@ class ParkWeatherClient:
     def current_temperature_unit(self) -> str:
         """Returns the unit of the current temperature."""
         return self.config.temperature_unit[0].upper() if self.config.temperature_unit else self.config.unknown_emoji
+
+    def _build_params(self, latitude: float | list[float], longitude: float | list[float]) -> dict:
+        return {
+            "latitude": latitude,
+            "longitude": longitude,
+            "current": self.config.current_weather_query_params,
+            "wind_speed_unit": self.config.wind_speed_unit,
+            "temperature_unit": self.config.temperature_unit,
+            "precipitation_unit": self.config.precipitation_unit,
+        }
+
+    def _parse_response(self, response, version: int = 0) -> ParkWeather:
+        """
+        Pulls the configured current variables out of a single location's response and looks up the weather code emoji.
+        """
+        data = {}
+        for idx, variableName in enumerate(self.config.current_weather_query_params):
+            data[variableName] = response.Current().Variables(idx).Value()
+
+        # Parse the weather code and get its corresponding emoji
+        weatherCode = data.get("weather_code", None)
+        if weatherCode is not None and weatherCode in self.config.weather_states:
+            emoji = self.config.weather_states[weatherCode].emoji
+        else:
+            emoji = self.config.unknown_emoji
+        return ParkWeather(data=data, emoji=emoji, version=version)